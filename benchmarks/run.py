@@ -0,0 +1,167 @@
+"""Benchmark lazo commands against the local Rancher stub server.
+
+For each command and collection size it reports wall time, number of
+requests served by the stub and peak Python memory (tracemalloc, measured
+in a separate run so it does not inflate timings). With `--codecs` each
+scenario is repeated with the given JSON backends (see `lazo.codec`).
+
+    $ PYTHONPATH=src python benchmarks/run.py --sizes 10 100 --latency 0.002
+    $ PYTHONPATH=src python benchmarks/run.py --scenarios inventory --codecs json orjson
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from click.testing import CliRunner
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from stub import StubServer  # noqa: E402
+
+from lazo import codec  # noqa: E402
+from lazo.__cli__ import cli  # noqa: E402
+
+
+def _workloads(size):
+    return [arg for i in range(size) for arg in ("-w", f"ns:w{i}")]
+
+
+# name -> callable(size, run) returning the command arguments
+SCENARIOS = {
+    "info": lambda size, run: ["info", "-c", "local", "-p", "local:p-0"],
+    "upgrade": lambda size, run: [
+        "upgrade",
+        "-p",
+        "local:p-0",
+        "-i",
+        f"account/image:2.{run}",
+        "--no-check-image",
+        *_workloads(size),
+    ],
+    "set": lambda size, run: [
+        "set",
+        "-p",
+        "local:p-0",
+        "-e",
+        "VAR_0",
+        f"run-{run}",
+        *_workloads(size),
+    ],
+    "env": lambda size, run: ["env", "-p", "local:p-0", *_workloads(size)],
+    "shell": lambda size, run: [
+        "shell",
+        "-p",
+        "local:p-0",
+        "ns:w0",
+        "--",
+        "cat",
+        "dump",
+    ],
+    "inventory": lambda size, run: ["inventory"],
+}
+
+
+def invoke(server, args):
+    runner = CliRunner()
+    base = ["-b", f"{server.url}/v3", "--auth", "key:secret"]
+    return runner.invoke(cli, base + args, env={"RANCHER_CLUSTER": "local"})
+
+
+def measure(server, scenario, size, run, json_codec):
+    codec.use(json_codec)
+    server.reset_stats()
+    start = time.perf_counter()
+    result = invoke(server, SCENARIOS[scenario](size, run))
+    wall = time.perf_counter() - start
+    requests = server.stats["requests"]
+
+    tracemalloc.start()
+    invoke(server, SCENARIOS[scenario](size, run + 1))
+    __, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "scenario": scenario,
+        "codec": json_codec,
+        "size": size,
+        "wall": wall,
+        "requests": requests,
+        "peak_memory": peak,
+        "error": None
+        if result.exit_code == 0
+        else repr(result.exception or result.output[-200:]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="seconds added by the stub to each request",
+    )
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument(
+        "--projects", type=int, default=1, help="projects served by the stub"
+    )
+    parser.add_argument(
+        "--codecs",
+        nargs="+",
+        choices=codec.available(),
+        default=[codec.get_codec().name],
+        help="JSON backends to compare (default: the fastest installed)",
+    )
+    parser.add_argument(
+        "--json", dest="json_file", help="also write results to this file"
+    )
+    args = parser.parse_args()
+
+    results = []
+    warmup = StubServer(workloads=1).start()
+    invoke(warmup, ["ping"])  # load commands and client modules
+    warmup.stop()
+
+    print(
+        f"{'scenario':<10} {'codec':<8} {'size':>6} {'wall (ms)':>12} "
+        f"{'requests':>9} {'peak (MiB)':>11}"
+    )
+    for size in args.sizes:
+        server = StubServer(
+            workloads=size,
+            projects=args.projects,
+            page_size=args.page_size,
+            latency=args.latency,
+        ).start()
+        try:
+            runs = [(s, c) for s in args.scenarios for c in args.codecs]
+            for run, (scenario, json_codec) in enumerate(runs):
+                r = measure(server, scenario, size, run * 2, json_codec)
+                results.append(r)
+                line = (
+                    f"{scenario:<10} {json_codec:<8} {size:>6} "
+                    f"{r['wall'] * 1000:>12.1f} "
+                    f"{r['requests']:>9} {r['peak_memory'] / 2 ** 20:>11.2f}"
+                )
+                if r["error"]:
+                    line += f"  FAILED: {r['error']}"
+                print(line, flush=True)
+        finally:
+            server.stop()
+
+    if args.json_file:
+        with open(args.json_file, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
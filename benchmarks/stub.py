@@ -0,0 +1,314 @@
+"""Local stand-in for the Rancher v3 API, used by the benchmarks.
+
+It serves a single cluster (`local`) with `projects` projects, each one with
+`workloads` deployments (and two pods per deployment), paginated collections,
+workload updates (GETs are served with an ETag and honour If-None-Match), the
+Kubernetes watch API and the exec websocket.
+
+    $ python benchmarks/stub.py --workloads 1000 --latency 0.005
+"""
+import argparse
+import base64
+import hashlib
+import json
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+ENV_TYPE = "/v3/project/schemas/envVar"
+
+
+def make_workload(project, index, env_size=20):
+    name = f"w{index}"
+    return {
+        "id": f"deployment:ns:{name}",
+        "name": name,
+        "type": "workload",
+        "baseType": "workload",
+        "namespaceId": "ns",
+        "projectId": project,
+        "state": "active",
+        "transitioning": "no",
+        "scale": 2,
+        "containers": [
+            {
+                "name": name,
+                "image": "account/image:1.0",
+                "imagePullPolicy": "Always",
+                "env": [
+                    {"name": f"VAR_{i}", "type": ENV_TYPE, "value": f"value-{i}" * 4}
+                    for i in range(env_size)
+                ],
+                "ports": [{"containerPort": 8000, "protocol": "TCP"}],
+                "resources": {"limits": {"cpu": "1", "memory": "1Gi"}},
+            }
+        ],
+        "deploymentStatus": {
+            "replicas": 2,
+            "updatedReplicas": 2,
+            "availableReplicas": 2,
+            "observedGeneration": 1,
+        },
+        "publicEndpoints": [
+            {"ingressId": f"ns:{name}", "hostname": f"{name}.example.com"}
+        ],
+        "labels": {"workload.user.cattle.io/workloadselector": f"deployment-ns-{name}"},
+        "annotations": {"description": "x" * 512},
+    }
+
+
+def make_pods(project, workload):
+    return [
+        {
+            "id": f"ns:{workload['name']}-5d8f-{i}",
+            "name": f"{workload['name']}-5d8f-{i}",
+            "type": "pod",
+            "projectId": project,
+            "namespaceId": "ns",
+            "workloadId": workload["id"],
+            "state": "running",
+            "containers": [
+                {"name": workload["name"], "restartCount": i, "state": "running"}
+            ],
+        }
+        for i in range(2)
+    ]
+
+
+class Data:
+    def __init__(self, workloads=100, projects=1, page_size=100):
+        self.page_size = page_size
+        self.clusters = [{"id": "local", "name": "local", "type": "cluster"}]
+        self.projects = [
+            {"id": f"local:p-{i}", "name": f"project-{i}", "type": "project"}
+            for i in range(projects)
+        ]
+        self.workloads = {}
+        self.pods = {}
+        for project in self.projects:
+            items = [make_workload(project["id"], i) for i in range(workloads)]
+            self.workloads[project["id"]] = {w["id"]: w for w in items}
+            self.pods[project["id"]] = [
+                p for w in items for p in make_pods(project["id"], w)
+            ]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # buffer headers and body in a single write (avoids Nagle/delayed ACK stalls)
+    wbufsize = -1
+
+    @property
+    def data(self):
+        return self.server.data
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode()
+        if self.command == "GET" and status == 200:
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()
+            headers = dict(headers or {}, ETag=etag)
+            if self.headers.get("If-None-Match") == etag:
+                status, body = 304, b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _collection(self, items, path, query):
+        for key, values in query.items():
+            if key not in ("limit", "marker", "sort", "order"):
+                items = [i for i in items if str(i.get(key)) == values[0]]
+        if "sort" in query:
+            items = sorted(items, key=lambda i: i.get(query["sort"][0]))
+        limit = int(query.get("limit", [self.data.page_size])[0])
+        if limit < 0:
+            limit = len(items)
+        start = int(query.get("marker", [0])[0])
+        end = start + limit
+        page = items[start:end]
+        pagination = {"limit": limit, "total": len(items)}
+        if end < len(items):
+            next_query = {k: v[0] for k, v in query.items()}
+            next_query.update(limit=limit, marker=end)
+            pagination["next"] = f"{self.server.url}{path}?{urlencode(next_query)}"
+        return {"type": "collection", "data": page, "pagination": pagination}
+
+    def _count(self):
+        with self.server.lock:
+            self.server.stats["requests"] += 1
+            self.server.stats[self.command] = self.server.stats.get(self.command, 0) + 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def _route(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+        if parts[0] == "k8s":
+            return self._k8s(parts, query)
+        if parts[:1] != ["v3"]:
+            return self._send({"code": "NotFound"}, 404)
+        parts = parts[1:]
+        if not parts:
+            return self._send({"apiVersion": {"version": "v3", "path": "/v3"}})
+        if parts == ["settings"]:
+            return self._send(
+                self._collection(
+                    [{"id": "server-version", "value": "v2.7"}], url.path, query
+                )
+            )
+        if parts == ["clusters"]:
+            return self._send(self._collection(self.data.clusters, url.path, query))
+        if len(parts) == 3 and parts[0] == "clusters" and parts[2] == "projects":
+            return self._send(self._collection(self.data.projects, url.path, query))
+        if len(parts) >= 3 and parts[0] in ("project", "projects"):
+            return self._project(parts[1], parts[2:], url.path, query)
+        return self._send({"code": "NotFound"}, 404)
+
+    def _project(self, project, parts, path, query):
+        if project not in self.data.workloads:
+            return self._send({"code": "NotFound"}, 404)
+        workloads = self.data.workloads[project]
+        if parts == ["workloads"]:
+            return self._send(self._collection(list(workloads.values()), path, query))
+        if parts == ["pods"]:
+            return self._send(self._collection(self.data.pods[project], path, query))
+        if len(parts) == 2 and parts[0] == "workloads" and parts[1] in workloads:
+            if self.command == "PUT":
+                length = int(self.headers.get("Content-Length", 0))
+                workloads[parts[1]] = json.loads(self.rfile.read(length))
+            return self._send(workloads[parts[1]])
+        return self._send({"code": "NotFound"}, 404)
+
+    def _k8s(self, parts, query):
+        if parts[-1] == "exec":
+            return self._exec(query)
+        if query.get("watch"):
+            name = query["fieldSelector"][0].split("=")[1]
+            event = {
+                "type": "ADDED",
+                "object": {
+                    "kind": "Deployment",
+                    "metadata": {"name": name, "generation": 1},
+                    "spec": {"replicas": 2},
+                    "status": {
+                        "observedGeneration": 1,
+                        "replicas": 2,
+                        "updatedReplicas": 2,
+                        "availableReplicas": 2,
+                    },
+                },
+            }
+            body = (json.dumps(event) + "\n").encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        return self._send({"code": "NotFound"}, 404)
+
+    def _ws_frame(self, payload, opcode=0x2):
+        header = bytes([0x80 | opcode])
+        size = len(payload)
+        if size < 126:
+            header += bytes([size])
+        elif size < 65536:
+            header += bytes([126]) + struct.pack("!H", size)
+        else:
+            header += bytes([127]) + struct.pack("!Q", size)
+        self.wfile.write(header + payload)
+
+    def _exec(self, query):
+        key = self.headers["Sec-WebSocket-Key"]
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest())
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept.decode())
+        self.send_header("Sec-WebSocket-Protocol", "v4.channel.k8s.io")
+        self.end_headers()
+        line = b"x" * 79 + b"\n"
+        chunk = line * (self.server.exec_output // len(line) // 64 or 1)
+        for __ in range(64):
+            self._ws_frame(b"\x01" + chunk)
+        self._ws_frame(b'\x03{"metadata":{},"status":"Success"}')
+        self._ws_frame(struct.pack("!H", 1000), opcode=0x8)
+        self.wfile.flush()
+        self.connection.settimeout(1)
+        try:
+            self.rfile.read(8)  # client close frame
+        except OSError:
+            pass
+        self.close_connection = True
+
+    def handle_request(self):
+        self._count()
+        self._route()
+
+    do_GET = do_PUT = do_POST = do_DELETE = handle_request
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        workloads=100,
+        projects=1,
+        page_size=100,
+        latency=0.0,
+        exec_output=1 << 20,
+        port=0,
+    ):
+        super().__init__(("127.0.0.1", port), Handler)
+        self.data = Data(workloads, projects, page_size)
+        self.latency = latency
+        self.exec_output = exec_output
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0}
+        self.url = f"http://127.0.0.1:{self.server_port}"
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {"requests": 0}
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workloads", type=int, default=100)
+    parser.add_argument("--projects", type=int, default=1)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds added to each request"
+    )
+    args = parser.parse_args()
+    server = StubServer(
+        args.workloads, args.projects, args.page_size, args.latency, port=args.port
+    )
+    print(f"Serving {server.url}/v3")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
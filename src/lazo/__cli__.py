@@ -1,4 +1,3 @@
 #!/usr/bin/env python
 
 from .cli import cli
-from .rancher import *
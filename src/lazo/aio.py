@@ -0,0 +1,370 @@
+"""asyncio client for the Rancher API.
+
+Requires `aiohttp`, install it with `pip install lazo[async]`.
+"""
+import asyncio
+import contextlib
+import time
+from base64 import b64encode
+from urllib.parse import urlparse
+
+from .clients import ExecStream, RancherMixin, process_response
+from .codec import dumps, loads
+from .exceptions import (
+    CircuitOpen,
+    HttpError,
+    LazoError,
+    ServerConnectionError,
+    ServerSSLError,
+)
+from .history import History
+from .objects import Entry
+from .retry import CircuitBreaker, RetryPolicy
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+class AsyncResponse:
+    """Fully read aiohttp response, compatible with what `HttpError` expects."""
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf8")
+
+    def json(self):
+        return loads(self.content)
+
+
+class AsyncHttpClient:
+    def __init__(
+        self,
+        base_url,
+        *,
+        verify=True,
+        debug=True,
+        auth=None,
+        pool_size=100,
+        keep_alive=True,
+        history_size=100,
+        keep_body=False,
+        retries=3,
+        circuit_breaker=True,
+        limiter=None,
+        **kwargs,
+    ):
+        if aiohttp is None:
+            raise LazoError(
+                "AsyncRancherClient requires 'aiohttp'. "
+                "Install it with `pip install lazo[async]`"
+            )
+        o = urlparse(base_url)
+        self.scheme = o.scheme or "http"
+        self.port = o.port or {"http": 80, "https": 443}[self.scheme]
+        self.host = o.hostname
+        self.path = o.path
+
+        self.base_url = base_url
+        self.verify = verify
+        self.debug = debug
+        self.history = History(history_size, keep_body=keep_body)
+        self.auth = auth
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        if not isinstance(retries, RetryPolicy):
+            retries = RetryPolicy(retries)
+        self.retry = retries
+        self.breaker = CircuitBreaker() if circuit_breaker is True else circuit_breaker
+        self.limiter = limiter
+        self._session = None
+
+    @property
+    def session(self):
+        # aiohttp sessions must be created inside the running loop
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                ssl=bool(self.verify),
+                force_close=not self.keep_alive,
+            )
+            auth = None
+            if self.auth is not None:
+                auth = aiohttp.BasicAuth(self.auth.username, self.auth.password)
+            self._session = aiohttp.ClientSession(connector=connector, auth=auth)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def ping(self) -> bool:
+        ret = await self.get("/")
+        return ret["apiVersion"]["version"] == "v3"
+
+    @contextlib.asynccontextmanager
+    async def _throttle(self, cmd):
+        if self.limiter is None:
+            yield
+            return
+        async with self.limiter.limit_async(cmd):
+            yield
+
+    async def _send(self, cmd, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            if self.debug:
+                print(f"DEBUG: - {cmd} {url}")
+            async with self.session.request(cmd, url, **kwargs) as r:
+                content = await r.read()
+                response = AsyncResponse(url, r.status, r.headers, content)
+        except Exception:
+            self.history.add(cmd, url, None, time.perf_counter() - start)
+            raise
+        self.history.add(
+            cmd,
+            url,
+            response.status_code,
+            time.perf_counter() - start,
+            len(kwargs.get("data") or b""),
+            len(content),
+            content,
+        )
+        return response
+
+    async def _attempt(self, cmd, url, kwargs):
+        """Send a request once, returns `(response, connection error)`."""
+        if self.breaker and not self.breaker.allow():
+            raise CircuitOpen(url)
+        response = error = None
+        try:
+            async with self._throttle(cmd):
+                response = await self._send(cmd, url, **kwargs)
+        except aiohttp.ClientSSLError:
+            if self.breaker:
+                self.breaker.failure()
+            raise ServerSSLError(url)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            error = e
+        except Exception as e:
+            # not a server failure (ie. invalid url): no retries
+            if self.breaker:
+                self.breaker.release()
+            raise ServerConnectionError(url, e)
+        if self.breaker:
+            self.breaker.record(response)
+        return response, error
+
+    async def _r(self, cmd, url, *, raw=False, ignore_error=False, **kwargs):
+        if not (url.startswith("http") or url.startswith("wss")):
+            url = f"{self.base_url}{url}"
+        if "json" in kwargs:
+            kwargs["data"] = dumps(kwargs.pop("json"))
+            kwargs.setdefault("headers", {})["Content-Type"] = "application/json"
+        delays = self.retry.delays()
+        attempt = 0
+        while True:
+            attempt += 1
+            response, error = await self._attempt(cmd, url, kwargs)
+            if not self.retry.should_retry(cmd, attempt, response):
+                break
+            await asyncio.sleep(self.retry.delay(delays, response))
+        if error is not None:
+            raise ServerConnectionError(url, error)
+        return process_response(url, response, raw=raw, ignore_error=ignore_error)
+
+    async def post(self, url, **kwargs):
+        return await self._r("post", url, **kwargs)
+
+    async def get(self, url, **kwargs):
+        return await self._r("get", url, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        return await self._r("delete", url, **kwargs)
+
+    async def put(self, url, *, data, **kwargs):
+        return await self._r("put", url, json=data, **kwargs)
+
+    async def ws(self, where, stdout=None, stderr=None):
+        scheme = "ws" if self.scheme == "http" else "wss"
+        url = f"{scheme}://{self.host}:{self.port}{where}"
+        headers = {}
+        if self.auth is not None:
+            userAndPass = b64encode(
+                f"{self.auth.username}:{self.auth.password}".encode("utf8")
+            ).decode("ascii")
+            headers["Authorization"] = "Basic %s" % userAndPass
+        stream = ExecStream(stdout, stderr)
+        async with self._throttle("ws"), self.session.ws_connect(
+            url, headers=headers, ssl=False, protocols=ExecStream.subprotocols
+        ) as ws:
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.BINARY:
+                    stream.feed(msg.data)
+                elif msg.type == aiohttp.WSMsgType.TEXT:
+                    stream.feed(msg.data.encode("utf8"))
+                else:
+                    break
+        return stream.exit_code
+
+
+class AsyncRancherClient(RancherMixin, AsyncHttpClient):
+    """Non-blocking counterpart of `RancherClient`.
+
+    With `use_names=True` cluster and project names are resolved on first use,
+    as setters cannot await.
+    """
+
+    def __init__(self, base_url, cluster=None, project=None, **kwargs):
+        self.use_names = kwargs.pop("use_names", False)
+        super().__init__(base_url, **kwargs)
+        self._cluster = cluster
+        self._project = project
+        self._resolved = not self.use_names
+        self._resolving = None
+
+    def __repr__(self):
+        return f"<AsyncRancherClient {self.base_url}>"
+
+    @property
+    def cluster(self):
+        return self._cluster
+
+    @cluster.setter
+    def cluster(self, cluster_id):
+        self._cluster = cluster_id
+        self._resolved = not self.use_names
+
+    @property
+    def project(self):
+        return self._project
+
+    @project.setter
+    def project(self, name_or_id):
+        if isinstance(name_or_id, (list, tuple)):
+            if name_or_id[0]:
+                self._cluster = name_or_id[0]
+            name_or_id = name_or_id[1]
+        self._project = name_or_id
+        self._resolved = not self.use_names
+
+    async def resolve(self):
+        """Translate cluster/project names into Rancher ids (only with use_names).
+
+        Concurrent callers wait for the first one to resolve them.
+        """
+        if self._resolved:
+            return
+        if self._resolving is None:
+            self._resolving = asyncio.Lock()
+        async with self._resolving:
+            if self._resolved:
+                return
+            cluster, project = self._cluster, self._project
+            if cluster:
+                cluster = await self._get_cluster_id_by_name(cluster)
+            if project:
+                project = await self._get_project_id_by_name(project, cluster)
+            self._cluster, self._project = cluster, project
+            self._resolved = True
+
+    async def _iter_collection(
+        self, url, *, limit=None, page_size=None, sort=None, order=None, **filters
+    ):
+        params = self._collection_params(limit, page_size, sort, order, filters)
+        count = 0
+        while url:
+            response = await self.get(url, params=params)
+            for entry in response["data"]:
+                yield entry
+                count += 1
+                if limit and count >= limit:
+                    return
+            url = self._next_page(response)
+            params = None
+
+    async def iter_clusters(self, raw=False, **kwargs):
+        async for e in self._iter_collection("/clusters", **kwargs):
+            yield e if raw else Entry(e["name"], e["id"])
+
+    async def iter_projects(self, cluster=None, raw=False, **kwargs):
+        await self.resolve()
+        url = f"/clusters/{cluster or self.cluster}/projects"
+        async for e in self._iter_collection(url, **kwargs):
+            yield e if raw else Entry(e["name"], e["id"])
+
+    async def iter_workloads(self, cluster=None, project=None, raw=False, **kwargs):
+        await self.resolve()
+        url = f"/projects/{cluster or self.cluster}:{project or self.project}/workloads"
+        async for e in self._iter_collection(url, **kwargs):
+            yield e if raw else Entry(e["name"], e["id"])
+
+    async def list_clusters(self):
+        return [e async for e in self.iter_clusters()]
+
+    async def list_projects(self):
+        return [e async for e in self.iter_projects()]
+
+    async def list_workloads(self):
+        return [e async for e in self.iter_workloads()]
+
+    async def get_workload(self, name):
+        await self.resolve()
+        return await self.get(
+            f"/projects/{self.cluster}:{self.project}/workloads/{name}"
+        )
+
+    async def get_env(self, workload):
+        return self._extract_env(await self.get_workload(workload))
+
+    async def set_env(self, workload, **kwargs):
+        info = await self.get_workload(workload)
+        updated, changes = self._diff(info, env=kwargs)
+        if not changes:
+            return info
+        return await self.put(self._workload_url(workload), data=updated)
+
+    async def diff(self, workload, image=None, env=None, current=None):
+        await self.resolve()
+        current = current or await self.get(self._workload_url(workload))
+        return current, self._diff(current or {}, image, env)[1]
+
+    async def upgrade(self, workload, image, env=None, current=None):
+        await self.resolve()
+        url = self._workload_url(workload)
+        response = current or await self.get(url)
+        if not response:
+            return
+        try:
+            return await self._put_changes(url, response, image, env)
+        except HttpError as e:
+            if current is None or not self._is_conflict(e):
+                raise
+        return await self._put_changes(url, await self.get(url), image, env)
+
+    async def _put_changes(self, url, current, image, env):
+        updated, changes = self._diff(current, image, env)
+        if not changes:
+            return current
+        return await self.put(url, data=updated)
+
+    async def _get_cluster_id_by_name(self, name):
+        return self._find_id(await self.get("/clusters"), name, "cluster")
+
+    async def _get_project_id_by_name(self, name, cluster=None):
+        res = await self.get(f"/clusters/{cluster or self.cluster}/projects")
+        return self._find_id(res, name, "project").split(":")[1]
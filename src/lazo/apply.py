@@ -0,0 +1,291 @@
+import json
+import threading
+import time
+
+from .exceptions import InvalidManifest
+from .objects import DockerImage, RancherWorkload
+from .throttle import TokenBucket
+from .utils import run_parallel
+
+ENTRY_KEYS = {"cluster", "project", "workload", "image", "env"}
+
+
+class Operation:
+    """Update of one workload listed in a manifest."""
+
+    __slots__ = (
+        "cluster",
+        "project",
+        "workload",
+        "image",
+        "env",
+        "cluster_id",
+        "project_id",
+        "current",
+        "changes",
+        "status",
+        "error",
+        "elapsed",
+    )
+
+    def __init__(self, cluster, project, workload, image=None, env=None):
+        self.cluster = cluster
+        self.project = project
+        self.workload = workload
+        self.image = image
+        self.env = env or {}
+        self.cluster_id = None
+        self.project_id = None
+        self.current = None
+        self.changes = []
+        self.status = "pending"
+        self.error = None
+        self.elapsed = None
+
+    def __repr__(self):
+        return f"<Operation {self.cluster}:{self.project} {self.workload.id}>"
+
+    def fail(self, error):
+        self.status = "failed"
+        self.error = str(error)
+
+    def as_dict(self):
+        return {
+            "cluster": self.cluster,
+            "project": self.project,
+            "workload": self.workload.id,
+            "status": self.status,
+            "changes": [str(c) for c in self.changes],
+            "elapsed": None if self.elapsed is None else round(self.elapsed, 3),
+            "error": self.error,
+        }
+
+
+def _parse(text, name):
+    if name.endswith(".json"):
+        return json.loads(text)
+    try:
+        import yaml
+    except ImportError:
+        try:
+            return json.loads(text)
+        except ValueError:
+            raise InvalidManifest(
+                "yaml manifests require PyYAML: pip install lazo[yaml]"
+            )
+    try:
+        return yaml.safe_load(text)
+    except yaml.YAMLError as e:
+        raise ValueError(e)
+
+
+def _operation(entry, defaults):
+    if not isinstance(entry, dict):
+        raise InvalidManifest(f"entries must be mappings, not '{entry}'")
+    unknown = set(entry) - ENTRY_KEYS
+    if unknown:
+        raise InvalidManifest(f"unknown keys {', '.join(sorted(unknown))}")
+    values = dict(defaults, **entry)
+    values["env"] = dict(defaults.get("env") or {}, **(entry.get("env") or {}))
+    for key in ["cluster", "project", "workload"]:
+        if not values.get(key):
+            raise InvalidManifest(f"'{key}' missing in {entry}")
+    if not values.get("image") and not values["env"]:
+        raise InvalidManifest(f"nothing to change in {entry}")
+    try:
+        return Operation(
+            str(values["cluster"]),
+            str(values["project"]),
+            RancherWorkload(values["workload"]),
+            DockerImage(values["image"]) if values.get("image") else None,
+            {str(k): str(v) for k, v in values["env"].items()},
+        )
+    except Exception:
+        raise InvalidManifest(f"invalid workload or image in {entry}")
+
+
+def load_manifest(stream):
+    """Read the list of `Operation` of a yaml or json manifest.
+
+    The manifest is either a list of entries or a mapping with a `workloads`
+    list; the other keys of the mapping are defaults for all the entries.
+    Each entry has `cluster`, `project` (names or ids), `workload`
+    ('namespace:name'), and an `image` and/or `env` mapping to set.
+    """
+    name = getattr(stream, "name", "") or ""
+    try:
+        data = _parse(stream.read(), name)
+    except ValueError as e:
+        raise InvalidManifest(f"{name}: {e}")
+    if isinstance(data, dict):
+        defaults = dict(data)
+        entries = defaults.pop("workloads", None)
+        unknown = set(defaults) - ENTRY_KEYS
+        if unknown:
+            raise InvalidManifest(f"unknown keys {', '.join(sorted(unknown))}")
+    else:
+        defaults, entries = {}, data
+    if not isinstance(entries, list) or not entries:
+        raise InvalidManifest("no workloads to update")
+    return [_operation(entry, defaults) for entry in entries]
+
+
+def _ids(entries, short=False):
+    """Map names and ids of `entries` to their id ('c-1:p-1' -> 'p-1' if `short`)."""
+    ret = {}
+    for entry in entries:
+        id = entry["id"].split(":")[-1] if short else entry["id"]
+        ret[entry["name"]] = ret[entry["id"]] = ret[id] = id
+    return ret
+
+
+def _interleave(groups):
+    """Items of `groups` taken one per group in turn."""
+    iterators = [iter(group) for group in groups]
+    while iterators:
+        for it in list(iterators):
+            try:
+                yield next(it)
+            except StopIteration:
+                iterators.remove(it)
+
+
+class Plan:
+    """Operations of a manifest with names resolved and changes computed.
+
+    Names are resolved and the current workload documents prefetched with one
+    request for the clusters, one per cluster for its projects and one per
+    project for its workloads. Operations are grouped by project; failed
+    lookups mark the operations they affect as failed.
+    """
+
+    def __init__(self, client, operations, workers=4):
+        self.client = client
+        self.operations = operations
+        self.projects = {}
+        self.waited = 0.0
+        self._resolve(workers)
+
+    def __repr__(self):
+        return f"<Plan {len(self.operations)} operations>"
+
+    def _pending(self):
+        return [op for op in self.operations if op.status == "pending"]
+
+    def _resolve(self, workers):
+        clusters = _ids(self.client.iter_clusters(raw=True))
+        for op in self.operations:
+            op.cluster_id = clusters.get(op.cluster)
+            if op.cluster_id is None:
+                op.fail(f"Invalid cluster name '{op.cluster}'")
+        self._resolve_projects(workers)
+        self.projects = self._group()
+        self._prefetch(workers)
+
+    def _resolve_projects(self, workers):
+        def fetch(cluster_id):
+            return _ids(self.client.iter_projects(cluster_id, raw=True), short=True)
+
+        cluster_ids = sorted({op.cluster_id for op in self._pending()})
+        for cluster_id, projects, exc in run_parallel(fetch, cluster_ids, workers):
+            for op in self._pending():
+                if op.cluster_id != cluster_id:
+                    continue
+                if exc is not None:
+                    op.fail(exc)
+                    continue
+                op.project_id = projects.get(op.project)
+                if op.project_id is None:
+                    op.fail(f"Invalid project name '{op.project}'")
+
+    def _group(self):
+        groups = {}
+        for op in self._pending():
+            groups.setdefault((op.cluster_id, op.project_id), []).append(op)
+        return groups
+
+    def _prefetch(self, workers):
+        def fetch(key):
+            workloads = self.client.iter_workloads(*key, raw=True)
+            return {(w.get("namespaceId"), w["name"]): w for w in workloads}
+
+        for key, workloads, exc in run_parallel(fetch, list(self.projects), workers):
+            for op in self.projects[key]:
+                if exc is not None:
+                    op.fail(exc)
+                    continue
+                doc = workloads.get((op.workload.namespace, op.workload.name))
+                if doc is None:
+                    op.fail(f"Workload '{op.workload.id}' not found")
+                    continue
+                op.workload = RancherWorkload(doc["id"])
+                op.current = doc
+                __, op.changes = self.client.diff(
+                    op.workload, op.image, op.env, current=doc
+                )
+                if not op.changes:
+                    op.status = "unchanged"
+
+    def check_images(self, checker):
+        """Fail the operations setting an image missing from its registry.
+
+        `checker` is a `lazo.clients.ImageChecker`.
+        """
+        ops = [op for op in self._pending() if op.image is not None]
+        if not ops:
+            return
+        results = {}
+        for image, found, exc in checker.check([op.image for op in ops]):
+            results[image.id] = exc or (None if found else "not found")
+        for op in ops:
+            error = results[op.image.id]
+            if error is not None:
+                op.fail(f"Image '{op.image.id}': {error}")
+
+    def execute(self, parallel=4, per_project=1, rate=None, dry_run=False):
+        """Apply the changes, returns the operations.
+
+        At most `parallel` workloads are updated at the same time, no more than
+        `per_project` of the same project, and no more than `rate` per second.
+        """
+        pending = set(self._pending())
+        if dry_run:
+            for op in pending:
+                op.status = "planned"
+            return self.operations
+        bucket = TokenBucket(rate)
+        slots = {key: threading.BoundedSemaphore(per_project) for key in self.projects}
+
+        def run(op):
+            with slots[(op.cluster_id, op.project_id)]:
+                bucket.acquire()
+                start = time.perf_counter()
+                try:
+                    self.client.upgrade(
+                        op.workload,
+                        op.image,
+                        op.env,
+                        current=op.current,
+                        cluster=op.cluster_id,
+                        project=op.project_id,
+                    )
+                finally:
+                    op.elapsed = time.perf_counter() - start
+
+        # projects take turns so that workers are not all held by the same one
+        groups = [[op for op in ops if op in pending] for ops in self.projects.values()]
+        ordered = list(_interleave(groups))
+        for op, __, exc in run_parallel(run, ordered, parallel):
+            if exc is None:
+                op.status = "updated"
+            else:
+                op.fail(exc)
+        self.waited = bucket.waited
+        return self.operations
+
+    def summary(self):
+        """Number of operations by status."""
+        counts = {}
+        for op in self.operations:
+            counts[op.status] = counts.get(op.status, 0) + 1
+        return counts
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_dir():
+    if "LAZO_CACHE_DIR" in os.environ:
+        return os.environ["LAZO_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "lazo")
+
+
+def _write_json(path, data):
+    _write(path, json.dumps(data).encode())
+
+
+def _write(path, data):
+    # responses hold workload documents, env values included: owner only
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with open(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class NameCache:
+    """On-disk map of Rancher names to ids, stored per base url.
+
+    Each collection is stored as a whole under its API path (ie. `/clusters`),
+    together with the time it has been fetched, and it is considered stale
+    after `ttl` seconds.
+    """
+
+    filename = "names.json"
+
+    def __init__(self, base_url, ttl=3600, path=None):
+        self.base_url = base_url
+        self.ttl = ttl
+        self.path = path or os.path.join(cache_dir(), self.filename)
+
+    def __repr__(self):
+        return f"<NameCache {self.path}>"
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, kind, name):
+        entry = self._load().get(self.base_url, {}).get(kind)
+        if entry and time.time() - entry["ts"] < self.ttl:
+            return entry["names"].get(name)
+
+    def update(self, kind, names):
+        data = self._load()
+        data.setdefault(self.base_url, {})[kind] = {"ts": time.time(), "names": names}
+        _write_json(self.path, data)
+
+    def clear(self):
+        data = self._load()
+        if data.pop(self.base_url, None) is not None:
+            _write_json(self.path, data)
+
+    def clear_all(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class CachedResponse:
+    __slots__ = ("url", "etag", "last_modified", "content_type", "content")
+
+    def __init__(self, url, etag, last_modified, content_type, content):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_type = content_type
+        self.content = content
+
+    def __repr__(self):
+        return f"<CachedResponse {self.url} {self.etag or self.last_modified}>"
+
+    @property
+    def size(self):
+        return len(self.content)
+
+    def validators(self):
+        """Headers to revalidate this entry with a conditional request."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def dumps(self):
+        meta = [self.url, self.etag, self.last_modified, self.content_type]
+        return json.dumps(meta).encode() + b"\n" + self.content
+
+    @classmethod
+    def loads(cls, data):
+        meta, __, content = data.partition(b"\n")
+        return cls(*json.loads(meta), content)
+
+
+class ResponseCache:
+    """Bodies of GET responses that carry an `ETag` or `Last-Modified` header.
+
+    Entries are kept in memory in LRU order up to `max_size` bytes. With
+    `path` they are also stored on disk, one file per url, and the directory
+    is trimmed to `max_disk_size` bytes (oldest first) by `prune()`.
+    """
+
+    def __init__(self, max_size=32 << 20, path=None, max_disk_size=256 << 20):
+        self.max_size = max_size
+        self.max_disk_size = max_disk_size
+        self.path = path
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<ResponseCache {len(self)} entries, {self.size} bytes>"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, url):
+        return url in self._entries
+
+    def _filename(self, url):
+        return os.path.join(self.path, hashlib.sha1(url.encode()).hexdigest())
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                return entry
+        if self.path:
+            try:
+                with open(self._filename(url), "rb") as f:
+                    entry = CachedResponse.loads(f.read())
+            except (OSError, ValueError):
+                return None
+            if entry.url == url:
+                self._add(entry)
+                return entry
+
+    def _add(self, entry):
+        if entry.size > self.max_size:
+            return
+        with self._lock:
+            old = self._entries.pop(entry.url, None)
+            if old is not None:
+                self.size -= old.size
+            self._entries[entry.url] = entry
+            self.size += entry.size
+            while self.size > self.max_size:
+                __, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+
+    def put(self, url, response):
+        """Store `response` if it can be revalidated. Returns the new entry."""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not (etag or last_modified):
+            return None
+        entry = CachedResponse(
+            url,
+            etag,
+            last_modified,
+            response.headers.get("Content-Type"),
+            response.content,
+        )
+        self._add(entry)
+        if self.path:
+            _write(self._filename(url), entry.dumps())
+        return entry
+
+    def discard(self, url):
+        with self._lock:
+            entry = self._entries.pop(url, None)
+            if entry is not None:
+                self.size -= entry.size
+        if self.path:
+            try:
+                os.unlink(self._filename(url))
+            except OSError:
+                pass
+
+    def prune(self):
+        """Remove the least recently written files above `max_disk_size`."""
+        if not (self.path and os.path.isdir(self.path)):
+            return
+        files = []
+        for entry in os.scandir(self.path):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(f[1] for f in files)
+        for __, size, filename in sorted(files):
+            if total <= self.max_disk_size:
+                break
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self, prefix=None):
+        """Remove all entries, or only those whose url starts with `prefix`."""
+        with self._lock:
+            for url in [u for u in self._entries if u.startswith(prefix or "")]:
+                self.size -= self._entries.pop(url).size
+        if not (self.path and os.path.isdir(self.path)):
+            return
+        if prefix is None:
+            shutil.rmtree(self.path)
+            return
+        for entry in os.scandir(self.path):
+            try:
+                with open(entry.path, "rb") as f:
+                    url = json.loads(f.readline())[0]
+                if url.startswith(prefix):
+                    os.unlink(entry.path)
+            except (OSError, ValueError):
+                pass
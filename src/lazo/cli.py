@@ -1,10 +1,10 @@
 #!/usr/bin/env python
+import importlib
 import os
 import sys
 import warnings
 
 import click
-from urllib3.exceptions import InsecureRequestWarning
 
 from . import __version__
 from .exceptions import ExBadParameter
@@ -17,14 +17,32 @@ from .params import (
 )
 
 CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
-warnings.simplefilter("ignore", InsecureRequestWarning)
 
 
 class MyCLI(click.Group):
+    # modules that register their commands on this group,
+    # imported only when a command is looked up
+    command_modules = ["lazo.rancher"]
+
     def __init__(self, name=None, commands=None, **attrs):
         self.debug = False
+        self._loaded = False
         super().__init__(name, commands, **attrs)
 
+    def _load_commands(self):
+        if not self._loaded:
+            self._loaded = True
+            for module in self.command_modules:
+                importlib.import_module(module)
+
+    def list_commands(self, ctx):
+        self._load_commands()
+        return super().list_commands(ctx)
+
+    def get_command(self, ctx, cmd_name):
+        self._load_commands()
+        return super().get_command(ctx, cmd_name)
+
 
 def display(value):
     if value is None:
@@ -32,6 +50,19 @@ def display(value):
     return str(value)
 
 
+def _fresh_index(base_url, max_age):
+    """The search index of `base_url` if refreshed in the last `max_age` seconds."""
+    from .index import Index
+
+    index = Index(base_url)
+    if not max_age or not os.path.exists(index.path):
+        return None
+    if index.is_stale(max_age):
+        index.close()
+        return None
+    return index
+
+
 PROTECTED = ["RANCHER_AUTH"]
 
 
@@ -45,7 +76,25 @@ PROTECTED = ["RANCHER_AUTH"]
 @make_option("--env", is_flag=True, is_eager=True)
 @options(_global_options, _rancher_options)
 @click.pass_context
-def cli(ctx, env, base_url, insecure, auth, use_names, debug, **kwargs):
+def cli(
+    ctx,
+    env,
+    base_url,
+    insecure,
+    auth,
+    use_names,
+    debug,
+    pool_size,
+    cache_ttl,
+    http_cache,
+    retries,
+    rate_limit,
+    max_in_flight,
+    write_rate_limit,
+    write_max_in_flight,
+    trace,
+    **kwargs,
+):
     if env:
         click.echo(f"{'Env':<20} Value")
         for i, opt in sorted(all_envs.items()):
@@ -53,14 +102,62 @@ def cli(ctx, env, base_url, insecure, auth, use_names, debug, **kwargs):
             click.echo(f"{i:<20} {value:<30}")
         sys.exit(0)
 
+    if ctx.invoked_subcommand == "cache":
+        ctx.obj = {"base_url": base_url}
+        return
     if not base_url:
         raise ExBadParameter(
             "Invalid url. Should be something like 'https://rancher.example.com:9000/v3/'"
         )
+    from urllib3.exceptions import InsecureRequestWarning
+
+    from .cache import NameCache, ResponseCache, cache_dir
     from .clients import RancherClient
 
-    ctx.obj = {
-        "client": RancherClient(
-            base_url, auth=auth, verify=not insecure, use_names=use_names, debug=debug
+    warnings.simplefilter("ignore", InsecureRequestWarning)
+
+    limiter = None
+    if rate_limit or max_in_flight or write_rate_limit or write_max_in_flight:
+        from .throttle import RateLimiter
+
+        limiter = RateLimiter(
+            rate_limit, max_in_flight, write_rate_limit, write_max_in_flight
         )
-    }
+
+    client = RancherClient(
+        base_url,
+        auth=auth,
+        verify=not insecure,
+        use_names=use_names,
+        debug=debug,
+        pool_size=pool_size,
+        retries=retries,
+        http_cache=ResponseCache(path=os.path.join(cache_dir(), "http"))
+        if http_cache
+        else True,
+        name_cache=NameCache(base_url, ttl=cache_ttl) if cache_ttl else None,
+        index=_fresh_index(base_url, cache_ttl) if use_names else None,
+        limiter=limiter,
+    )
+    ctx.obj = {"client": client, "output": kwargs.get("output")}
+    if trace:
+        from .trace import Tracer
+
+        tracer = Tracer(trace).install(client)
+
+    @ctx.call_on_close
+    def close():
+        if trace:
+            click.echo(tracer.format_summary(), err=True)
+        if debug:
+            stats = client.connection_stats
+            click.echo(
+                f"DEBUG: - connections opened: {stats['opened']} "
+                f"reused: {stats['reused']}",
+                err=True,
+            )
+        if limiter and (debug or trace):
+            click.echo(limiter.format_stats(), err=True)
+        client.close()
+        if client.index is not None:
+            client.index.close()
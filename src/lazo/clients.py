@@ -1,33 +1,75 @@
 import _thread
+import contextlib
+import json
+import queue
 import re
 import ssl
+import sys
+import threading
 import time
-from functools import wraps
-from json import JSONDecodeError
-from urllib.parse import urlparse
-import websocket
-from click import UsageError
-from requests import request
-from requests.exceptions import SSLError
-
-from lazo.objects import RancherPod
+from base64 import b64encode
+from urllib.parse import urlencode, urlparse
+
+from requests import PreparedRequest, Response, Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import (
+    ConnectionError as RequestConnectionError,
+    RequestException,
+    SSLError,
+    Timeout,
+)
+from requests.structures import CaseInsensitiveDict
+
+from lazo.objects import POD_SELECTIONS, Change, Entry, RancherPod, WorkloadView
 from lazo.types import RancherWorkload
 
-from .exceptions import (
+from .cache import ResponseCache
+from .codec import dumps, loads
+from .exceptions import (  # noqa: F401 handle_lazo_error is re-exported
+    CircuitOpen,
     EmptyResponse,
     HttpError,
     InvalidCredentials,
     InvalidName,
-    LazoError,
     ObjectNotFound,
+    RolloutTimeout,
     ServerConnectionError,
     ServerSSLError,
+    handle_lazo_error,
+    http_error,
 )
-from .out import echo, error, fail
-from .utils import jprint
+from .history import History
+from .out import echo
+from .retry import CircuitBreaker, RetryPolicy
+from .rollout import K8S_RESOURCES, backoff, rancher_ready, watch_event_ready
 
 success_codes = (200, 201, 204)
 
+# markers sent by RancherClient.iter_inventory() tasks
+_TASK_SPAWNED, _TASK_DONE = object(), object()
+
+# path segments followed by an object id
+ID_COLLECTIONS = {
+    "clusters",
+    "project",
+    "projects",
+    "workloads",
+    "pods",
+    "namespaces",
+    "deployments",
+    "statefulsets",
+    "daemonsets",
+}
+
+
+def endpoint_template(path):
+    """Replace ids in an API path with `{id}`, ie. `/v3/projects/{id}/workloads`."""
+    parts = path.split("/")
+    for i in range(1, len(parts)):
+        if parts[i] and parts[i - 1] in ID_COLLECTIONS:
+            parts[i] = "{id}"
+    return "/".join(parts)
+
 
 def on_message(ws, message):
     print(111, message)
@@ -50,8 +92,194 @@ def on_open(ws):
     _thread.start_new_thread(run, ())
 
 
+def process_response(url, response, *, raw=False, ignore_error=False):
+    """Map an HTTP response to its payload or to the matching LazoError."""
+    if response.content == b"null\n":
+        raise EmptyResponse(url)
+    if response.status_code in success_codes:
+        if raw:
+            return response
+        else:
+            try:
+                return loads(response.content)
+            except ValueError as e:
+                raise HttpError(url, response, e)
+    elif ignore_error:
+        return response
+    else:
+        raise http_error(url, response)
+
+
+def cached_response(response, entry):
+    """Turn a `304 Not Modified` response into a 200 with the cached body."""
+    ret = Response()
+    ret.status_code = 200
+    ret.reason = "OK (cached)"
+    ret._content = entry.content
+    ret.headers = CaseInsensitiveDict(response.headers)
+    if entry.content_type:
+        ret.headers["Content-Type"] = entry.content_type
+    ret.url = response.url
+    ret.request = response.request
+    ret.elapsed = response.elapsed
+    ret.encoding = "utf-8"
+    ret.from_cache = True
+    return ret
+
+
+class ExecStream:
+    """Demultiplex Kubernetes exec frames to binary stdout/stderr streams.
+
+    The first byte of each frame is the channel: 1 and 2 are written (and
+    flushed) as they arrive, 3 carries the final status of the command.
+    """
+
+    STDOUT, STDERR, ERROR = 1, 2, 3
+    subprotocols = ["v4.channel.k8s.io", "channel.k8s.io"]
+
+    def __init__(self, stdout=None, stderr=None):
+        self.outputs = {
+            self.STDOUT: stdout or sys.stdout.buffer,
+            self.STDERR: stderr or sys.stderr.buffer,
+        }
+        self.status = b""
+        self.bytes_received = 0
+
+    def feed(self, data):
+        if len(data) < 2:
+            return
+        channel, payload = data[0], memoryview(data)[1:]
+        if channel in self.outputs:
+            out = self.outputs[channel]
+            out.write(payload)
+            out.flush()
+        elif channel == self.ERROR:
+            self.status += payload
+
+    @property
+    def exit_code(self):
+        if not self.status:
+            return 0
+        try:
+            status = json.loads(self.status)
+        except ValueError:
+            # channel.k8s.io sends plain error messages
+            return 1
+        if status.get("status") == "Success":
+            return 0
+        for cause in status.get("details", {}).get("causes", []):
+            if cause.get("reason") == "ExitCode":
+                return int(cause["message"])
+        return 1
+
+
+class LinePrefixer:
+    """Binary stream writing complete lines to `target`, each one prefixed.
+
+    Writes are serialized with `lock`, so lines of concurrent streams sharing
+    the same target are never interleaved.
+    """
+
+    def __init__(self, prefix, target, lock):
+        self.prefix = prefix.encode() if isinstance(prefix, str) else prefix
+        self.target = target
+        self.lock = lock
+        self._buffer = b""
+
+    def write(self, data):
+        data = self._buffer + bytes(data)
+        lines = data.split(b"\n")
+        self._buffer = lines.pop()
+        if lines:
+            with self.lock:
+                for line in lines:
+                    self.target.write(self.prefix + line + b"\n")
+                self.target.flush()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._buffer:
+            self.write(b"\n")
+
+
+class PoolAdapter(HTTPAdapter):
+    """HTTPAdapter that counts the sockets it opens and the requests it sends.
+
+    It also records, per thread, how long the last request spent opening its
+    connection (`connect`, DNS lookup included) and in the TLS handshake.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._lock = threading.Lock()
+        self._timing = threading.local()
+        self.opened = 0
+        self.requests = 0
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+        classes = {}
+        for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items():
+
+            class Connection(pool_cls.ConnectionCls):
+                def _new_conn(self):
+                    start = time.perf_counter()
+                    sock = super()._new_conn()
+                    adapter._timing.connect = time.perf_counter() - start
+                    return sock
+
+                def connect(self):
+                    start = time.perf_counter()
+                    super().connect()
+                    elapsed = time.perf_counter() - start
+                    adapter._timing.tls = max(elapsed - adapter._timing.connect, 0)
+                    adapter._count("opened")
+
+            classes[scheme] = type(
+                pool_cls.__name__, (pool_cls,), {"ConnectionCls": Connection}
+            )
+        self.poolmanager.pool_classes_by_scheme = classes
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def reset_timing(self):
+        self._timing.connect = self._timing.tls = 0.0
+
+    def get_timing(self):
+        return {
+            "connect": getattr(self._timing, "connect", 0.0),
+            "tls": getattr(self._timing, "tls", 0.0),
+        }
+
+    def send(self, request, **kwargs):
+        self._count("requests")
+        return super().send(request, **kwargs)
+
+
 class HttpClient:
-    def __init__(self, base_url, *, verify=True, debug=True, auth=None, **kwargs):
+    def __init__(
+        self,
+        base_url,
+        *,
+        verify=True,
+        debug=True,
+        auth=None,
+        pool_size=10,
+        keep_alive=True,
+        history_size=100,
+        keep_body=False,
+        retries=3,
+        circuit_breaker=True,
+        http_cache=True,
+        limiter=None,
+        **kwargs,
+    ):
         o = urlparse(base_url)
         self.scheme = o.scheme or "http"
         self.port = o.port or {"http": 80, "https": 443}[self.scheme]
@@ -62,8 +290,54 @@ class HttpClient:
         self.base_url = base_url
         self.verify = verify
         self.debug = debug
-        self.history = []
+        self.history = History(history_size, keep_body=keep_body)
         self.auth = auth
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        if not isinstance(retries, RetryPolicy):
+            retries = RetryPolicy(retries)
+        self.retry = retries
+        self.breaker = CircuitBreaker() if circuit_breaker is True else circuit_breaker
+        self.http_cache = ResponseCache() if http_cache is True else http_cache
+        self.limiter = limiter
+        self._mutated = set()
+        self.hooks = {"before_request": [], "after_response": [], "error": []}
+        self.session = self._create_session()
+
+    def _create_session(self):
+        session = Session()
+        adapter = PoolAdapter(
+            pool_connections=self.pool_size, pool_maxsize=self.pool_size
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.auth = self.auth
+        session.verify = self.verify
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    def close(self):
+        self.session.close()
+        if self.http_cache:
+            self.http_cache.prune()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def connection_stats(self):
+        """Connections opened by the pool and requests served by reusing one."""
+        adapter = self.session.get_adapter(self.base_url)
+        opened, requests = adapter.opened, adapter.requests
+        return {
+            "opened": opened,
+            "reused": max(requests - opened, 0),
+            "requests": requests,
+        }
 
     def ping(self) -> bool:
         ret = self.get("/")
@@ -71,35 +345,171 @@ class HttpClient:
 
         # return self.history[-1].status_code == 200
 
-    def _r(self, cmd, url, *, raw=False, ignore_error=False, **kwargs):
-        if not (url.startswith("http") or url.startswith("wss")):
-            url = f"{self.base_url}{url}"
+    def add_hook(self, event, callback):
+        """Register `callback` for `event`.
+
+        - before_request(info)
+        - after_response(info, response)
+        - error(info, exception)
+
+        `info` is a dict with `method`, `url`, `endpoint` (url path with ids
+        replaced by `{id}`) and, after the request, `status`, `timing`,
+        `bytes_sent`, `bytes_received`, `retries` and `throttled` (seconds
+        waited on the rate limiter).
+        """
+        self.hooks[event].append(callback)
+
+    def _fire(self, event, *args):
+        for callback in self.hooks[event]:
+            callback(*args)
+
+    def _request_info(self, cmd, url):
+        return {
+            "method": cmd,
+            "url": url,
+            "endpoint": endpoint_template(urlparse(url).path),
+            "retries": 0,
+            "throttled": 0.0,
+        }
+
+    @contextlib.contextmanager
+    def _throttle(self, cmd, info):
+        """Wait for the rate limiter (if any) and hold a slot of it."""
+        if self.limiter is None:
+            yield
+            return
+        with self.limiter.limit(cmd) as waited:
+            info["throttled"] += waited
+            yield
+
+    @staticmethod
+    def _cache_key(url, params=None):
+        """Key of the cached responses of `url`: the url with its encoded query."""
+        request = PreparedRequest()
+        request.prepare_url(url.replace("/project/", "/projects/", 1), params)
+        return request.url
+
+    def _cache_lookup(self, cmd, url, kwargs):
+        """Return the cached entry of a GET and add its validators to `kwargs`.
+
+        Returns None when the cache is bypassed: GETs of urls modified in
+        this session, or of collections containing them. False on a miss.
+        """
+        if cmd != "get" or self.http_cache is None:
+            return None
+        key = self._cache_key(url, kwargs.get("params"))
+        path = urlparse(key).path
+        for mutated in tuple(self._mutated):
+            if mutated == path or mutated.startswith(f"{path}/"):
+                return None
+        entry = self.http_cache.get(key)
+        if entry is not None:
+            kwargs["headers"] = {**entry.validators(), **kwargs.get("headers", {})}
+        return entry or False
+
+    def _cache_update(self, cmd, url, params, response, entry):
+        key = self._cache_key(url, params)
+        if cmd != "get":
+            self._mutated.add(urlparse(key).path)
+            self.http_cache.discard(key)
+        elif response.status_code == 304 and entry:
+            return cached_response(response, entry)
+        elif response.status_code == 200 and entry is not None:
+            self.http_cache.put(key, response)
+        return response
+
+    def _send(self, cmd, url, info, **kwargs):
+        adapter = self.session.get_adapter(url)
+        adapter.reset_timing()
+        start = time.perf_counter()
         try:
             if self.debug:
                 print(f"DEBUG: - {cmd} {url}")
-            response = request(cmd, url, auth=self.auth, verify=self.verify, **kwargs)
-            if response.content == b"null\n":
-                raise EmptyResponse(url)
-        except SSLError:
-            raise ServerSSLError(url)
-        except LazoError as e:
+            # explicit, or REQUESTS_CA_BUNDLE would override session.verify
+            kwargs.setdefault("verify", self.verify)
+            response = self.session.request(cmd, url, **kwargs)
+        except Exception:
+            info.update(status=None, timing={"total": time.perf_counter() - start})
+            self.history.add(cmd, url, None, info["timing"]["total"])
             raise
+        total = time.perf_counter() - start
+        timing = adapter.get_timing()
+        elapsed = response.elapsed.total_seconds()
+        timing.update(
+            wait=max(elapsed - timing["connect"] - timing["tls"], 0),
+            transfer=max(total - elapsed, 0),
+            total=total,
+        )
+        info.update(
+            status=response.status_code,
+            timing=timing,
+            bytes_sent=len(response.request.body or b""),
+            bytes_received=len(response.content),
+        )
+        self.history.add(
+            cmd,
+            url,
+            response.status_code,
+            total,
+            info["bytes_sent"],
+            info["bytes_received"],
+            response.content,
+        )
+        return response
+
+    def _attempt(self, cmd, url, info, kwargs):
+        """Send a request once, returns `(response, connection error)`."""
+        if self.breaker and not self.breaker.allow():
+            e = CircuitOpen(url)
+            info.update(status=None, timing={"total": 0.0})
+            self._fire("error", info, e)
+            raise e
+        response = error = None
+        try:
+            with self._throttle(cmd, info):
+                response = self._send(cmd, url, info, **kwargs)
+        except SSLError as e:
+            if self.breaker:
+                self.breaker.failure()
+            self._fire("error", info, e)
+            raise ServerSSLError(url)
+        except (RequestConnectionError, Timeout) as e:
+            error = e
         except Exception as e:
+            # not a server failure (ie. invalid url): no retries
+            if self.breaker:
+                self.breaker.release()
+            self._fire("error", info, e)
             raise ServerConnectionError(url, e)
-        self.history.append(response)
+        if self.breaker:
+            self.breaker.record(response)
+        return response, error
 
-        if response.status_code in success_codes:
-            if raw:
-                return response
-            else:
-                try:
-                    return response.json()
-                except JSONDecodeError as e:
-                    raise HttpError(url, response, e)
-        elif ignore_error:
-            return response
-        else:
-            raise HttpError(url, response)
+    def _r(self, cmd, url, *, raw=False, ignore_error=False, **kwargs):
+        if not (url.startswith("http") or url.startswith("wss")):
+            url = f"{self.base_url}{url}"
+        info = self._request_info(cmd, url)
+        self._fire("before_request", info)
+        entry = self._cache_lookup(cmd, url, kwargs)
+        delays = self.retry.delays()
+        while True:
+            response, error = self._attempt(cmd, url, info, kwargs)
+            if not self.retry.should_retry(cmd, info["retries"] + 1, response):
+                break
+            delay = self.retry.delay(delays, response)
+            info["retries"] += 1
+            if self.debug:
+                print(f"DEBUG: - retry {info['retries']} in {delay:.1f}s")
+            time.sleep(delay)
+        if error is not None:
+            self._fire("error", info, error)
+            raise ServerConnectionError(url, error)
+        self._fire("after_response", info, response)
+        if self.http_cache is not None:
+            response = self._cache_update(
+                cmd, url, kwargs.get("params"), response, entry
+            )
+        return process_response(url, response, raw=raw, ignore_error=ignore_error)
 
     def post(self, url, **kwargs):
         return self._r("post", url, **kwargs)
@@ -111,42 +521,162 @@ class HttpClient:
         return self._r("delete", url, **kwargs)
 
     def put(self, url, *, data, **kwargs):
-        return self._r("put", url, json=data, **kwargs)
+        headers = {"Content-Type": "application/json", **kwargs.pop("headers", {})}
+        return self._r("put", url, data=dumps(data), headers=headers, **kwargs)
+
+    def ws(self, where, stdout=None, stderr=None):
+        """Run a Kubernetes exec websocket, streaming its output.
 
-    def ws(self, where):
+        Returns the command exit code. See `ExecStream`.
+        """
         scheme = "ws" if self.scheme == "http" else "wss"
         base = f"{scheme}://{self.host}:{self.port}"
         url = f"{base}{where}"
         if self.debug:
             echo(f"WS {url}")
-        from base64 import b64encode
+        import websocket
 
         userAndPass = b64encode(
             f"{self.auth.username}:{self.auth.password}".encode("utf8")
         ).decode("ascii")
         headers = {"Authorization": "Basic %s" % userAndPass}
-        ws = websocket.create_connection(
-            url, sslopt={"cert_reqs": ssl.CERT_NONE}, header=headers
+        info = self._request_info("ws", url)
+        self._fire("before_request", info)
+        start = time.perf_counter()
+        stream = ExecStream(stdout, stderr)
+        try:
+            with self._throttle("ws", info):
+                ws = websocket.create_connection(
+                    url,
+                    sslopt={"cert_reqs": ssl.CERT_NONE},
+                    header=headers,
+                    subprotocols=ExecStream.subprotocols,
+                )
+                assert ws.connected
+                connected = time.perf_counter() - start
+                try:
+                    while True:
+                        opcode, data = ws.recv_data()
+                        if opcode == websocket.ABNF.OPCODE_CLOSE:
+                            break
+                        stream.bytes_received += len(data)
+                        stream.feed(data)
+                finally:
+                    ws.close()
+        except Exception as e:
+            info.update(status=None, timing={"total": time.perf_counter() - start})
+            self._fire("error", info, e)
+            raise
+        total = time.perf_counter() - start
+        info.update(
+            status=101,
+            timing={
+                "connect": connected,
+                "transfer": total - connected,
+                "total": total,
+            },
+            bytes_sent=0,
+            bytes_received=stream.bytes_received,
         )
-        assert ws.connected
-        data = []
-        while ws.connected:
-            rec = ws.recv()
-            if rec != b"\x01":
-                if isinstance(rec, str):
-                    data.append(rec[1:])
-                else:
-                    data.append(rec[1:].decode("utf8"))
+        self._fire("after_response", info, None)
+        return stream.exit_code
+
+
+class RancherMixin:
+    """URLs and payload handling shared by RancherClient and AsyncRancherClient."""
 
-        if not data:
-            raise Exception("No response")
+    env_type = "/v3/project/schemas/envVar"
 
-        return "".join(data)
+    def _workload_url(self, workload, cluster=None, project=None):
+        cluster, project = cluster or self.cluster, project or self.project
+        return f"/project/{cluster}:{project}/workloads/{workload.id}"
 
+    @staticmethod
+    def _collection_params(limit, page_size, sort, order, filters):
+        if limit and (not page_size or limit < page_size):
+            page_size = limit
+        params = dict(filters, limit=page_size, sort=sort, order=order)
+        return {k: v for k, v in params.items() if v is not None}
+
+    @staticmethod
+    def _next_page(response):
+        return (response.get("pagination") or {}).get("next")
+
+    @staticmethod
+    def _find_id(response, name, kind):
+        for entry in response["data"]:
+            if entry["name"] == name:
+                return entry["id"]
+        raise InvalidName(f"Invalid {kind} name '{name}'")
 
-class RancherClient(HttpClient):
+    @staticmethod
+    def _extract_env(info):
+        ret = {}
+        if "containers" in info:
+            for pod in info["containers"]:
+                ret[pod["name"]] = {}
+                if "env" in pod:
+                    ret[pod["name"]] = pod["env"]
+        return ret
+
+    def _merge_env(self, container, current, env, changes):
+        """Copy of the `current` env list of `container` with `env` values set.
+
+        Variables are matched by name through an index of `current`, which
+        is never modified; each actual change is appended to `changes`.
+        """
+        merged = list(current)
+        positions = {entry.get("name"): i for i, entry in enumerate(merged)}
+        for name, value in env.items():
+            pos = positions.get(name)
+            if pos is None:
+                merged.append({"name": name, "type": self.env_type, "value": value})
+                changes.append(Change(container, "env", name, None, value))
+                continue
+            entry = merged[pos]
+            if entry.get("value") == value and "valueFrom" not in entry:
+                continue
+            changes.append(Change(container, "env", name, entry.get("value"), value))
+            merged[pos] = {k: v for k, v in entry.items() if k != "valueFrom"}
+            merged[pos]["value"] = value
+        return merged
+
+    def _diff(self, doc, image=None, env=None):
+        """Apply `image` and `env` to all the containers of workload `doc`.
+
+        Returns the updated copy of `doc` and the list of `Change` made;
+        an empty list means that a PUT would not change anything.
+        """
+        env = {name: str(value) for name, value in dict(env or {}).items()}
+        changes = []
+        containers = []
+        for container in doc.get("containers", []):
+            container = dict(container)
+            name = container.get("name")
+            if image is not None and container.get("image") != str(image):
+                changes.append(
+                    Change(name, "image", None, container.get("image"), str(image))
+                )
+                container["image"] = str(image)
+            if env:
+                container["env"] = self._merge_env(
+                    name, container.get("env") or [], env, changes
+                )
+            containers.append(container)
+        if "containers" not in doc:
+            return doc, changes
+        return dict(doc, containers=containers), changes
+
+    @staticmethod
+    def _is_conflict(exc):
+        return exc.response.status_code == 409
+
+
+class RancherClient(RancherMixin, HttpClient):
     def __init__(self, base_url, cluster=None, project=None, **kwargs):
         self.use_names = kwargs.pop("use_names", False)
+        self.name_cache = kwargs.pop("name_cache", None)
+        self.index = kwargs.pop("index", None)
         super().__init__(base_url, **kwargs)
         self._cluster = cluster
         self._project = project
@@ -182,172 +712,549 @@ class RancherClient(HttpClient):
         self._project = name
 
     # pods
-    # def list_pods(self):
-    #     url = f"/project/{self.cluster}:{self.project}/pods?limit=-1&sort=name"
-    #     res = self.get(url)
-    #     return res["data"]
-    #
-    # def get_pod(self, workload: RancherWorkload, elem=1):
-    #     url = f"/project/{self.cluster}:{self.project}/pods?limit=-1&sort=name"
-    #     res = self.get(url)
-    #     for w in res["data"]:
-    #         if w["workloadId"] == workload.id:
-    #             return RancherPod(w)
-    #     raise ObjectNotFound(workload.id)
+    def exec_path(self, pod, command, tty=False):
+        """Path of the exec websocket running `command` in the first container."""
+        cmds = [("container", pod.workload.name), ("stdout", "1"), ("stderr", "1")]
+        if tty:
+            cmds += [("stdin", "1"), ("tty", "1")]
+        cmds += [("command", c) for c in command]
+        return (
+            f"/k8s/clusters/{self.cluster}/api/v1/namespaces/{pod.workload.namespace}"
+            f"/pods/{pod.name}/exec?{urlencode(cmds)}"
+        )
+
+    def exec(self, pod, command, stdout=None, stderr=None):
+        """Run `command` (a list) in `pod`, returns its exit code."""
+        return self.ws(self.exec_path(pod, command), stdout, stderr)
+
+    def iter_pods(
+        self, workload=None, state=None, cluster=None, project=None, raw=False, **kwargs
+    ):
+        """Pods of the project, filtered server side by `workload` and `state`."""
+        url = f"/projects/{cluster or self.cluster}:{project or self.project}/pods"
+        if workload is not None:
+            kwargs["workloadId"] = str(getattr(workload, "id", workload))
+        if state is not None:
+            kwargs["state"] = state
+        for e in self._iter_collection(url, **kwargs):
+            yield e if raw else RancherPod(e)
+
+    def list_pods(self, workload=None, state=None):
+        return list(self.iter_pods(workload, state, sort="name"))
+
+    def get_pod(self, workload: RancherWorkload, select="ready", ordinal=None):
+        """Return a running pod of `workload`.
+
+        With `ordinal` the pod at that position (by name, starting from 0),
+        otherwise the first ready one (`select="ready"`) or the one with the
+        least container restarts (`select="least-restarted"`).
+        """
+        if select not in POD_SELECTIONS:
+            raise ValueError(f"Invalid pod selection '{select}'")
+        pods = self.iter_pods(workload, state="running", sort="name", page_size=10)
+        if ordinal is not None:
+            pods = list(pods)
+            if 0 <= ordinal < len(pods):
+                return pods[ordinal]
+        elif select == "ready":
+            for pod in pods:
+                if pod.ready:
+                    return pod
+        else:
+            pods = [p for p in pods if p.ready]
+            if pods:
+                return min(pods, key=lambda p: p.restarts)
+        raise ObjectNotFound(workload.id)
+
+    def _iter_collection(
+        self, url, *, limit=None, page_size=None, sort=None, order=None, **filters
+    ):
+        """Yield raw entries of a collection, following `pagination.next` links.
+
+        `filters` are sent as query parameters, ie. `name="web"` or
+        `namespaceId="ns"`, and applied server side.
+        """
+        params = self._collection_params(limit, page_size, sort, order, filters)
+        count = 0
+        while url:
+            response = self.get(url, params=params)
+            for entry in response["data"]:
+                yield entry
+                count += 1
+                if limit and count >= limit:
+                    return
+            url = self._next_page(response)
+            params = None  # next link already carries the query
+
+    def iter_clusters(self, raw=False, **kwargs):
+        for e in self._iter_collection("/clusters", **kwargs):
+            yield e if raw else Entry(e["name"], e["id"])
+
+    def iter_projects(self, cluster=None, raw=False, **kwargs):
+        url = f"/clusters/{cluster or self.cluster}/projects"
+        for e in self._iter_collection(url, **kwargs):
+            yield e if raw else Entry(e["name"], e["id"])
+
+    def iter_workloads(
+        self, cluster=None, project=None, raw=False, view=False, **kwargs
+    ):
+        """Workloads as `Entry`, raw documents or, with `view`, `WorkloadView`."""
+        project_id = f"{cluster or self.cluster}:{project or self.project}"
+        url = f"/projects/{project_id}/workloads"
+        for e in self._iter_collection(url, **kwargs):
+            if view:
+                yield WorkloadView(e, project_id)
+            else:
+                yield e if raw else Entry(e["name"], e["id"])
 
     def list_clusters(self):
-        res = self.get("/clusters")
-        return [(e["name"], e["id"]) for e in res["data"]]
+        return list(self.iter_clusters())
 
     def list_projects(self):
-        response = self.get(f"/clusters/{self.cluster}/projects")
-        return [(e["name"], e["id"]) for e in response["data"]]
+        return list(self.iter_projects())
 
     def list_workloads(self):
-        response = self.get(f"/projects/{self.cluster}:{self.project}/workloads")
-        return [(e["name"], e["id"]) for e in response["data"]]
+        return list(self.iter_workloads())
+
+    def iter_inventory(self, clusters=None, workers=4, view=False):
+        """Yield every workload of `clusters` (all of them by default).
+
+        Projects and their workloads are fetched concurrently, by at most
+        `workers` threads per cluster, and yielded as soon as each page is
+        read, as `(cluster, project, workload, exception)` tuples of raw
+        documents. When a collection cannot be read `workload` is None and
+        `exception` is set (`project` too is None if the cluster failed).
+        With `view` workloads are `WorkloadView`, to keep many of them.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if clusters is None:
+            clusters = list(self.iter_clusters(raw=True))
+        results = queue.Queue()
+        stop = threading.Event()
+        futures = []
+        executors = [ThreadPoolExecutor(max_workers=max(1, workers)) for __ in clusters]
+        try:
+            for executor, cluster in zip(executors, clusters):
+                futures.append(
+                    executor.submit(
+                        self._crawl_cluster,
+                        executor,
+                        futures,
+                        cluster,
+                        results,
+                        stop,
+                        view,
+                    )
+                )
+            pending = len(clusters)
+            while pending:
+                item = results.get()
+                if item is _TASK_DONE:
+                    pending -= 1
+                elif item is _TASK_SPAWNED:
+                    pending += 1
+                else:
+                    yield item
+        finally:
+            # the consumer may stop early: drop the tasks not started yet
+            stop.set()
+            for future in tuple(futures):
+                future.cancel()
+            for executor in executors:
+                executor.shutdown(wait=True)
+
+    def _crawl_cluster(self, executor, futures, cluster, results, stop, view):
+        try:
+            for project in self.iter_projects(cluster["id"], raw=True):
+                if stop.is_set():
+                    break
+                results.put(_TASK_SPAWNED)
+                futures.append(
+                    executor.submit(
+                        self._crawl_project, cluster, project, results, stop, view
+                    )
+                )
+        except Exception as e:
+            results.put((cluster, None, None, e))
+        finally:
+            results.put(_TASK_DONE)
+
+    def _crawl_project(self, cluster, project, results, stop, view):
+        try:
+            if stop.is_set():
+                return
+            __, project_id = project["id"].split(":")
+            workloads = self.iter_workloads(
+                cluster["id"], project_id, raw=True, view=view
+            )
+            for w in workloads:
+                if stop.is_set():
+                    break
+                results.put((cluster, project, w, None))
+        except Exception as e:
+            results.put((cluster, project, None, e))
+        finally:
+            results.put(_TASK_DONE)
 
     def get_workload(self, name):
         response = self.get(f"/projects/{self.cluster}:{self.project}/workloads/{name}")
         return response
 
     def get_env(self, workload):
+        return self._extract_env(self.get_workload(workload))
+
+    def set_env(self, workload, **kwargs):
+        """Set the `kwargs` variables; no PUT is made if all already match."""
         info = self.get_workload(workload)
-        ret = {}
-        if "containers" in info:
-            for pod in info["containers"]:
-                ret[pod["name"]] = {}
-                if "env" in pod:
-                    ret[pod["name"]] = pod["env"]
-        return ret
+        updated, changes = self._diff(info, env=kwargs)
+        if not changes:
+            return info
+        return self.put(self._workload_url(workload), data=updated)
 
-    def _merge_env(self, current, **updates):
-        for entry in current:
-            if entry["name"] in updates.keys():
-                entry["value"] = updates.pop(entry["name"])
+    def diff(
+        self, workload, image=None, env=None, current=None, cluster=None, project=None
+    ):
+        """Changes that `upgrade(workload, image, env)` would make.
 
-        current.extend([
-            {"name": k, "type": "/v3/project/schemas/envVar", "value": v}
-            for k, v in updates.items()
-        ])
-        return current
+        Returns the current workload document (fetched unless given as
+        `current`) and the list of `Change`, without writing anything.
+        """
+        url = self._workload_url(workload, cluster, project)
+        current = current or self.get(url)
+        return current, self._diff(current or {}, image, env)[1]
 
-    def set_env(self, workload, **kwargs):
-        url = f"/project/{self.cluster}:{self.project}/workloads/{workload.id}"
-        info = self.get_workload(workload)
-        if "containers" in info:
-            for pod in info["containers"]:
-                if "env" in pod:
-                    self._merge_env(pod["env"], **kwargs)
-        return self.put(url, data=info)
+    def upgrade(
+        self, workload, image, env=None, current=None, cluster=None, project=None
+    ):
+        """Set `image` (and `env`) to all the containers of `workload`.
 
-    def upgrade(self, workload, image, env=None):
-        url = f"/project/{self.cluster}:{self.project}/workloads/{workload.id}"
-        response = self.get(url)
+        Returns the workload as returned by the PUT. If the current workload
+        document is already known it can be passed as `current` to skip the
+        initial GET; if Rancher reports a conflict the workload is fetched
+        again and the update retried once. When nothing would change no PUT
+        is made and the current document is returned. `image` can be None to
+        only update `env`. `cluster` and `project` default to the client ones.
+        """
+        url = self._workload_url(workload, cluster, project)
+        response = current or self.get(url)
         if not response:
             return
-        json = response.copy()
-        found = set()
-        if env:
-            environment = [
-                {"name": k, "type": "/v3/project/schemas/envVar", "value": v}
-                for k, v in dict(env).items()
-            ]
-            if "containers" in response:
-                for pod in json["containers"]:
-                    found.add(pod["image"])
-                    pod["image"] = image.id
-                    if "env" in pod:
-                        self._merge_env(pod["env"], **dict(env))
-                    else:
-                        pod["env"] = environment
-
-        return self.put(url, data=json)
+        try:
+            return self._put_changes(url, response, image, env)
+        except HttpError as e:
+            if current is None or not self._is_conflict(e):
+                raise
+        return self._put_changes(url, self.get(url), image, env)
+
+    def _put_changes(self, url, current, image, env):
+        updated, changes = self._diff(current, image, env)
+        if not changes:
+            return current
+        return self.put(url, data=updated)
+
+    @property
+    def server_url(self):
+        return f"{self.scheme}://{self.host}:{self.port}"
+
+    def wait_rollout(self, workload, timeout=300):
+        """Wait for `workload` rollout to complete and return the seconds it took.
+
+        Changes are tracked with the Kubernetes watch API proxied by Rancher;
+        if it is not available the workload is polled with exponential backoff.
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+        ready = self._watch_rollout(workload, deadline)
+        if ready is None:
+            ready = self._poll_rollout(workload, deadline)
+        if not ready:
+            raise RolloutTimeout(workload.id, timeout)
+        return time.monotonic() - start
+
+    def _watch_rollout(self, workload, deadline):
+        """Returns None if the watch stream cannot be opened."""
+        if workload.type not in K8S_RESOURCES:
+            return None
+        group, resource = K8S_RESOURCES[workload.type]
+        url = (
+            f"{self.server_url}/k8s/clusters/{self.cluster}/apis/{group}"
+            f"/namespaces/{workload.namespace}/{resource}"
+        )
+        while time.monotonic() < deadline:
+            remaining = deadline - time.monotonic()
+            params = {
+                "watch": "1",
+                "fieldSelector": f"metadata.name={workload.name}",
+                "timeoutSeconds": int(remaining) + 1,
+            }
+            if self.debug:
+                print(f"DEBUG: - watch {url}")
+            try:
+                response = self.session.get(
+                    url,
+                    params=params,
+                    stream=True,
+                    timeout=(10, remaining + 5),
+                    verify=self.verify,
+                )
+            except Exception:
+                return None
+            with response:
+                if response.status_code != 200:
+                    return None
+                ready = self._read_watch(response, deadline)
+            if ready is not False:
+                return ready
+        return False
+
+    def _read_watch(self, response, deadline):
+        """Read the events of a watch stream until the rollout completes.
+
+        Returns True when it does, None on error or unexpected events (the
+        caller falls back to polling) and False if the stream ended first.
+        """
+        try:
+            for line in response.iter_lines():
+                if line:
+                    ready = watch_event_ready(loads(line))
+                    if ready is not False:
+                        return ready
+                if time.monotonic() >= deadline:
+                    break
+        except (KeyError, ValueError):
+            return None
+        except RequestException:
+            # stream interrupted: watch again while time is left
+            pass
+        return False
+
+    def _poll_rollout(self, workload, deadline):
+        for delay in backoff():
+            if rancher_ready(self.get_workload(workload)):
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+
+    def _resolve_name(self, kind, name, url):
+        if self.name_cache:
+            value = self.name_cache.get(url, name)
+            if value:
+                return value
+        names = {e["name"]: e["id"] for e in self.get(url)["data"]}
+        if self.name_cache:
+            self.name_cache.update(url, names)
+        if name not in names:
+            raise InvalidName(f"Invalid {kind} name '{name}'")
+        return names[name]
 
     def _get_cluster_id_by_name(self, name):
-        res = self.get("/clusters")
-        for entry in res["data"]:
-            if entry["name"] == name:
-                return entry["id"]
-        raise InvalidName(f"Invalid cluster name '{name}'")
+        if self.index is not None:
+            found = self.index.find_cluster(name)
+            if found:
+                return found
+        return self._resolve_name("cluster", name, "/clusters")
 
     def _get_project_id_by_name(self, name):
-        res = self.get(f"/clusters/{self.cluster}/projects")
-        for entry in res["data"]:
-            if entry["name"] == name:
-                return entry["id"].split(":")[1]
-        raise InvalidName(f"Invalid project name '{name}'")
+        if self.index is not None:
+            found = self.index.find_project(self.cluster, name)
+            if found:
+                return found.split(":")[-1]
+        url = f"/clusters/{self.cluster}/projects"
+        return self._resolve_name("project", name, url).split(":")[1]
 
     def _get_workload_id_by_name(self, project, name):
-        response = self.get(f"/projects/{self.cluster}:{self.project}/workloads")
-        for workload in response["data"]:
-            if workload["name"] == name[-1]:
-                return workload["id"].split(":")
+        """Id of workload `[namespace:]name` split on ':'.
+
+        Looked up in the local index if any, otherwise filtered server side.
+        """
+        *namespace, workload = name
+        namespace = namespace[-1] if namespace else None
+        project = project or self.project
+        project_id = project if ":" in project else f"{self.cluster}:{project}"
+        if self.index is not None:
+            found = self.index.find_workload(project_id, workload, namespace)
+            if found:
+                return found.split(":")
+        filters = {"name": workload}
+        if namespace:
+            filters["namespaceId"] = namespace
+        cluster_id, project = project_id.split(":")
+        for entry in self.iter_workloads(cluster_id, project, **filters):
+            if entry.name == workload:
+                return entry.id.split(":")
         raise InvalidName(f"Invalid workload name '{':'.join(name)}'")
 
 
-# class DockerClient(HttpClient):
-#     def __init__(self, base_url, *, username=None, password=None, **kwargs) -> None:
-#         super().__init__(base_url, **kwargs)
-#         self.username = username
-#         self.password = password
-#
-#     def __repr__(self):
-#         return f"<DockerClient {self.base_url}>"
-#
-#     def exists(self, image):
-#         try:
-#             self.get(f"/repositories/{image.image}/tags/{image.tag}/")
-#             return True
-#         except HttpError:
-#             return False
-#
-    # def login(self):
-    #     url = "/users/login/"
-    #     self.post(
-    #         url,
-    #         json={"username": self.username, "password": self.password},
-    #         ignore_error=True,
-    #     )
-    #     response = self.history[-1]
-    #     if response.status_code == 400:
-    #         raise InvalidCredentials(url, response)
-    #     self.token = response.json()["token"]
-    #     return self.token
-    #
-    # def get_tags(self, image, filter=".*", max_pages=None):
-    #     ret = []
-    #     url = f"/repositories/{image.image}/tags/"
-    #     rex = re.compile(filter)
-    #     page = 1
-    #     while url:
-    #         response = self.get(url)
-    #         for e in response["results"]:
-    #             if rex.search(e["name"]):
-    #                 yield e
-    #         if max_pages and page > max_pages:
-    #             break
-    #         url = response["next"]
-    #     return sorted(ret)
-#
-
-def handle_lazo_error(func):
-    @wraps(func)
-    def inner(*args, **kwargs):
-        try:
-            return func(*args, **kwargs)
-        except ServerSSLError as e:
-            fail(e)
-        except UsageError as e:
-            error(e)
-        except HttpError as e:
-            data = e.response.json()
-            error(e.url)
-            jprint(data)
-        except LazoError as e:
-            error(str(e))
-        except ServerConnectionError as e:
-            error(str(e))
-            error(str(e.reason))
-
-    return inner
+DOCKER_HUB = frozenset(["hub.docker.com", "docker.io", "index.docker.io"])
+
+
+def registry_url(image):
+    """Base url of the registry hosting `image` (Docker Hub by default)."""
+    if image.repo in DOCKER_HUB:
+        return "https://registry-1.docker.io"
+    return f"https://{image.repo}"
+
+
+class DockerClient(HttpClient):
+    """Client of a Docker registry (HTTP API v2).
+
+    Registries answer unauthenticated requests with a `WWW-Authenticate`
+    challenge: `Bearer` tokens are requested to the advertised realm (with
+    `auth` credentials, if any) and cached per scope until they expire,
+    `Basic` registries get the credentials directly. `exists()` results are
+    cached for `cache_ttl` seconds.
+    """
+
+    manifest_types = ", ".join(
+        [
+            "application/vnd.oci.image.index.v1+json",
+            "application/vnd.oci.image.manifest.v1+json",
+            "application/vnd.docker.distribution.manifest.list.v2+json",
+            "application/vnd.docker.distribution.manifest.v2+json",
+        ]
+    )
+
+    def __init__(self, base_url, *, auth=None, cache_ttl=60, **kwargs):
+        kwargs.setdefault("debug", False)
+        kwargs.setdefault("http_cache", None)
+        # credentials are only sent as the registry asks for them
+        super().__init__(base_url.rstrip("/"), **kwargs)
+        self.credentials = auth
+        self.cache_ttl = cache_ttl
+        self._tokens = {}
+        self._exists = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<DockerClient {self.base_url}>"
+
+    @staticmethod
+    def repository(image):
+        return f"{image.account}/{image.image}"
+
+    def _basic(self):
+        if self.credentials is None:
+            return {}
+        user, password = self.credentials.username, self.credentials.password
+        token = b64encode(f"{user}:{password}".encode("utf8")).decode("ascii")
+        return {"Authorization": f"Basic {token}"}
+
+    def login(self, challenge, scope):
+        """Return the headers answering the `WWW-Authenticate` `challenge`."""
+        kind, __, params = (challenge or "").partition(" ")
+        if kind.lower() != "bearer":
+            return self._basic()
+        params = dict(re.findall(r'(\w+)="([^"]*)"', params))
+        with self._lock:
+            token, expires = self._tokens.get(scope, (None, 0))
+        if expires < time.monotonic():
+            response = self.get(
+                params["realm"],
+                params={"service": params.get("service"), "scope": scope},
+                headers=self._basic(),
+            )
+            token = response.get("token") or response.get("access_token")
+            expires = time.monotonic() + response.get("expires_in", 60) - 5
+            with self._lock:
+                self._tokens[scope] = (token, expires)
+        return {"Authorization": f"Bearer {token}"}
+
+    def _authorized(self, cmd, url, scope, headers=None, **kwargs):
+        """Request `url`, authenticating if the registry asks to."""
+        headers = dict(headers or {})
+        with self._lock:
+            token, expires = self._tokens.get(scope, (None, 0))
+        if token and expires > time.monotonic():
+            headers["Authorization"] = f"Bearer {token}"
+        response = self._r(
+            cmd, url, raw=True, ignore_error=True, headers=headers, **kwargs
+        )
+        if response.status_code == 401:
+            challenge = response.headers.get("WWW-Authenticate")
+            headers.update(self.login(challenge, scope))
+            response = self._r(
+                cmd, url, raw=True, ignore_error=True, headers=headers, **kwargs
+            )
+        if response.status_code == 401:
+            raise InvalidCredentials(url, response)
+        return response
+
+    def exists(self, image):
+        """True if `image` (its tag) is in the registry."""
+        with self._lock:
+            found, expires = self._exists.get(image.id, (None, 0))
+        if expires > time.monotonic():
+            return found
+        name = self.repository(image)
+        url = f"/v2/{name}/manifests/{image.tag}"
+        response = self._authorized(
+            "head", url, f"repository:{name}:pull", {"Accept": self.manifest_types}
+        )
+        if response.status_code not in (200, 404):
+            raise http_error(url, response)
+        found = response.status_code == 200
+        with self._lock:
+            self._exists[image.id] = (found, time.monotonic() + self.cache_ttl)
+        return found
+
+    def get_tags(self, image, filter=".*", max_pages=None):
+        """Yield the tags of the repository of `image` matching `filter`."""
+        name = self.repository(image)
+        url = f"/v2/{name}/tags/list"
+        rex = re.compile(filter)
+        params = {"n": 100}
+        page = 0
+        while url:
+            response = self._authorized(
+                "get", url, f"repository:{name}:pull", params=params
+            )
+            if response.status_code != 200:
+                raise http_error(url, response)
+            for tag in loads(response.content).get("tags") or []:
+                if rex.search(tag):
+                    yield tag
+            page += 1
+            if max_pages and page >= max_pages:
+                break
+            url, params = response.links.get("next", {}).get("url"), None
+
+
+class ImageChecker:
+    """Check concurrently that images exist, with a `DockerClient` per registry.
+
+    `registry` overrides the registry of all the images. Clients are kept,
+    so their tokens, existence cache and connections are reused.
+    """
+
+    def __init__(self, registry=None, auth=None, workers=8, **kwargs):
+        self.registry = registry
+        self.auth = auth
+        self.workers = workers
+        self.kwargs = kwargs
+        self.clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, image):
+        url = self.registry or registry_url(image)
+        with self._lock:
+            if url not in self.clients:
+                self.clients[url] = DockerClient(url, auth=self.auth, **self.kwargs)
+            return self.clients[url]
+
+    def check(self, images):
+        """Yield `(image, exists, exception)` for each distinct image."""
+        from .utils import run_parallel
+
+        unique = list({image.id: image for image in images}.values())
+
+        def exists(image):
+            return self.client(image).exists(image)
+
+        return run_parallel(exists, unique, self.workers)
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
@@ -0,0 +1,90 @@
+"""JSON encoding and decoding of request and response bodies.
+
+The fastest available backend is used: orjson, msgspec or the standard
+library `json` module. `LAZO_JSON=json|orjson|msgspec` forces one of them.
+Documents are decoded straight from the response bytes and encoded to
+compact bytes; decoding errors are always raised as `ValueError`.
+"""
+import json
+import os
+
+ORDER = ["orjson", "msgspec", "json"]
+
+
+class JsonCodec:
+    name = "json"
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(",", ":")).encode("utf8")
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self.loads = orjson.loads
+        self.dumps = orjson.dumps
+
+
+class MsgspecCodec(JsonCodec):
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+
+        self._decode = msgspec.json.Decoder().decode
+        self._error = msgspec.DecodeError
+        self.dumps = msgspec.json.Encoder().encode
+
+    def loads(self, data):
+        try:
+            return self._decode(data)
+        except self._error as e:
+            raise ValueError(str(e)) from e
+
+
+CODECS = {"json": JsonCodec, "orjson": OrjsonCodec, "msgspec": MsgspecCodec}
+
+_codec = None
+
+
+def available():
+    """Names of the installed backends, fastest first."""
+    ret = []
+    for name in ORDER:
+        try:
+            CODECS[name]()
+        except ImportError:
+            continue
+        ret.append(name)
+    return ret
+
+
+def use(name=None):
+    """Select the backend `name` (default: `LAZO_JSON` or the fastest one)."""
+    global _codec
+    name = name or os.environ.get("LAZO_JSON")
+    if name:
+        _codec = CODECS[name]()
+    else:
+        _codec = CODECS[available()[0]]()
+    return _codec
+
+
+def get_codec():
+    return _codec or use()
+
+
+def loads(data):
+    """Decode a JSON document from bytes (or str)."""
+    return (_codec or use()).loads(data)
+
+
+def dumps(obj):
+    """Encode `obj` as compact JSON bytes."""
+    return (_codec or use()).dumps(obj)
@@ -1,5 +1,10 @@
+from functools import wraps
+
 from click import BadParameter, UsageError
 
+from .out import error, fail
+from .utils import jprint
+
 
 class LazoError(Exception):
     pass
@@ -14,6 +19,11 @@ class ServerConnectionError(LazoError):
         return f"{self.url}. {str(self.reason or '')}"
 
 
+class CircuitOpen(ServerConnectionError):
+    def __str__(self):
+        return f"{self.url}. Server unavailable, too many consecutive failures"
+
+
 class ServerSSLError(ServerConnectionError):
     def __str__(self):
         return "Certificate verify failed. Try to use --insecure"
@@ -37,6 +47,23 @@ class EmptyResponse(LazoError):
         return f"Empty Response: {self.message}"
 
 
+class RolloutTimeout(LazoError):
+    def __init__(self, workload, timeout):
+        self.workload = workload
+        self.timeout = timeout
+
+    def __str__(self):
+        return f"'{self.workload}' not ready after {self.timeout} seconds"
+
+
+class InvalidManifest(LazoError):
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return f"Invalid manifest: {self.message}"
+
+
 class Http404(HttpError):
     pass
 
@@ -52,6 +79,12 @@ class InvalidCredentials(HttpError):
         return "Invalid credential"
 
 
+def http_error(url, response, exc=None):
+    """Return the HttpError subclass matching `response` status code."""
+    klass = {401: InvalidCredentials, 404: Http404}.get(response.status_code, HttpError)
+    return klass(url, response, exc)
+
+
 class RequiredParameter(UsageError):
     pass
 
@@ -63,3 +96,25 @@ class ExBadParameter(BadParameter):
 
 class ObjectNotFound(Exception):
     pass
+
+
+def handle_lazo_error(func):
+    @wraps(func)
+    def inner(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except ServerSSLError as e:
+            fail(e)
+        except UsageError as e:
+            error(e)
+        except HttpError as e:
+            data = e.response.json()
+            error(e.url)
+            jprint(data)
+        except LazoError as e:
+            error(str(e))
+        except ServerConnectionError as e:
+            error(str(e))
+            error(str(e.reason))
+
+    return inner
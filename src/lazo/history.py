@@ -0,0 +1,90 @@
+import threading
+from collections import deque
+
+
+class RequestRecord:
+    __slots__ = (
+        "method",
+        "url",
+        "status",
+        "latency",
+        "request_size",
+        "response_size",
+        "body",
+    )
+
+    def __init__(
+        self, method, url, status, latency, request_size, response_size, body=None
+    ):
+        self.method = method
+        self.url = url
+        self.status = status
+        self.latency = latency
+        self.request_size = request_size
+        self.response_size = response_size
+        self.body = body
+
+    def __repr__(self):
+        return f"<RequestRecord {self.method.upper()} {self.url} {self.status}>"
+
+
+class History:
+    """Last `size` requests made by a client, plus totals since its creation.
+
+    Response bodies are retained only with `keep_body=True`.
+    """
+
+    def __init__(self, size=100, keep_body=False):
+        self.keep_body = keep_body
+        self._records = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.total_latency = 0.0
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(list(self._records))
+
+    def __getitem__(self, index):
+        return self._records[index]
+
+    def add(
+        self, method, url, status, latency, request_size=0, response_size=0, body=None
+    ):
+        record = RequestRecord(
+            method,
+            url,
+            status,
+            latency,
+            request_size,
+            response_size,
+            body if self.keep_body else None,
+        )
+        with self._lock:
+            self._records.append(record)
+            self.requests += 1
+            if status is None or status >= 400:
+                self.errors += 1
+            self.bytes_sent += request_size
+            self.bytes_received += response_size
+            self.total_latency += latency
+        return record
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "total_latency": self.total_latency,
+                "avg_latency": self.total_latency / self.requests
+                if self.requests
+                else 0.0,
+            }
@@ -0,0 +1,257 @@
+import os
+import sqlite3
+import threading
+import time
+
+from .cache import cache_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clusters (
+    base_url TEXT, id TEXT, name TEXT, refreshed REAL,
+    PRIMARY KEY (base_url, id)
+);
+CREATE INDEX IF NOT EXISTS clusters_name ON clusters (base_url, name);
+CREATE TABLE IF NOT EXISTS projects (
+    base_url TEXT, id TEXT, cluster_id TEXT, name TEXT, refreshed REAL,
+    PRIMARY KEY (base_url, id)
+);
+CREATE INDEX IF NOT EXISTS projects_name ON projects (base_url, name);
+CREATE TABLE IF NOT EXISTS workloads (
+    base_url TEXT, project_id TEXT, id TEXT, name TEXT, namespace TEXT, state TEXT,
+    PRIMARY KEY (base_url, project_id, id)
+);
+CREATE INDEX IF NOT EXISTS workloads_name ON workloads (name);
+CREATE INDEX IF NOT EXISTS workloads_namespace ON workloads (namespace);
+CREATE TABLE IF NOT EXISTS images (
+    base_url TEXT, project_id TEXT, workload_id TEXT, image TEXT
+);
+CREATE INDEX IF NOT EXISTS images_image ON images (image);
+CREATE INDEX IF NOT EXISTS images_workload ON images (base_url, project_id);
+CREATE TABLE IF NOT EXISTS env (
+    base_url TEXT, project_id TEXT, workload_id TEXT, name TEXT
+);
+CREATE INDEX IF NOT EXISTS env_name ON env (name);
+CREATE INDEX IF NOT EXISTS env_workload ON env (base_url, project_id);
+"""
+
+# tables holding rows of a single project
+PROJECT_TABLES = ["workloads", "images", "env"]
+
+
+class IndexRecord:
+    __slots__ = (
+        "cluster",
+        "project",
+        "project_id",
+        "id",
+        "name",
+        "namespace",
+        "images",
+    )
+
+    def __init__(self, cluster, project, project_id, id, name, namespace, images):
+        self.cluster = cluster
+        self.project = project
+        self.project_id = project_id
+        self.id = id
+        self.name = name
+        self.namespace = namespace
+        self.images = images.split("\n") if images else []
+
+    def __repr__(self):
+        return f"<IndexRecord {self.project_id} {self.id}>"
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+def _workload_row(doc):
+    """The indexed fields of a workload document."""
+    containers = doc.get("containers", [])
+    images = {c["image"] for c in containers if c.get("image")}
+    env = {e["name"] for c in containers for e in c.get("env") or [] if e.get("name")}
+    return doc["id"], doc["name"], doc.get("namespaceId"), doc.get("state"), images, env
+
+
+class Index:
+    """Local SQLite index of the clusters, projects and workloads of a server.
+
+    Workloads are stored with their images and environment variable names
+    (values are never stored). `refresh()` replaces the rows of each project
+    read from the server, keeping those of projects that could not be read.
+    Searches accept `*`/`?` wildcards and use the indexed columns.
+    """
+
+    filename = "index.sqlite3"
+
+    def __init__(self, base_url, path=None):
+        self.base_url = base_url
+        self.path = path or os.path.join(cache_dir(), self.filename)
+        self._local = threading.local()
+
+    def __repr__(self):
+        return f"<Index {self.path}>"
+
+    @property
+    def db(self):
+        # sqlite connections cannot be shared by threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path)
+            db.executescript(SCHEMA)
+            self._local.db = db
+        return db
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    @property
+    def refreshed(self):
+        """Time of the oldest refresh of the indexed projects, or None."""
+        row = self.db.execute(
+            "SELECT COUNT(*), MIN(refreshed) FROM projects WHERE base_url = ?",
+            (self.base_url,),
+        ).fetchone()
+        return row[1] if row[0] else None
+
+    def is_stale(self, max_age):
+        refreshed = self.refreshed
+        return refreshed is None or time.time() - refreshed > max_age
+
+    def refresh(self, client, clusters=None, workers=4):
+        """Index the workloads of `clusters` (all by default).
+
+        Returns the number of errors met reading the server.
+        """
+        if clusters is None:
+            clusters = list(client.iter_clusters(raw=True))
+        projects, workloads, failed = {}, {}, set()
+        for cluster, project, doc, exc in client.iter_inventory(clusters, workers):
+            if exc is not None:
+                failed.add(project["id"] if project else cluster["id"])
+                continue
+            projects[project["id"]] = (cluster["id"], project["name"])
+            workloads.setdefault(project["id"], []).append(_workload_row(doc))
+        now = time.time()
+        with self.db as db:
+            for cluster in clusters:
+                db.execute(
+                    "INSERT OR REPLACE INTO clusters VALUES (?, ?, ?, ?)",
+                    (self.base_url, cluster["id"], cluster["name"], now),
+                )
+                if cluster["id"] not in failed:
+                    self._remove_missing(db, cluster["id"], set(projects) | failed)
+            for project_id, (cluster_id, name) in projects.items():
+                db.execute(
+                    "INSERT OR REPLACE INTO projects VALUES (?, ?, ?, ?, ?)",
+                    (self.base_url, project_id, cluster_id, name, now),
+                )
+                self._replace_project(db, project_id, workloads[project_id])
+        return len(failed)
+
+    def _remove_missing(self, db, cluster_id, keep):
+        rows = db.execute(
+            "SELECT id FROM projects WHERE base_url = ? AND cluster_id = ?",
+            (self.base_url, cluster_id),
+        ).fetchall()
+        for (project_id,) in rows:
+            if project_id not in keep:
+                db.execute(
+                    "DELETE FROM projects WHERE base_url = ? AND id = ?",
+                    (self.base_url, project_id),
+                )
+                self._replace_project(db, project_id, [])
+
+    def _replace_project(self, db, project_id, rows):
+        for table in PROJECT_TABLES:
+            db.execute(
+                f"DELETE FROM {table} WHERE base_url = ? AND project_id = ?",
+                (self.base_url, project_id),
+            )
+        key = (self.base_url, project_id)
+        for id, name, namespace, state, images, env in rows:
+            db.execute(
+                "INSERT OR REPLACE INTO workloads VALUES (?, ?, ?, ?, ?, ?)",
+                key + (id, name, namespace, state),
+            )
+            db.executemany(
+                "INSERT INTO images VALUES (?, ?, ?, ?)",
+                [key + (id, image) for image in images],
+            )
+            db.executemany(
+                "INSERT INTO env VALUES (?, ?, ?, ?)",
+                [key + (id, env_name) for env_name in env],
+            )
+
+    def search(self, name=None, image=None, namespace=None, env=None, project=None):
+        """Workloads matching all the given (glob) patterns, as `IndexRecord`."""
+        where, params = ["w.base_url = ?"], [self.base_url]
+        if name:
+            where.append("w.name GLOB ?")
+            params.append(name)
+        if namespace:
+            where.append("w.namespace GLOB ?")
+            params.append(namespace)
+        if project:
+            where.append("w.project_id = ?")
+            params.append(project)
+        for table, column, value in [("images", "image", image), ("env", "name", env)]:
+            if value:
+                where.append(
+                    f"EXISTS (SELECT 1 FROM {table} t WHERE t.base_url = w.base_url "
+                    f"AND t.project_id = w.project_id AND t.workload_id = w.id "
+                    f"AND t.{column} GLOB ?)"
+                )
+                params.append(value)
+        sql = f"""
+            SELECT c.name, p.name, w.project_id, w.id, w.name, w.namespace,
+                   (SELECT GROUP_CONCAT(i.image, char(10)) FROM images i
+                    WHERE i.base_url = w.base_url AND i.project_id = w.project_id
+                    AND i.workload_id = w.id)
+            FROM workloads w
+            JOIN projects p ON p.base_url = w.base_url AND p.id = w.project_id
+            LEFT JOIN clusters c ON c.base_url = p.base_url AND c.id = p.cluster_id
+            WHERE {" AND ".join(where)}
+            ORDER BY c.name, p.name, w.namespace, w.name
+        """
+        return [IndexRecord(*row) for row in self.db.execute(sql, params)]
+
+    def find_cluster(self, name):
+        """Id of cluster `name`, or None."""
+        row = self.db.execute(
+            "SELECT id FROM clusters WHERE base_url = ? AND name = ?",
+            (self.base_url, name),
+        ).fetchone()
+        return row[0] if row else None
+
+    def find_project(self, cluster_id, name):
+        """Id ('cluster:project') of project `name` of `cluster_id`, or None."""
+        row = self.db.execute(
+            "SELECT id FROM projects WHERE base_url = ? AND cluster_id = ? AND name = ?",
+            (self.base_url, cluster_id, name),
+        ).fetchone()
+        return row[0] if row else None
+
+    def find_workload(self, project_id, name, namespace=None):
+        """Id of workload `name` of `project_id` ('cluster:project'), or None."""
+        sql = "SELECT id FROM workloads WHERE base_url = ? AND project_id = ? AND name = ?"
+        params = [self.base_url, project_id, name]
+        if namespace:
+            sql += " AND namespace = ?"
+            params.append(namespace)
+        row = self.db.execute(sql, params).fetchone()
+        return row[0] if row else None
+
+    def clear(self):
+        with self.db as db:
+            for table in ["clusters", "projects"] + PROJECT_TABLES:
+                db.execute(f"DELETE FROM {table} WHERE base_url = ?", (self.base_url,))
+
+    def clear_all(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
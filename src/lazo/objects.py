@@ -1,4 +1,40 @@
+import sys
+from collections import namedtuple
+
+from .codec import dumps, loads
+
+# lightweight (name, id) record yielded by RancherClient.iter_* methods
+Entry = namedtuple("Entry", ["name", "id"])
+
+
+class Change(namedtuple("Change", ["container", "field", "name", "old", "new"])):
+    """A value of a workload container changed by an update.
+
+    `field` is 'image' or 'env'; `name` is the variable name for 'env'
+    and `old` is None for variables not yet set.
+    """
+
+    __slots__ = ()
+
+    def __str__(self):
+        old = "(unset)" if self.old is None else self.old
+        if self.field == "env":
+            return f"{self.container}: env {self.name}: {old} -> {self.new}"
+        return f"{self.container}: {self.field} {old} -> {self.new}"
+
+
+# strategies of RancherClient.get_pod()
+POD_SELECTIONS = ("ready", "least-restarted")
+
+
+def _intern(value):
+    """Share one copy of the (few distinct) type/namespace/state/image strings."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 class RancherWorkload:
+    __slots__ = ("type", "namespace", "name", "id")
+
     def __init__(self, value):
         parts = value.split(":")
         if len(parts) == 3:
@@ -8,23 +44,112 @@ class RancherWorkload:
             self.namespace, self.name = parts
         else:
             raise Exception("Invalid workload")
+        self.type = _intern(self.type)
+        self.namespace = _intern(self.namespace)
         self.id = ":".join([self.type, self.namespace, self.name])
 
     def __repr__(self):
         return self.id
 
+    def __eq__(self, other):
+        return isinstance(other, RancherWorkload) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
 
 class RancherPod:
+    __slots__ = ("workload", "id", "name", "state", "restarts", "ready")
+
     def __init__(self, values):
-        self.workload = RancherWorkload(values["workloadId"])
+        workload = values.get("workloadId")
+        self.workload = RancherWorkload(workload) if workload else None
         self.id = values["id"]
         self.name = self.id.split(":")[1]
+        self.state = _intern(values.get("state"))
+        containers = values.get("containers") or []
+        self.restarts = sum(c.get("restartCount", 0) for c in containers)
+        self.ready = all(
+            [
+                self.state == "running",
+                values.get("transitioning") != "yes",
+                all(c.get("state", "running") == "running" for c in containers),
+            ]
+        )
 
     def __repr__(self):
         return self.id
 
 
+class WorkloadView:
+    """Compact read-only view of a workload document.
+
+    For callers keeping many workloads in memory. The fields used to list
+    and filter workloads, images included, are attributes with the repeated
+    strings interned; the rest of the document is kept as compact JSON and
+    decoded, once per read, by `doc`, `containers`, `env` and `endpoints`.
+    """
+
+    __slots__ = (
+        "id",
+        "name",
+        "type",
+        "namespace",
+        "state",
+        "scale",
+        "project_id",
+        "_images",
+        "_raw",
+    )
+
+    def __init__(self, doc, project_id=None):
+        self.id = doc["id"]
+        self.name = doc.get("name")
+        self.type = _intern(doc.get("type") or self.id.split(":")[0])
+        self.namespace = _intern(doc.get("namespaceId"))
+        self.state = _intern(doc.get("state"))
+        self.scale = doc.get("scale")
+        self.project_id = _intern(project_id or doc.get("projectId"))
+        containers = doc.get("containers") or []
+        self._images = tuple(_intern(c.get("image")) for c in containers)
+        # copied: fast encoders can return bytes over-allocated for speed
+        self._raw = memoryview(dumps(doc)).tobytes()
+
+    def __repr__(self):
+        return f"<WorkloadView {self.id}>"
+
+    @property
+    def doc(self):
+        return loads(self._raw)
+
+    @property
+    def workload(self):
+        return RancherWorkload(self.id)
+
+    @property
+    def containers(self):
+        return self.doc.get("containers") or []
+
+    @property
+    def images(self):
+        return list(self._images)
+
+    @property
+    def env(self):
+        """`{container name: {variable: value}}`"""
+        return {
+            c.get("name"): {e["name"]: e.get("value") for e in c.get("env") or []}
+            for c in self.containers
+        }
+
+    @property
+    def endpoints(self):
+        return self.doc.get("publicEndpoints") or []
+
+
 class DockerImage:
+    __slots__ = ("repo", "account", "image", "tag", "id")
+
     def __init__(self, value, partial=False):
         parts = value.split(":")
         self.repo = "hub.docker.com"
@@ -42,7 +167,11 @@ class DockerImage:
         elif len(parts) == 2:
             self.account, self.image = parts
         else:
-            raise ValueError(f"Invalid docker image {value}. It must be repository/imagename")
+            raise ValueError(
+                f"Invalid docker image {value}. It must be repository/imagename"
+            )
+        self.repo = _intern(self.repo)
+        self.account = _intern(self.account)
         # self.account = parts[0]
         # self.image= "/".join(parts[1:])
 
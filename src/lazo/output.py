@@ -0,0 +1,127 @@
+import json
+import sys
+
+import click
+
+from .codec import dumps
+
+FORMATS = ["json", "ndjson", "yaml", "table"]
+
+
+def isatty(stream):
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"))
+    return str(value)
+
+
+class Output:
+    """Write documents to `stream` (stdout) in one of `FORMATS`.
+
+    With `many=True` the items of a collection are written one at a time
+    with `write()`, as soon as they are available, and `close()` must be
+    called after the last one:
+
+    - json: a single document, or an array of items. Indented and colorized
+      on a terminal, compact otherwise
+    - ndjson: one compact document per line
+    - yaml: one yaml document each, separated by `---`
+    - table: one row per item, `columns` (default: keys of the first one)
+      padded to the width of the first row. A single document is written
+      as key/value rows
+    """
+
+    def __init__(self, fmt="json", stream=None, colors=None, columns=None, many=False):
+        if fmt not in FORMATS:
+            raise ValueError(f"Invalid output format '{fmt}'")
+        self.fmt = fmt
+        self.stream = stream or sys.stdout
+        self.tty = isatty(self.stream)
+        self.colors = self.tty if colors is None else colors
+        self.columns = columns
+        self.many = many
+        self._widths = None
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _emit(self, text):
+        self.stream.write(text)
+        self.stream.flush()
+
+    def _json(self, obj):
+        if not self.tty:
+            return dumps(obj).decode("utf8")
+        text = json.dumps(obj, sort_keys=True, indent=4)
+        if self.colors:
+            from pygments import highlight
+            from pygments.formatters.terminal import TerminalFormatter
+            from pygments.lexers.data import JsonLexer
+
+            text = highlight(text, JsonLexer(), TerminalFormatter()).rstrip("\n")
+        return text
+
+    def write(self, obj):
+        self.count += 1
+        getattr(self, f"_write_{self.fmt}")(obj)
+
+    def _write_json(self, obj):
+        if not self.many:
+            self._emit(self._json(obj) + "\n")
+        elif self.count == 1:
+            self._emit("[\n" + self._json(obj))
+        else:
+            self._emit(",\n" + self._json(obj))
+
+    def _write_ndjson(self, obj):
+        self._emit(dumps(obj).decode("utf8") + "\n")
+
+    def _write_yaml(self, obj):
+        try:
+            import yaml
+        except ImportError:
+            raise click.UsageError(
+                "yaml output requires PyYAML: pip install lazo[yaml]"
+            )
+        if self.count > 1:
+            self._emit("---\n")
+        self._emit(yaml.safe_dump(obj, default_flow_style=False, sort_keys=False))
+
+    def _write_table(self, obj):
+        if not self.many and isinstance(obj, dict):
+            self.many, self.columns = True, ["key", "value"]
+            for key, value in obj.items():
+                self._write_table({"key": key, "value": value})
+            return
+        if not isinstance(obj, dict):
+            obj = {"value": obj}
+        if self.columns is None:
+            self.columns = list(obj)
+        cells = [_cell(obj.get(c)) for c in self.columns]
+        if self._widths is None:
+            self._widths = [max(len(c), len(v)) for c, v in zip(self.columns, cells)]
+            self._row([c.upper() for c in self.columns])
+        self._row(cells)
+
+    def _row(self, cells):
+        if not self.tty:
+            self._emit("\t".join(cells) + "\n")
+            return
+        padded = [v.ljust(w) for v, w in zip(cells[:-1], self._widths)]
+        self._emit("  ".join(padded + cells[-1:]).rstrip() + "\n")
+
+    def close(self):
+        if self.fmt == "json" and self.many:
+            self._emit("\n]\n" if self.count else "[]\n")
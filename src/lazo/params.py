@@ -5,6 +5,7 @@ import click
 from click import Option
 from click.decorators import _param_memo
 
+from .output import FORMATS
 from .types import Auth, DebugMode, IChoice, Project, StdinAuth, Url, Verbosity
 
 
@@ -44,7 +45,17 @@ def make_option(*param_decls, **attrs):
     return decorator
 
 
+OUTPUT = make_option(
+    "-o",
+    "--output",
+    type=click.Choice(FORMATS),
+    envvar="LAZO_OUTPUT",
+    default=None,
+    help="Output format. Compact and not colorized when not on a terminal",
+)
+
 _global_options = [
+    OUTPUT,
     make_option(
         "-v",
         "--verbosity",
@@ -103,6 +114,82 @@ _rancher_options = [
         is_flag=True,
         help="Use target names instead of Rancher Id(s)",
     ),
+    make_option(
+        "--pool-size",
+        envvar="RANCHER_POOL_SIZE",
+        type=int,
+        default=10,
+        cls=OOption,
+        help="Max number of keep-alive connections to Rancher",
+    ),
+    make_option(
+        "--cache-ttl",
+        envvar="RANCHER_CACHE_TTL",
+        type=int,
+        default=3600,
+        cls=OOption,
+        help="Seconds names resolved by --use-names are cached. 0 to disable",
+    ),
+    make_option(
+        "--http-cache",
+        envvar="RANCHER_HTTP_CACHE",
+        is_flag=True,
+        cls=OOption,
+        help="Store GET responses on disk and revalidate them with ETag/Last-Modified",
+    ),
+    make_option(
+        "--retries",
+        envvar="RANCHER_RETRIES",
+        type=int,
+        default=3,
+        cls=OOption,
+        help="Times idempotent requests are retried on connection errors, 429 and 5xx",
+    ),
+    make_option(
+        "--rate-limit",
+        envvar="RANCHER_RATE_LIMIT",
+        type=click.FloatRange(min=0),
+        default=0,
+        cls=OOption,
+        help="Max requests per second to Rancher. 0 for no limit",
+        metavar="N",
+    ),
+    make_option(
+        "--max-in-flight",
+        envvar="RANCHER_MAX_IN_FLIGHT",
+        type=click.IntRange(min=0),
+        default=0,
+        cls=OOption,
+        help="Max concurrent requests to Rancher. 0 for no limit",
+        metavar="N",
+    ),
+    make_option(
+        "--write-rate-limit",
+        envvar="RANCHER_WRITE_RATE_LIMIT",
+        type=click.FloatRange(min=0),
+        default=None,
+        cls=OOption,
+        help="Max writes per second, if different from --rate-limit",
+        metavar="N",
+    ),
+    make_option(
+        "--write-max-in-flight",
+        envvar="RANCHER_WRITE_MAX_IN_FLIGHT",
+        type=click.IntRange(min=0),
+        default=None,
+        cls=OOption,
+        help="Max concurrent writes, if different from --max-in-flight",
+        metavar="N",
+    ),
+    make_option(
+        "--trace",
+        envvar="RANCHER_TRACE",
+        type=click.File("w"),
+        default=None,
+        cls=OOption,
+        help="Write a JSON line per request to FILE and print latencies at exit",
+        metavar="FILE",
+    ),
 ]
 CLUSTER = make_option(
     "-c",
@@ -123,6 +210,46 @@ PROJECT = make_option(
     help="Rancher project key",
     metavar="PROJECT",
 )
+_wait_options = [
+    make_option(
+        "--wait",
+        is_flag=True,
+        help="Wait for the rollout of the workloads to complete",
+    ),
+    make_option(
+        "--timeout",
+        type=int,
+        default=300,
+        metavar="SECONDS",
+        help="Max seconds to wait for each workload with --wait",
+    ),
+]
+_registry_options = [
+    make_option(
+        "--check-image/--no-check-image",
+        default=True,
+        envvar="LAZO_CHECK_IMAGE",
+        help="Check that images exist in their registry before any change",
+    ),
+    make_option(
+        "--repository",
+        envvar="DOCKER_REPOSITORY",
+        type=Url,
+        default=None,
+        cls=OOption,
+        help="Docker registry url (default: the registry in the image name)",
+        metavar="URL",
+    ),
+    make_option(
+        "--registry-auth",
+        envvar="DOCKER_AUTH",
+        type=Auth,
+        default=None,
+        cls=OOption,
+        help="Docker registry user:password",
+        metavar="TEXT",
+    ),
+]
 # WORKLOAD = make_option('-w',
 #                        '--workload',
 #                        type=Workload,
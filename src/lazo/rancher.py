@@ -1,23 +1,35 @@
+import os
 import sys
-import urllib
+import time
+from typing import TYPE_CHECKING
 
 import click
 from click import argument
 
 from .__cli__ import cli
-from .clients import RancherClient, handle_lazo_error
-from .objects import DockerImage, RancherWorkload
-from .out import echo, error, success
+from .apply import Plan, load_manifest
+from .cache import NameCache, ResponseCache, cache_dir
+from .exceptions import InvalidManifest, ObjectNotFound, handle_lazo_error
+from .index import Index
+from .objects import POD_SELECTIONS, DockerImage, RancherWorkload
+from .out import echo, error, fail, success
+from .output import Output
 from .params import (
     CLUSTER,
+    OUTPUT,
     PROJECT,
     OOption,
     _global_options,
+    _registry_options,
+    _wait_options,
     make_option,
     options,
 )
 from .types import Image, Project, Workload
-from .utils import jprint, prepare_command
+from .utils import jprint, run_parallel
+
+if TYPE_CHECKING:
+    from .clients import RancherClient
 
 # @cli.group()
 # @options(_global_options, _rancher_options)
@@ -40,13 +52,55 @@ def ping(ctx, **kwargs):
         error("Fail")
 
 
+def output_format(ctx, output):
+    """Format selected with `--output` on the command or on `lazo` itself."""
+    return output or (ctx.obj or {}).get("output")
+
+
+def check_images(images, repository=None, registry_auth=None):
+    """Exit with an error if any of `images` is not in its registry."""
+    from .clients import ImageChecker
+
+    checker = ImageChecker(repository, registry_auth)
+    missing = []
+    try:
+        for image, found, exc in checker.check(images):
+            if exc is not None:
+                missing.append(f"{image.id} ({exc})")
+            elif not found:
+                missing.append(image.id)
+    finally:
+        checker.close()
+    if missing:
+        fail(
+            "Images not found (--no-check-image to skip the check):",
+            ", ".join(missing),
+        )
+
+
+def report_changes(changes, dry_run=False, err=False):
+    """Print the changes made (or that would be made) to a workload."""
+    for change in changes:
+        click.secho(f"  {change}", fg="yellow", err=err)
+    if not changes:
+        click.secho("No changes, workload not updated", fg="green", err=err)
+    elif dry_run:
+        click.secho("Dry run: changes not applied", fg="yellow", err=err)
+
+
 @cli.command()
+@options([OUTPUT])
 @click.pass_context
 @handle_lazo_error
-def settings(ctx, **kwargs):
+def settings(ctx, output, **kwargs):
     client = ctx.obj["client"]
-    ret = client.get("/settings")
-    jprint(ret)
+    fmt = output_format(ctx, output)
+    if not fmt:
+        jprint(client.get("/settings"))
+        return
+    with Output(fmt, many=True, columns=["id", "value"]) as out:
+        for entry in client._iter_collection("/settings"):
+            out.write(entry)
 
 
 @cli.command()
@@ -60,6 +114,29 @@ def login(ctx, **kwargs):
         error("Fail")
 
 
+@cli.group()
+def cache():
+    """Manage names cache, --http-cache responses and search index"""
+
+
+@cache.command()
+@make_option("--all", "all_urls", is_flag=True, help="Clear entries of all base urls")
+@click.pass_context
+def clear(ctx, all_urls):
+    base_url = ctx.obj["base_url"]
+    responses = ResponseCache(path=os.path.join(cache_dir(), "http"))
+    if all_urls or not base_url:
+        NameCache(base_url).clear_all()
+        responses.clear()
+        Index(base_url).clear_all()
+        success("Cache cleared")
+    else:
+        NameCache(base_url).clear()
+        responses.clear(prefix=base_url)
+        Index(base_url).clear()
+        success(f"Cache cleared for {base_url}")
+
+
 @cli.command()
 @options(_global_options)
 @make_option(
@@ -86,7 +163,7 @@ def login(ctx, **kwargs):
 )
 @click.pass_context
 @handle_lazo_error
-def info(ctx, cluster, project, workload: RancherWorkload, verbosity, **kwargs):
+def info(ctx, cluster, project, workload: RancherWorkload, verbosity, output, **kwargs):
     client = ctx.obj["client"]
 
     client.cluster = cluster
@@ -95,6 +172,14 @@ def info(ctx, cluster, project, workload: RancherWorkload, verbosity, **kwargs):
 
     client.project = project
 
+    fmt = output_format(ctx, output)
+    if fmt:
+        _info_output(client, fmt, cluster, project, workload)
+    else:
+        _info_text(client, cluster, project, workload)
+
+
+def _info_text(client, cluster, project, workload):
     if workload:
         info = client.get_workload(workload.id)
 
@@ -113,29 +198,154 @@ def info(ctx, cluster, project, workload: RancherWorkload, verbosity, **kwargs):
 
     elif project:
         echo(f"Project workloads: {project[0]}:{project[1]}")
-        for workload in client.list_workloads():
-            echo(f"\t{workload[0]:>20}    {workload[1]:<40}")
+        for workload in client.iter_workloads(sort="name"):
+            echo(f"\t{workload.name:>20}    {workload.id:<40}")
     elif cluster:
-        response = client.get(f"/clusters/{client.cluster}/projects")
         echo(f"Projects on cluster: {client.cluster}")
-        for project in response["data"]:
-            echo(f"{project['name']:<15}    {project['id']:<40}")
+        for project in client.iter_projects(sort="name"):
+            echo(f"{project.name:<15}    {project.id:<40}")
     else:
         echo("Clusters:")
-        for entry in client.list_clusters():
-            echo(f"- {entry[0]:<20}   {entry[1]:<40}")
+        for entry in client.iter_clusters(sort="name"):
+            echo(f"- {entry.name:<20}   {entry.id:<40}")
+
+
+def _info_output(client, fmt, cluster, project, workload):
+    if workload:
+        Output(fmt).write(client.get_workload(workload.id))
+        return
+    if project:
+        entries = client.iter_workloads(sort="name")
+    elif cluster:
+        entries = client.iter_projects(sort="name")
+    else:
+        entries = client.iter_clusters(sort="name")
+    with Output(fmt, many=True) as out:
+        for entry in entries:
+            out.write(entry._asdict())
+
+
+def inventory_record(cluster, project, workload):
+    return {
+        "cluster": cluster["name"],
+        "clusterId": cluster["id"],
+        "project": project["name"],
+        "projectId": project["id"],
+        "name": workload["name"],
+        "id": workload["id"],
+        "namespace": workload.get("namespaceId"),
+        "state": workload.get("state"),
+        "scale": workload.get("scale"),
+        "images": [c.get("image") for c in workload.get("containers", [])],
+    }
+
+
+@cli.command()
+@options(_global_options)
+@make_option(
+    "-c",
+    "--cluster",
+    "clusters",
+    multiple=True,
+    help="Only these clusters (name or id). Can be repeated",
+    metavar="TEXT",
+)
+@make_option(
+    "--image",
+    default=None,
+    help="Only workloads with an image matching this pattern (ie. 'nginx:*')",
+    metavar="PATTERN",
+)
+@make_option(
+    "--workers",
+    type=int,
+    default=4,
+    help="Concurrent requests per cluster",
+)
+@click.pass_context
+@handle_lazo_error
+def inventory(ctx, clusters, image, workers, output, **kwargs):
+    """Print all workloads of all clusters as JSON lines, as they are fetched"""
+    from fnmatch import fnmatch
+
+    client = ctx.obj["client"]
+    selected = list(client.iter_clusters(raw=True))
+    if clusters:
+        selected = [c for c in selected if {c["name"], c["id"]} & set(clusters)]
+    errors = 0
+    out = Output(output_format(ctx, output) or "ndjson", many=True)
+    for cluster, project, workload, exc in client.iter_inventory(selected, workers):
+        if exc is not None:
+            errors += 1
+            where = cluster["id"] if project is None else project["id"]
+            click.secho(f"{where}: {exc}", fg="red", err=True)
+            continue
+        record = inventory_record(cluster, project, workload)
+        if image and not any(fnmatch(i or "", image) for i in record["images"]):
+            continue
+        out.write(record)
+    out.close()
+    if errors:
+        sys.exit(1)
+
+
+@cli.command()
+@options(_global_options)
+@argument("name", required=False)
+@make_option("--image", help="Image pattern (ie. 'nginx:*')", metavar="PATTERN")
+@make_option("--namespace", help="Namespace pattern", metavar="PATTERN")
+@make_option("--env-var", help="Environment variable name pattern", metavar="PATTERN")
+@make_option("--refresh", is_flag=True, help="Refresh the index before searching")
+@make_option(
+    "--max-age",
+    type=int,
+    default=3600,
+    help="Refresh the index when older than these seconds",
+)
+@make_option("--workers", type=int, default=4, help="Concurrent requests per cluster")
+@click.pass_context
+@handle_lazo_error
+def search(
+    ctx, name, image, namespace, env_var, refresh, max_age, workers, output, **kwargs
+):
+    """Search workloads by name, image, namespace or env var in the local index.
+
+    NAME and patterns accept '*' and '?' wildcards.
+    """
+    client = ctx.obj["client"]
+    index = Index(client.base_url)
+    if refresh or index.is_stale(max_age):
+        click.secho("Refreshing index...", err=True)
+        errors = index.refresh(client, workers=workers)
+        if errors:
+            click.secho(f"{errors} collections could not be read", fg="red", err=True)
+    records = index.search(name=name, image=image, namespace=namespace, env=env_var)
+    fmt = output_format(ctx, output)
+    if fmt:
+        with Output(fmt, many=True) as out:
+            for r in records:
+                out.write(r.as_dict())
+        return
+    for r in records:
+        echo(
+            f"{r.cluster}:{r.project:<20} {r.namespace}:{r.name:<30} "
+            f"{', '.join(r.images)}"
+        )
 
 
 @cli.command()
 @options([CLUSTER, PROJECT])
+@make_option("-w", "--workload", type=Workload, help="Only pods of this workload")
+@make_option("--state", help="Only pods in this state (ie. 'running')")
 @click.pass_context
-def pods(ctx, cluster, project):
+@handle_lazo_error
+def pods(ctx, cluster, project, workload, state):
     client = ctx.obj["client"]
     client.cluster = cluster
     client.project = project
-    ret = client.list_pods()
-    for w in ret:
-        echo(f'{w["workloadId"]:<50} {w["id"]}')
+    for pod in client.iter_pods(workload, state, sort="name"):
+        workload_id = pod.workload.id if pod.workload else "-"
+        echo(f"{workload_id:<50} {pod.id:<50} {pod.state:<12} {pod.restarts}")
 
 
 @cli.command()
@@ -167,6 +377,15 @@ def pods(ctx, cluster, project):
     required=True,
 )
 @make_option("--env", "-e", "variables", type=(str, str), multiple=True)
+@make_option(
+    "--parallel",
+    type=click.IntRange(min=1),
+    default=1,
+    metavar="N",
+    help="Number of workloads to upgrade concurrently",
+)
+@options(_wait_options)
+@options(_registry_options)
 @click.pass_context
 @handle_lazo_error
 def upgrade(
@@ -176,19 +395,40 @@ def upgrade(
     workloads: [RancherWorkload],
     image: DockerImage,
     variables,
+    parallel,
+    wait,
+    timeout,
+    dry_run,
+    check_image,
+    repository,
+    registry_auth,
     **kwargs,
 ):
     client: RancherClient = ctx.obj["client"]
     client.cluster = cluster
     client.project = project
-    # namespace, workload_name = workload
-    for workload in workloads:
+    if check_image:
+        check_images([image], repository, registry_auth)
+
+    def _upgrade(workload):
+        current, changes = client.diff(workload, image, variables)
+        if dry_run or not changes:
+            return current or {}, changes, None
+        info = client.upgrade(workload, image, variables, current=current) or {}
+        elapsed = client.wait_rollout(workload, timeout) if wait else None
+        return info, changes, elapsed
+
+    failures = []
+    for workload, result, exc in run_parallel(_upgrade, workloads, parallel):
         echo(
             f"Upgrading workload '{workload.id}' on project '{client.cluster}:{client.project}' to '{image.id}'"
         )
-
-        client.upgrade(workload, image, variables)
-        info = client.get_workload(workload)
+        if exc:
+            error(f"Failed: {exc}")
+            failures.append(workload)
+            continue
+        info, changes, elapsed = result
+        report_changes(changes, dry_run)
         if "containers" in info:
             for e in info["containers"]:
                 echo("Image:", e["image"])
@@ -196,6 +436,87 @@ def upgrade(
             for ep in info["publicEndpoints"]:
                 echo("Ingress:", ep["ingressId"])
                 echo("Hostname:", ep.get("hostname", ""))
+        if elapsed is not None:
+            success(f"Ready in {elapsed:.1f}s")
+    if failures:
+        fail(
+            f"{len(failures)} of {len(workloads)} workloads failed to upgrade:",
+            ", ".join(w.id for w in failures),
+        )
+
+
+@cli.command()
+@options(_global_options)
+@argument("manifest", type=click.File("r"))
+@options(_registry_options)
+@make_option(
+    "--parallel",
+    type=click.IntRange(min=1),
+    default=4,
+    metavar="N",
+    help="Number of workloads to update concurrently",
+)
+@make_option(
+    "--per-project",
+    type=click.IntRange(min=1),
+    default=2,
+    metavar="N",
+    help="Number of workloads of the same project to update concurrently",
+)
+@make_option(
+    "--rate",
+    type=click.FloatRange(min=0),
+    default=0,
+    metavar="N",
+    help="Max number of updates per second (0: no limit)",
+)
+@click.pass_context
+@handle_lazo_error
+def apply(
+    ctx,
+    manifest,
+    parallel,
+    per_project,
+    rate,
+    output,
+    dry_run,
+    check_image,
+    repository,
+    registry_auth,
+    **kwargs,
+):
+    """Update the workloads listed in MANIFEST (yaml or json)"""
+    client = ctx.obj["client"]
+    try:
+        operations = load_manifest(manifest)
+    except InvalidManifest as e:
+        fail(e)
+    start = time.monotonic()
+    plan = Plan(client, operations, workers=parallel)
+    if check_image:
+        from .clients import ImageChecker
+
+        checker = ImageChecker(repository, registry_auth)
+        try:
+            plan.check_images(checker)
+        finally:
+            checker.close()
+    plan.execute(parallel, per_project, rate, dry_run)
+    fmt = output_format(ctx, output)
+    with Output(fmt or "table", many=True) as out:
+        for op in plan.operations:
+            row = op.as_dict()
+            if not fmt:
+                row["changes"] = "; ".join(row["changes"])
+            out.write(row)
+    counts = ", ".join(f"{n} {status}" for status, n in sorted(plan.summary().items()))
+    elapsed = time.monotonic() - start
+    message = f"{len(operations)} workloads: {counts} in {elapsed:.1f}s"
+    if plan.waited:
+        message += f" ({plan.waited:.1f}s rate limited)"
+    click.secho(message, err=True)
+    if plan.summary().get("failed"):
+        sys.exit(1)
 
 
 @cli.command()
@@ -205,32 +526,129 @@ def upgrade(
 @options([CLUSTER, PROJECT])
 @argument("workload", type=Workload, metavar="NAME")
 @argument("command", nargs=-1)
+@make_option(
+    "--select",
+    type=click.Choice(POD_SELECTIONS),
+    default="ready",
+    help="Pod to use: the first ready one or the one with least restarts",
+)
+@make_option(
+    "--ordinal", type=int, default=None, help="Use the N-th pod (by name, from 0)"
+)
 # @make_option('-c', '--check', is_flag=True)
 # @make_option('-c', '--dry-run', is_flag=True)
 @click.pass_context
 @handle_lazo_error
-def shell(ctx, cluster, project, workload: RancherWorkload, command, **kwargs):
+def shell(
+    ctx,
+    cluster,
+    project,
+    workload: RancherWorkload,
+    command,
+    select,
+    ordinal,
+    **kwargs,
+):
     client = ctx.obj["client"]
     client.cluster = cluster
     client.project = project
-    pod = client.get_pod(workload)
-    cmds = [
-        ("container", pod.workload.name),
-        ("stdin", "1"),
-        ("stdout", "1"),
-        ("stderr", "1"),
-        ("tty", "1"),
-    ]
-    cmds.extend(prepare_command(command))
-    qs = urllib.parse.urlencode(cmds)
     try:
-        url = f"/k8s/clusters/{client.cluster}/api/v1/namespaces/{workload.namespace}/pods/{pod.name}/exec?{qs}"
-        ret = client.ws(url)
+        pod = client.get_pod(workload, select, ordinal)
+    except ObjectNotFound:
+        fail(f"No running pod found for '{workload.id}'")
+    try:
+        exit_code = client.ws(client.exec_path(pod, command, tty=True))
     except Exception as e:
         error(e)
         sys.exit(1)
 
-    print(ret)
+    sys.exit(exit_code)
+
+
+@cli.command(name="exec")
+@options(_global_options)
+@options([CLUSTER, PROJECT])
+@make_option(
+    "--workload",
+    "-w",
+    "workloads",
+    type=Workload,
+    metavar="WORKLOAD",
+    required=True,
+    multiple=True,
+)
+@make_option(
+    "--all-pods", is_flag=True, help="Run in all running pods, not only in one"
+)
+@make_option(
+    "--parallel",
+    type=click.IntRange(min=1),
+    default=10,
+    metavar="N",
+    help="Number of pods running the command concurrently",
+)
+@argument("command", nargs=-1, required=True)
+@click.pass_context
+@handle_lazo_error
+def exec_(ctx, cluster, project, workloads, all_pods, parallel, command, **kwargs):
+    """Run COMMAND in the pods of the workloads, prefixing output with pod names"""
+    import threading
+
+    from .clients import LinePrefixer
+
+    client = ctx.obj["client"]
+    client.cluster = cluster
+    client.project = project
+    pods = []
+    for workload in workloads:
+        try:
+            if all_pods:
+                found = list(client.iter_pods(workload, "running", sort="name"))
+            else:
+                found = [client.get_pod(workload)]
+        except ObjectNotFound:
+            found = []
+        if not found:
+            fail(f"No running pod found for '{workload.id}'")
+        pods.extend(found)
+
+    lock = threading.Lock()
+    width = max(len(p.name) for p in pods)
+
+    def _exec(pod):
+        prefix = f"[{pod.name:<{width}}] "
+        stdout = LinePrefixer(prefix, sys.stdout.buffer, lock)
+        stderr = LinePrefixer(prefix, sys.stderr.buffer, lock)
+        start = time.perf_counter()
+        try:
+            return (
+                client.exec(pod, command, stdout, stderr),
+                time.perf_counter() - start,
+            )
+        finally:
+            stdout.close()
+            stderr.close()
+
+    results = list(run_parallel(_exec, pods, parallel))
+    failures = 0
+    click.echo(f"{'POD':<{width}}  EXIT  {'TIME':>7}", err=True)
+    for pod, result, exc in results:
+        if exc is not None:
+            failures += 1
+            click.secho(
+                f"{pod.name:<{width}}  {'-':>4}  {'-':>7}  {exc}", fg="red", err=True
+            )
+            continue
+        exit_code, elapsed = result
+        failures += exit_code != 0
+        click.secho(
+            f"{pod.name:<{width}}  {exit_code:>4}  {elapsed:>6.2f}s",
+            fg="red" if exit_code else "green",
+            err=True,
+        )
+    if failures:
+        fail(f"{failures} of {len(pods)} pods failed")
+
 
 @cli.command()
 @options(_global_options)
@@ -252,12 +670,15 @@ def env(
     cluster,
     project,
     workloads: [RancherWorkload],
+    output,
     **kwargs,
 ):
     client: RancherClient = ctx.obj["client"]
     client.cluster = cluster
     client.project = project
     # namespace, workload_name = workload
+    fmt = output_format(ctx, output)
+    out = Output(fmt, many=True) if fmt else None
 
     for workload in workloads:
         # echo(
@@ -269,7 +690,18 @@ def env(
                 for pod in info["containers"]:
                     if "env" in pod:
                         for entry in pod["env"]:
-                            print(entry["name"], entry["value"])
+                            if out:
+                                out.write(
+                                    {
+                                        "workload": workload.id,
+                                        "name": entry["name"],
+                                        "value": entry.get("value"),
+                                    }
+                                )
+                            else:
+                                print(entry["name"], entry["value"])
+    if out:
+        out.close()
 
 
 @cli.command()
@@ -294,6 +726,7 @@ def env(
     multiple=True,
 )
 @make_option("--env", "-e", "variables", type=(str, str), multiple=True)
+@options(_wait_options)
 @click.pass_context
 @handle_lazo_error
 def set(
@@ -302,18 +735,38 @@ def set(
     project,
     workloads: [RancherWorkload],
     variables,
+    wait,
+    timeout,
+    output,
+    dry_run,
     **kwargs,
 ):
     client: RancherClient = ctx.obj["client"]
     client.cluster = cluster
     client.project = project
     # namespace, workload_name = workload
+    fmt = output_format(ctx, output)
+    out = Output(fmt, many=True) if fmt else None
 
     for workload in workloads:
-        echo(
-            f"Upgrading workload '{workload.id}' on project '{client.cluster}:{client.project}'"
+        click.secho(
+            f"Upgrading workload '{workload.id}' on project '{client.cluster}:{client.project}'",
+            fg="white",
+            err=bool(out),
         )
 
-        info = client.set_env(workload, **dict(variables))
-        # info = client.get_env(workload)
-        jprint(info)
+        current, changes = client.diff(workload, env=variables)
+        report_changes(changes, dry_run, err=bool(out))
+        if dry_run or not changes:
+            info = current
+        else:
+            info = client.upgrade(workload, None, variables, current=current)
+        if out:
+            out.write(info)
+        else:
+            jprint(info)
+        if wait and changes and not dry_run:
+            elapsed = client.wait_rollout(workload, timeout)
+            click.secho(f"Ready in {elapsed:.1f}s", fg="green", err=bool(out))
+    if out:
+        out.close()
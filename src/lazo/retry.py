@@ -0,0 +1,147 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+IDEMPOTENT_METHODS = frozenset(["get", "head", "options", "put", "delete"])
+
+
+def decorrelated_jitter(base=0.5, cap=10.0):
+    """Infinite sequence of randomized delays, each drawn in [base, 3 * previous].
+
+    See https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+    """
+    delay = base
+    while True:
+        delay = min(cap, random.uniform(base, delay * 3))
+        yield delay
+
+
+def retry_after(response):
+    """Seconds requested by the `Retry-After` header of `response`, if any."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Which failed requests are retried, and how long to wait in between.
+
+    Connection errors and `statuses` responses are retried up to `retries`
+    times, only for `methods` (idempotent ones by default). The delay is the
+    `Retry-After` value sent by the server (up to `max_retry_after`) or a
+    decorrelated jitter backoff between `base` and `cap` seconds.
+    """
+
+    def __init__(
+        self,
+        retries=3,
+        *,
+        base=0.5,
+        cap=10.0,
+        statuses=(429, 502, 503, 504),
+        methods=IDEMPOTENT_METHODS,
+        max_retry_after=60.0,
+    ):
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(m.lower() for m in methods)
+        self.max_retry_after = max_retry_after
+
+    def __repr__(self):
+        return f"<RetryPolicy retries={self.retries}>"
+
+    def delays(self):
+        return decorrelated_jitter(self.base, self.cap)
+
+    def should_retry(self, method, attempt, response=None):
+        """True if the `attempt`-th retry of a request should be made.
+
+        `response` is None when the request failed without one.
+        """
+        if attempt > self.retries or method.lower() not in self.methods:
+            return False
+        return response is None or response.status_code in self.statuses
+
+    def delay(self, delays, response=None):
+        wait = retry_after(response)
+        if wait is not None:
+            return min(wait, self.max_retry_after)
+        return next(delays)
+
+
+class CircuitBreaker:
+    """Fail fast once the server looks down.
+
+    After `threshold` consecutive failures the circuit opens and requests are
+    refused for `reset_timeout` seconds. Then a single trial request is let
+    through (half-open): its success closes the circuit, a failure opens it
+    again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<CircuitBreaker {self.state}>"
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self):
+        """True if a request can be sent now."""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record(self, response):
+        """Count a request outcome: no response or a 5xx is a failure."""
+        if response is None or response.status_code >= 500:
+            self.failure()
+        else:
+            self.success()
+
+    def release(self):
+        """Forget a request allowed but never sent: frees the trial slot."""
+        with self._lock:
+            self._trial = False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self._trial = False
@@ -0,0 +1,72 @@
+# Kubernetes API group and resource for each Rancher workload type
+K8S_RESOURCES = {
+    "deployment": ("apps/v1", "deployments"),
+    "statefulset": ("apps/v1", "statefulsets"),
+    "daemonset": ("apps/v1", "daemonsets"),
+}
+
+
+def k8s_ready(obj):
+    """True when a Kubernetes workload has completed its rollout."""
+    metadata, spec, status = obj["metadata"], obj.get("spec", {}), obj.get("status", {})
+    if status.get("observedGeneration", 0) < metadata.get("generation", 0):
+        return False
+    if obj.get("kind") == "DaemonSet":
+        desired = status.get("desiredNumberScheduled", 0)
+        return all(
+            [
+                status.get("updatedNumberScheduled", 0) == desired,
+                status.get("numberAvailable", 0) == desired,
+            ]
+        )
+    replicas = spec.get("replicas", 1)
+    if obj.get("kind") == "StatefulSet":
+        return all(
+            [
+                status.get("updatedReplicas", 0) == replicas,
+                status.get("readyReplicas", 0) == replicas,
+                status.get("currentRevision") == status.get("updateRevision"),
+            ]
+        )
+    return all(
+        [
+            status.get("updatedReplicas", 0) == replicas,
+            status.get("replicas", 0) == replicas,
+            status.get("availableReplicas", 0) == replicas,
+        ]
+    )
+
+
+def watch_event_ready(event):
+    """`k8s_ready()` of the object of a watch event, None on an ERROR event.
+
+    ERROR events carry a `Status` (ie. the resource version expired).
+    """
+    if event.get("type") == "ERROR":
+        return None
+    return k8s_ready(event["object"])
+
+
+def rancher_ready(doc):
+    """True when a Rancher workload document reports a completed rollout."""
+    if doc.get("state") != "active" or doc.get("transitioning") == "yes":
+        return False
+    status = doc.get("deploymentStatus")
+    if status:
+        replicas = status.get("replicas", 0)
+        return all(
+            [
+                not status.get("unavailableReplicas"),
+                status.get("updatedReplicas", replicas) == replicas,
+                status.get("availableReplicas", replicas) == replicas,
+            ]
+        )
+    return True
+
+
+def backoff(initial=0.5, cap=10.0, factor=2):
+    """Infinite sequence of exponentially growing delays, capped to `cap`."""
+    delay = initial
+    while True:
+        yield delay
+        delay = min(cap, delay * factor)
@@ -0,0 +1,223 @@
+import collections
+import contextlib
+import threading
+import time
+
+
+class TokenBucket:
+    """Limit operations to `rate` per second, allowing bursts of `burst`.
+
+    Each operation takes a token; tokens are refilled at `rate` per second
+    up to `burst`. When none is left the token is reserved in advance and
+    the caller has to wait for it: `reserve()` returns the seconds to wait,
+    `acquire()` sleeps them. A `rate` of 0 (or None) disables the limit.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate or 0
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<TokenBucket {self.rate}/s>"
+
+    def reserve(self):
+        """Take a token and return the seconds to wait before using it."""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self.updated
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.waited += wait
+            return wait
+
+    def acquire(self):
+        """Block until a token is available, returns the seconds waited."""
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class _Limit:
+    """Token bucket plus a cap on concurrent requests, for threads and tasks.
+
+    Callers waiting for a free slot register a wake up callable, called by
+    `release()`: a `threading.Event.set` for threads, a future resolved on
+    its event loop for asyncio tasks.
+    """
+
+    def __init__(self, rate=0, max_in_flight=0, burst=1):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_in_flight = max_in_flight or 0
+        self.in_flight = 0
+        self.requests = 0
+        self.waited = 0.0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+
+    def _enter(self, waiter):
+        """Take a slot, or register `waiter` and return False if none is free."""
+        with self._lock:
+            if not self.max_in_flight or self.in_flight < self.max_in_flight:
+                self.in_flight += 1
+                self.requests += 1
+                return True
+            self._waiters.append(waiter)
+            return False
+
+    def _wake_next(self):
+        with self._lock:
+            waiter = self._waiters.popleft() if self._waiters else None
+        if waiter is not None:
+            waiter()
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._wake_next()
+
+    def _add_wait(self, seconds):
+        with self._lock:
+            self.waited += seconds
+
+    def acquire(self):
+        """Block until a request can be sent, returns the seconds waited."""
+        start = time.monotonic()
+        event = threading.Event()
+        while not self._enter(event.set):
+            event.wait()
+            event.clear()
+        delay = self.bucket.reserve()
+        if delay:
+            time.sleep(delay)
+        waited = time.monotonic() - start
+        self._add_wait(waited)
+        return waited
+
+    async def acquire_async(self):
+        """`acquire()` for asyncio tasks: waits without blocking the loop."""
+        import asyncio
+
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        while True:
+            future = loop.create_future()
+
+            def wake(future=future):
+                loop.call_soon_threadsafe(_resolve, future)
+
+            if self._enter(wake):
+                break
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self._lock:
+                    queued = wake in self._waiters
+                    if queued:
+                        self._waiters.remove(wake)
+                if not queued:
+                    # pass on the wake up this task will not use
+                    self._wake_next()
+                raise
+        delay = self.bucket.reserve()
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.release()
+                raise
+        waited = time.monotonic() - start
+        self._add_wait(waited)
+        return waited
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimiter:
+    """Requests per second and max in-flight requests allowed to a client.
+
+    Writes (any method but GET/HEAD/OPTIONS) use their own limits when
+    `write_rate` or `write_max_in_flight` are set, otherwise they share the
+    ones of reads. 0 means no limit. The same limiter can be shared by
+    clients used in different threads and asyncio tasks.
+
+        with limiter.limit("get") as waited:
+            ...
+    """
+
+    READ_METHODS = frozenset(["get", "head", "options"])
+
+    def __init__(
+        self,
+        rate=0,
+        max_in_flight=0,
+        write_rate=None,
+        write_max_in_flight=None,
+        burst=1,
+    ):
+        self.read = _Limit(rate, max_in_flight, burst)
+        if write_rate is None and write_max_in_flight is None:
+            self.write = self.read
+        else:
+            self.write = _Limit(
+                rate if write_rate is None else write_rate,
+                max_in_flight if write_max_in_flight is None else write_max_in_flight,
+                burst,
+            )
+
+    def __repr__(self):
+        return (
+            f"<RateLimiter {self.read.bucket.rate}/s in-flight "
+            f"{self.read.max_in_flight or '-'}>"
+        )
+
+    def _get(self, method):
+        return self.read if method.lower() in self.READ_METHODS else self.write
+
+    @contextlib.contextmanager
+    def limit(self, method):
+        limit = self._get(method)
+        waited = limit.acquire()
+        try:
+            yield waited
+        finally:
+            limit.release()
+
+    @contextlib.asynccontextmanager
+    async def limit_async(self, method):
+        limit = self._get(method)
+        waited = await limit.acquire_async()
+        try:
+            yield waited
+        finally:
+            limit.release()
+
+    @property
+    def limits(self):
+        if self.write is self.read:
+            return [self.read]
+        return [self.read, self.write]
+
+    @property
+    def waited(self):
+        """Total seconds callers waited."""
+        return sum(limit.waited for limit in self.limits)
+
+    def format_stats(self):
+        parts = []
+        for name, limit in zip(["reads", "writes"], self.limits):
+            if len(self.limits) == 1:
+                name = "requests"
+            parts.append(f"{limit.requests} {name} waited {limit.waited:.2f}s")
+        return "rate limiter: " + ", ".join(parts)
@@ -0,0 +1,67 @@
+import json
+import threading
+import time
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    index = max(int(round(pct / 100 * len(values))) - 1, 0)
+    return values[index]
+
+
+class Tracer:
+    """Write one JSON line per request made by a client into `stream`.
+
+    Latencies are also collected per endpoint (method plus url path with ids
+    replaced by `{id}`) and can be reported with `summary()`.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.latencies = {}
+        self._lock = threading.Lock()
+
+    def install(self, client):
+        client.add_hook("after_response", self.on_response)
+        client.add_hook("error", self.on_error)
+        return self
+
+    def on_response(self, info, response):
+        self.record(info)
+
+    def on_error(self, info, exc):
+        self.record(dict(info, error=str(exc)))
+
+    def record(self, info):
+        key = (info["method"].upper(), info["endpoint"])
+        line = json.dumps(dict(info, ts=time.time()))
+        with self._lock:
+            self.latencies.setdefault(key, []).append(info["timing"]["total"])
+            if self.stream:
+                self.stream.write(line + "\n")
+
+    def summary(self):
+        """List of `(method, endpoint, count, avg, p50, max)`, slowest first."""
+        rows = []
+        with self._lock:
+            for (method, endpoint), values in self.latencies.items():
+                rows.append(
+                    (
+                        method,
+                        endpoint,
+                        len(values),
+                        sum(values) / len(values),
+                        _percentile(values, 50),
+                        max(values),
+                    )
+                )
+        return sorted(rows, key=lambda r: r[3] * r[2], reverse=True)
+
+    def format_summary(self):
+        lines = [f"{'Endpoint':<60} {'Count':>6} {'Avg':>8} {'P50':>8} {'Max':>8}"]
+        for method, endpoint, count, avg, p50, top in self.summary():
+            lines.append(
+                f"{method + ' ' + endpoint:<60} {count:>6} "
+                f"{avg * 1000:>6.1f}ms {p50 * 1000:>6.1f}ms {top * 1000:>6.1f}ms"
+            )
+        return "\n".join(lines)
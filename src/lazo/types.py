@@ -2,7 +2,6 @@ from urllib.parse import urlparse
 
 import click
 from click.types import BoolParamType
-from requests.auth import HTTPBasicAuth
 
 from lazo.exceptions import ExBadParameter
 from lazo.objects import DockerImage, RancherWorkload
@@ -103,6 +102,8 @@ Project = ProjectParamType()
 
 class AuthParamType(ExParamType):
     def convert(self, value, param, ctx):
+        from requests.auth import HTTPBasicAuth
+
         try:
             parts = value.split(":")
             assert len(parts) == 2
@@ -129,8 +130,10 @@ Image = ImageParamType()
 
 class DebugModeType(BoolParamType):
     def __call__(self, value, param=None, ctx=None):
-        ctx.find_root().command.debug = True
-        return True
+        value = super().__call__(value, param, ctx)
+        if value:
+            ctx.find_root().command.debug = True
+        return value
 
 
 DebugMode = DebugModeType()
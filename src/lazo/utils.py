@@ -1,9 +1,6 @@
 import importlib
 import json
-
-from pygments import highlight
-from pygments.formatters.terminal import TerminalFormatter
-from pygments.lexers.data import JsonLexer
+import sys
 
 # def sizeof(num, suffix="B"):
 #     for unit in ["", "Ki", "Mi", "Gi", "Ti", "Pi", "Ei", "Zi"]:
@@ -39,9 +36,16 @@ from pygments.lexers.data import JsonLexer
 #         )
 
 
-def jprint(obj, colors=True):
+def jprint(obj, colors=None):
+    """Print `obj` as indented json, colorized if `colors` (default: on a tty)."""
     formatted_json = json.dumps(obj, sort_keys=True, indent=4)
+    if colors is None:
+        colors = sys.stdout.isatty()
     if colors:
+        from pygments import highlight
+        from pygments.formatters.terminal import TerminalFormatter
+        from pygments.lexers.data import JsonLexer
+
         colorful_json = highlight(formatted_json, JsonLexer(), TerminalFormatter())
         print(colorful_json)
     else:
@@ -52,3 +56,21 @@ def prepare_command(cmds):
     if not isinstance(cmds, (list, tuple)):
         cmds = cmds.split()
     return list(zip(["command"] * len(cmds), cmds))
+
+
+def run_parallel(func, items, workers=1):
+    """Call `func` for each item using at most `workers` threads.
+
+    Yields `(item, result, exception)` tuples in the same order as `items`,
+    as soon as each one (and all the ones before it) completed.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    items = list(items)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(func, item) for item in items]
+        for item, future in zip(items, futures):
+            try:
+                yield item, future.result(), None
+            except Exception as e:
+                yield item, None, e
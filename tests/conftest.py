@@ -2,7 +2,15 @@ import responses
 
 import pytest
 
+from lazo.retry import RetryPolicy
+
+
 @pytest.fixture
 def mocked_responses():
     with responses.RequestsMock() as rsps:
-        yield rsps
\ No newline at end of file
+        yield rsps
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(RetryPolicy, "delay", lambda self, delays, response=None: 0)
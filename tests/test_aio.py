@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from lazo.exceptions import Http404
+from lazo.objects import DockerImage, RancherWorkload
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web  # noqa: E402
+
+from lazo.aio import AsyncRancherClient  # noqa: E402
+
+WORKLOAD = {"containers": [{"image": "aaa", "name": "workload", "env": []}]}
+
+
+def run(coro_factory):
+    async def main():
+        app = web.Application()
+        state = {"puts": [], "flaky": 0, "lookups": 0}
+
+        async def clusters(request):
+            state["lookups"] += 1
+            await asyncio.sleep(0.01)
+            return web.json_response({"data": [{"name": "local", "id": "c-1"}]})
+
+        async def projects(request):
+            return web.json_response({"data": [{"name": "prj", "id": "c-1:p-1"}]})
+
+        async def workloads(request):
+            return web.json_response(
+                {"data": [{"name": "workload", "id": "deployment:ns:workload"}]}
+            )
+
+        async def workload(request):
+            if request.match_info["id"] == "deployment:ns:missing":
+                raise web.HTTPNotFound()
+            if request.method == "PUT":
+                state["puts"].append(await request.json())
+                return web.json_response(state["puts"][-1])
+            return web.json_response(WORKLOAD)
+
+        async def flaky(request):
+            state["flaky"] += 1
+            if state["flaky"] == 1:
+                raise web.HTTPServiceUnavailable()
+            return web.json_response({"data": []})
+
+        app.router.add_get("/v3/clusters", clusters)
+        app.router.add_get("/v3/flaky", flaky)
+        app.router.add_get("/v3/clusters/{cluster}/projects", projects)
+        app.router.add_get("/v3/projects/{project}/workloads", workloads)
+        app.router.add_route("*", "/v3/{kind}/{project}/workloads/{id}", workload)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            client = AsyncRancherClient(
+                f"http://127.0.0.1:{port}/v3", debug=False, use_names=True
+            )
+            async with client:
+                return await coro_factory(client), state
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def test_list_and_resolve_names():
+    async def scenario(client):
+        client.cluster = "local"
+        client.project = "prj"
+        return await client.list_clusters(), await client.list_workloads(), client
+
+    (clusters, workloads, client), __ = run(scenario)
+    assert clusters == [("local", "c-1")]
+    assert workloads == [("workload", "deployment:ns:workload")]
+    assert (client.cluster, client.project) == ("c-1", "p-1")
+
+
+def test_concurrent_upgrades():
+    async def scenario(client):
+        client.cluster, client.project = "local", "prj"
+        w = RancherWorkload("ns:workload")
+        return await asyncio.gather(
+            *[client.upgrade(w, DockerImage("a/b:1"), {"K": "V"}) for __ in range(20)]
+        )
+
+    results, state = run(scenario)
+    assert len(state["puts"]) == 20
+    assert results[0]["containers"][0]["image"] == "a/b:1"
+    assert results[0]["containers"][0]["env"][0]["name"] == "K"
+
+
+def test_concurrent_resolution():
+    async def scenario(client):
+        client.cluster, client.project = "local", "prj"
+
+        async def call(delay):
+            await asyncio.sleep(delay)
+            return await client.list_workloads()
+
+        return await asyncio.gather(*[call(i * 0.004) for i in range(5)])
+
+    results, state = run(scenario)
+    assert results == [[("workload", "deployment:ns:workload")]] * 5
+    assert state["lookups"] == 1
+
+
+def test_error_mapping():
+    async def scenario(client):
+        client.cluster, client.project = "local", "prj"
+        with pytest.raises(Http404):
+            await client.get_workload("deployment:ns:missing")
+
+    run(scenario)
+
+
+def test_retry():
+    async def scenario(client):
+        return await client.get("/flaky")
+
+    result, state = run(scenario)
+    assert result == {"data": []}
+    assert state["flaky"] == 2
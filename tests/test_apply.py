@@ -0,0 +1,124 @@
+import io
+import json
+
+import pytest
+
+from lazo.apply import Plan, load_manifest
+from lazo.clients import RancherClient
+from lazo.exceptions import InvalidManifest
+
+BASE = "https://rancher/v3"
+
+
+def _manifest(data, name="release.json"):
+    stream = io.StringIO(data if isinstance(data, str) else json.dumps(data))
+    stream.name = name
+    return stream
+
+
+def _workload(name, image, env=None):
+    return {
+        "id": f"deployment:ns:{name}",
+        "name": name,
+        "namespaceId": "ns",
+        "containers": [{"name": name, "image": image, "env": env or []}],
+    }
+
+
+def test_load_manifest():
+    ops = load_manifest(
+        _manifest(
+            {
+                "cluster": "local",
+                "project": "default",
+                "env": {"DEBUG": 0},
+                "workloads": [
+                    {"workload": "ns:web", "image": "acme/web:2"},
+                    {"workload": "statefulset:ns:db", "project": "db", "env": {"X": "1"}},
+                ],
+            }
+        )
+    )
+    assert [(op.cluster, op.project, op.workload.id) for op in ops] == [
+        ("local", "default", "deployment:ns:web"),
+        ("local", "db", "statefulset:ns:db"),
+    ]
+    assert ops[0].image.id == "acme/web:2"
+    assert ops[0].env == {"DEBUG": "0"}
+    assert ops[1].image is None
+    assert ops[1].env == {"DEBUG": "0", "X": "1"}
+
+
+def test_load_manifest_yaml():
+    pytest.importorskip("yaml")
+    ops = load_manifest(
+        _manifest(
+            "- {cluster: local, project: default, workload: 'ns:web', image: 'acme/web:2'}\n",
+            name="release.yaml",
+        )
+    )
+    assert ops[0].workload.id == "deployment:ns:web"
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        [],
+        {"workloads": [{"cluster": "local", "project": "p", "workload": "ns:web"}]},
+        [{"cluster": "local", "project": "p", "workload": "ns:web", "imag": "a/b:1"}],
+        [{"cluster": "local", "workload": "ns:web", "image": "a/b:1"}],
+        [{"cluster": "local", "project": "p", "workload": "web", "image": "a/b:1"}],
+        "[{",
+    ],
+)
+def test_load_manifest_invalid(data):
+    with pytest.raises(InvalidManifest):
+        load_manifest(_manifest(data))
+
+
+def test_plan(mocked_responses):
+    mocked_responses.add(
+        mocked_responses.GET, f"{BASE}/clusters", json={"data": [{"id": "c-1", "name": "local"}]}
+    )
+    mocked_responses.add(
+        mocked_responses.GET,
+        f"{BASE}/clusters/c-1/projects",
+        json={"data": [{"id": "c-1:p-1", "name": "default"}, {"id": "c-1:p-2", "name": "db"}]},
+    )
+    mocked_responses.add(
+        mocked_responses.GET,
+        f"{BASE}/projects/c-1:p-1/workloads",
+        json={"data": [_workload("web", "acme/web:1"), _workload("worker", "acme/web:2")]},
+    )
+    mocked_responses.add(mocked_responses.GET, f"{BASE}/projects/c-1:p-2/workloads", status=403, json={})
+    put = mocked_responses.add(
+        mocked_responses.PUT, f"{BASE}/project/c-1:p-1/workloads/deployment:ns:web", json={}
+    )
+    ops = load_manifest(
+        _manifest(
+            {
+                "cluster": "local",
+                "project": "default",
+                "image": "acme/web:2",
+                "workloads": [
+                    {"workload": "ns:web"},
+                    {"workload": "ns:worker"},
+                    {"workload": "ns:missing"},
+                    {"workload": "ns:db", "project": "db"},
+                    {"workload": "ns:web", "cluster": "prod"},
+                ],
+            }
+        )
+    )
+    client = RancherClient(base_url=BASE, retries=0, debug=False)
+    plan = Plan(client, ops)
+    assert [op.status for op in ops] == ["pending", "unchanged", "failed", "failed", "failed"]
+    assert [str(c) for c in ops[0].changes] == ["web: image acme/web:1 -> acme/web:2"]
+
+    plan.execute(parallel=2, per_project=1)
+    assert ops[0].status == "updated"
+    assert put.call_count == 1
+    assert plan.summary() == {"updated": 1, "unchanged": 1, "failed": 3}
+    # names resolved once, no GET of single workloads
+    assert len(mocked_responses.calls) == 5
+
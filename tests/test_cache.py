@@ -0,0 +1,129 @@
+import os
+import stat
+
+import pytest
+from click.testing import CliRunner
+
+from lazo.cache import NameCache, ResponseCache
+from lazo.cli import cli
+from lazo.clients import RancherClient
+from lazo.exceptions import InvalidName
+
+CLUSTERS = {"data": [{"name": "local", "id": "c-1"}, {"name": "prod", "id": "c-2"}]}
+
+
+@pytest.fixture
+def name_cache(tmp_path):
+    return NameCache("https://rancher/v3", path=str(tmp_path / "names.json"))
+
+
+@pytest.fixture
+def client(name_cache):
+    return RancherClient(
+        base_url="https://rancher/v3", use_names=True, name_cache=name_cache, debug=False
+    )
+
+
+def test_cache_ttl(name_cache):
+    name_cache.update("/clusters", {"local": "c-1"})
+    assert name_cache.get("/clusters", "local") == "c-1"
+    name_cache.ttl = 0
+    assert name_cache.get("/clusters", "local") is None
+
+
+def test_cache_per_base_url(name_cache):
+    name_cache.update("/clusters", {"local": "c-1"})
+    other = NameCache("https://other/v3", path=name_cache.path)
+    assert other.get("/clusters", "local") is None
+    other.update("/clusters", {"local": "c-9"})
+    name_cache.clear()
+    assert name_cache.get("/clusters", "local") is None
+    assert other.get("/clusters", "local") == "c-9"
+
+
+def test_resolution_warm_cache(client, mocked_responses):
+    mocked_responses.add(mocked_responses.GET, "https://rancher/v3/clusters", json=CLUSTERS)
+    client.cluster = "local"
+    assert client.cluster == "c-1"
+    assert len(mocked_responses.calls) == 1
+
+    client.cluster = "prod"
+    assert client.cluster == "c-2"
+    assert len(mocked_responses.calls) == 1
+
+
+def test_resolution_refresh_on_miss(client, name_cache, mocked_responses):
+    name_cache.update("/clusters", {"local": "c-1"})
+    mocked_responses.add(mocked_responses.GET, "https://rancher/v3/clusters", json=CLUSTERS)
+    client.cluster = "prod"
+    assert client.cluster == "c-2"
+    with pytest.raises(InvalidName):
+        client.cluster = "missing"
+    assert len(mocked_responses.calls) == 2
+
+
+def test_resolution_from_index(name_cache, mocked_responses, tmp_path):
+    from lazo.index import Index
+
+    index = Index("https://rancher/v3", path=str(tmp_path / "index.sqlite3"))
+    with index.db as db:
+        db.execute("INSERT INTO clusters VALUES (?, ?, ?, ?)", (index.base_url, "c-1", "local", 0.0))
+        db.execute(
+            "INSERT INTO projects VALUES (?, ?, ?, ?, ?)", (index.base_url, "c-1:p-1", "c-1", "web", 0.0)
+        )
+    client = RancherClient(
+        base_url="https://rancher/v3", use_names=True, name_cache=name_cache, index=index, debug=False
+    )
+    client.cluster = "local"
+    client.project = "web"
+    assert (client.cluster, client.project) == ("c-1", "p-1")
+    assert len(mocked_responses.calls) == 0
+
+
+def test_cli_cache_clear(tmp_path):
+    runner = CliRunner()
+    result = runner.invoke(cli, ["cache", "clear"], env={"LAZO_CACHE_DIR": str(tmp_path)})
+    assert result.exit_code == 0, result.output
+    assert "Cache cleared" in result.output
+
+
+class _Response:
+    def __init__(self, content, etag='"1"'):
+        self.content = content
+        self.headers = {"ETag": etag, "Content-Type": "application/json"}
+
+
+def test_response_cache_lru():
+    cache = ResponseCache(max_size=10)
+    cache.put("/a", _Response(b"aaaa"))
+    cache.put("/b", _Response(b"bbbb"))
+    cache.get("/a")
+    cache.put("/c", _Response(b"cccc"))
+    assert "/a" in cache and "/c" in cache
+    assert "/b" not in cache
+    assert cache.size == 8
+    assert cache.put("/d", _Response(b"d", etag=None)) is None
+
+
+def test_response_cache_disk(tmp_path):
+    path = str(tmp_path / "http")
+    ResponseCache(path=path).put("https://rancher/v3/a", _Response(b"a\nb"))
+    ResponseCache(path=path).put("https://other/v3/a", _Response(b"x"))
+    cache = ResponseCache(path=path)
+    entry = cache.get("https://rancher/v3/a")
+    assert (entry.content, entry.etag) == (b"a\nb", '"1"')
+    cache.clear(prefix="https://rancher/")
+    assert ResponseCache(path=path).get("https://rancher/v3/a") is None
+    assert ResponseCache(path=path).get("https://other/v3/a") is not None
+
+    cache.max_disk_size = 0
+    cache.prune()
+    assert ResponseCache(path=path).get("https://other/v3/a") is None
+
+
+def test_response_cache_disk_permissions(tmp_path):
+    path = str(tmp_path / "cache" / "http")
+    ResponseCache(path=path).put("https://rancher/v3/a", _Response(b"secret"))
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o700
+    for entry in os.scandir(path):
+        assert stat.S_IMODE(entry.stat().st_mode) == 0o600
@@ -1,3 +1,8 @@
+import json
+import os
+import subprocess
+import sys
+
 from click.testing import CliRunner
 
 from lazo.cli import cli
@@ -10,6 +15,43 @@ def test_cli():
     assert result.exit_code == 0
 
 
+# modules that must not be imported by `lazo --help`/`lazo --env`
+HEAVY_MODULES = ["pygments", "requests", "urllib3", "websocket"]
+# max import time of lazo.__cli__ (click excluded), relative to the one of click
+IMPORT_BUDGET = float(os.environ.get("LAZO_IMPORT_BUDGET", 2))
+
+
+def _python(*args):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    return subprocess.run(
+        [sys.executable, *args], env=env, capture_output=True, text=True, check=True
+    )
+
+
+def test_lazy_imports():
+    ret = _python(
+        "-c",
+        "import sys\n"
+        "from click.testing import CliRunner\n"
+        "from lazo.__cli__ import cli\n"
+        "CliRunner().invoke(cli, ['--help'])\n"
+        "CliRunner().invoke(cli, ['--env'])\n"
+        f"print([m for m in {HEAVY_MODULES!r} if m in sys.modules])",
+    )
+    assert ret.stdout.strip() == "[]"
+
+
+def test_import_budget():
+    ret = _python("-X", "importtime", "-c", "import click; import lazo.__cli__")
+    cumulative = {"click": None, "lazo.__cli__": None}
+    for line in ret.stderr.splitlines():
+        module = line.rsplit("|", 1)[-1].strip()
+        if module in cumulative:
+            cumulative[module] = int(line.split("|")[1])
+    assert None not in cumulative.values(), ret.stderr
+    assert cumulative["lazo.__cli__"] < cumulative["click"] * IMPORT_BUDGET, cumulative
+
+
 def test_venv():
     runner = CliRunner()
     result = runner.invoke(cli, "--env")
@@ -29,7 +71,29 @@ def test_info(mocked_responses):
     assert result.exit_code == 0, result.output
 
 
+def _mock_workload(mocked_responses, name, status=200):
+    doc = {"containers": [{"image": "account/image:old", "name": name}]}
+    for method in [mocked_responses.GET, mocked_responses.PUT]:
+        mocked_responses.add(
+            method,
+            f"https://rancher/v3/project/local:project/workloads/deployment:namespace:{name}",
+            json=doc,
+            status=status,
+        )
+
+
+def _mock_manifest(mocked_responses, image, status=200):
+    repository, tag = image.split(":")
+    mocked_responses.add(
+        mocked_responses.HEAD,
+        f"https://registry-1.docker.io/v2/{repository}/manifests/{tag}",
+        status=status,
+    )
+
+
 def test_upgrade(mocked_responses):
+    _mock_workload(mocked_responses, "workload")
+    _mock_manifest(mocked_responses, "account/image:tag")
     runner = CliRunner()
     result = runner.invoke(
         cli,
@@ -37,3 +101,189 @@ def test_upgrade(mocked_responses):
         env={"RANCHER_CLUSTER": "local"},
     )
     assert result.exit_code == 0, result.output
+
+
+def test_upgrade_parallel_failures(mocked_responses):
+    mocked_responses.assert_all_requests_are_fired = False
+    _mock_workload(mocked_responses, "w1")
+    _mock_workload(mocked_responses, "w2", status=404)
+    _mock_workload(mocked_responses, "w3")
+    _mock_manifest(mocked_responses, "account/image:tag")
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        ["-b", "https://rancher/v3", "upgrade", "-i", "account/image:tag", "-p", "project",
+         "-w", "namespace:w1", "-w", "namespace:w2", "-w", "namespace:w3", "--parallel", "3"],
+        env={"RANCHER_CLUSTER": "local"},
+    )
+    assert result.exit_code == 1, result.output
+    positions = [result.output.index(f"namespace:{name}") for name in ["w1", "w2", "w3"]]
+    assert positions == sorted(positions)
+    assert "1 of 3 workloads failed to upgrade: deployment:namespace:w2" in result.output
+
+
+def test_inventory(mocked_responses):
+    base = "https://rancher/v3"
+    mocked_responses.add(
+        mocked_responses.GET,
+        f"{base}/clusters",
+        json={"data": [{"name": "local", "id": "local"}, {"name": "prod", "id": "c-2"}]},
+    )
+    mocked_responses.add(
+        mocked_responses.GET,
+        f"{base}/clusters/local/projects",
+        json={"data": [{"name": "default", "id": "local:p-1"}, {"name": "other", "id": "local:p-2"}]},
+    )
+    mocked_responses.add(mocked_responses.GET, f"{base}/clusters/c-2/projects", status=403, json={})
+    for project, image in [("p-1", "nginx:1.25"), ("p-2", "redis:7")]:
+        mocked_responses.add(
+            mocked_responses.GET,
+            f"{base}/projects/local:{project}/workloads",
+            json={"data": [{"name": "web", "id": "deployment:ns:web", "namespaceId": "ns",
+                            "containers": [{"image": image}]}]},
+        )
+    runner = CliRunner()
+    result = runner.invoke(cli, ["-b", base, "inventory", "--image", "nginx:*"])
+    assert result.exit_code == 1, result.output
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert lines == [
+        {"cluster": "local", "clusterId": "local", "project": "default", "projectId": "local:p-1",
+         "name": "web", "id": "deployment:ns:web", "namespace": "ns", "state": None, "scale": None,
+         "images": ["nginx:1.25"]}
+    ]
+    assert "c-2:" in result.stderr
+
+
+def test_info_output(mocked_responses):
+    mocked_responses.add(
+        mocked_responses.GET,
+        "https://rancher/v3/clusters/local/projects?sort=name",
+        json={"data": [{"name": "default", "id": "local:p-1"}]},
+    )
+    runner = CliRunner()
+    result = runner.invoke(cli, ["-b", "https://rancher/v3", "-o", "ndjson", "info", "-c", "local"])
+    assert result.exit_code == 0, result.output
+    assert result.output == '{"name":"default","id":"local:p-1"}\n'
+
+
+def test_exec_no_pod(mocked_responses):
+    mocked_responses.add(
+        mocked_responses.GET, "https://rancher/v3/projects/local:project/pods", json={"data": []}
+    )
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        ["-b", "https://rancher/v3", "--auth", "key:secret", "exec", "-p", "project",
+         "-w", "ns:web", "--", "cat", "file"],
+        env={"RANCHER_CLUSTER": "local"},
+    )
+    assert result.exit_code == 1, result.output
+    assert "No running pod found for 'deployment:ns:web'" in result.output
+
+
+def test_exec_all_pods(mocked_responses, monkeypatch):
+    import websocket
+
+    mocked_responses.add(
+        mocked_responses.GET,
+        "https://rancher/v3/projects/local:project/pods",
+        json={"data": [{"id": f"ns:web-{i}", "workloadId": "deployment:ns:web", "state": "running"}
+                       for i in range(3)]},
+    )
+    statuses = {
+        "web-0": b'{"status":"Success"}',
+        "web-1": b'{"status":"Failure","details":{"causes":[{"reason":"ExitCode","message":"2"}]}}',
+        "web-2": b'{"status":"Success"}',
+    }
+
+    class FakeWebSocket:
+        connected = True
+
+        def __init__(self, url, **kwargs):
+            pod = url.split("/pods/")[1].split("/")[0]
+            self.frames = [b"\x01line 1\nline", b"\x01 2\n", b"\x03" + statuses[pod]]
+
+        def recv_data(self):
+            if self.frames:
+                return websocket.ABNF.OPCODE_BINARY, self.frames.pop(0)
+            return websocket.ABNF.OPCODE_CLOSE, b""
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(websocket, "create_connection", FakeWebSocket)
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        ["-b", "https://rancher/v3", "--auth", "key:secret", "exec", "-p", "project",
+         "-w", "ns:web", "--all-pods", "--", "cat", "file"],
+        env={"RANCHER_CLUSTER": "local"},
+    )
+    assert result.exit_code == 1, result.output
+    for pod in statuses:
+        assert f"[{pod}] line 1\n[{pod}] line 2\n" in result.stdout
+    assert "web-1     2" in result.stderr
+    assert "1 of 3 pods failed" in result.output
+
+
+def test_upgrade_dry_run(mocked_responses):
+    mocked_responses.add(
+        mocked_responses.GET,
+        "https://rancher/v3/project/local:project/workloads/deployment:namespace:workload",
+        json={"containers": [{"image": "account/image:old", "name": "app", "env": [{"name": "K", "value": "1"}]}]},
+    )
+    _mock_manifest(mocked_responses, "account/image:tag")
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        ["-b", "https://rancher/v3", "upgrade", "-i", "account/image:tag", "-p", "project",
+         "-w", "namespace:workload", "-e", "K", "2", "--dry-run"],
+        env={"RANCHER_CLUSTER": "local"},
+    )
+    assert result.exit_code == 0, result.output
+    assert "app: image account/image:old -> account/image:tag" in result.output
+    assert "app: env K: 1 -> 2" in result.output
+    assert "Dry run" in result.output
+    assert [c.request.method for c in mocked_responses.calls] == ["HEAD", "GET"]
+
+
+def test_upgrade_missing_image(mocked_responses):
+    _mock_manifest(mocked_responses, "account/image:missing", status=404)
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        ["-b", "https://rancher/v3", "upgrade", "-i", "account/image:missing", "-p", "project",
+         "-w", "namespace:workload"],
+        env={"RANCHER_CLUSTER": "local"},
+    )
+    assert result.exit_code == 1, result.output
+    assert "Images not found" in result.output
+    assert "account/image:missing" in result.output
+    assert [c.request.method for c in mocked_responses.calls] == ["HEAD"]
+
+
+def test_apply_dry_run(mocked_responses, tmp_path):
+    base = "https://rancher/v3"
+    mocked_responses.add(mocked_responses.GET, f"{base}/clusters", json={"data": [{"id": "c-1", "name": "local"}]})
+    mocked_responses.add(
+        mocked_responses.GET, f"{base}/clusters/c-1/projects", json={"data": [{"id": "c-1:p-1", "name": "default"}]}
+    )
+    mocked_responses.add(
+        mocked_responses.GET,
+        f"{base}/projects/c-1:p-1/workloads",
+        json={"data": [{"id": "deployment:ns:web", "name": "web", "namespaceId": "ns",
+                        "containers": [{"name": "web", "image": "acme/web:1"}]}]},
+    )
+    manifest = tmp_path / "release.json"
+    manifest.write_text(json.dumps(
+        [{"cluster": "local", "project": "default", "workload": "ns:web", "image": "acme/web:2"}]
+    ))
+    runner = CliRunner()
+    result = runner.invoke(cli, ["-b", base, "-o", "ndjson", "apply", str(manifest), "--dry-run",
+                                 "--no-check-image"])
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.stdout) == {
+        "cluster": "local", "project": "default", "workload": "deployment:ns:web", "status": "planned",
+        "changes": ["web: image acme/web:1 -> acme/web:2"], "elapsed": None, "error": None,
+    }
+    assert "1 workloads: 1 planned" in result.stderr
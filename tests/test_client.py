@@ -1,7 +1,30 @@
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import pytest
+import websocket
+from requests.auth import HTTPBasicAuth
+from requests.exceptions import (
+    ConnectionError as RequestConnectionError,
+    InvalidURL,
+    SSLError,
+)
 
-from lazo.clients import RancherClient
-from lazo.objects import DockerImage, RancherWorkload
+from lazo.clients import DockerClient, ImageChecker, LinePrefixer, RancherClient
+from lazo.exceptions import (
+    CircuitOpen,
+    HttpError,
+    ObjectNotFound,
+    RolloutTimeout,
+    ServerConnectionError,
+    ServerSSLError,
+)
+from lazo.objects import DockerImage, RancherPod, RancherWorkload
+from lazo.retry import CircuitBreaker
+from lazo.trace import Tracer
 
 
 @pytest.fixture
@@ -161,3 +184,634 @@ def test_get_env(client, mocked_responses):
             }
         ]
     }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = json.dumps({"apiVersion": {"version": "v3"}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/v3"
+    server.shutdown()
+    server.server_close()
+
+
+def test_connection_reuse(local_server):
+    with RancherClient(base_url=local_server, debug=False) as client:
+        for __ in range(3):
+            assert client.ping()
+        assert client.connection_stats == {"opened": 1, "reused": 2, "requests": 3}
+
+
+def test_no_keep_alive(local_server):
+    with RancherClient(base_url=local_server, debug=False, keep_alive=False) as client:
+        client.ping()
+        client.ping()
+        assert client.connection_stats["opened"] == 2
+
+
+def test_history(mocked_responses):
+    client = RancherClient(base_url="https://rancher/v3", debug=False, history_size=2)
+    mocked_responses.add(
+        mocked_responses.GET,
+        "https://rancher/v3/clusters",
+        json={"data": [{"name": "local", "id": "local"}]},
+    )
+    mocked_responses.add(mocked_responses.GET, "https://rancher/v3/settings", status=403)
+    for __ in range(3):
+        client.list_clusters()
+    client.get("/settings", ignore_error=True)
+
+    assert len(client.history) == 2
+    last = client.history[-1]
+    assert (last.method, last.url, last.status) == (
+        "get",
+        "https://rancher/v3/settings",
+        403,
+    )
+    assert client.history[0].response_size == 44
+    assert client.history[0].body is None
+    stats = client.history.stats
+    assert stats["requests"] == 4
+    assert stats["errors"] == 1
+    assert stats["bytes_received"] == 44 * 3
+
+
+def test_hooks(local_server):
+    events = []
+    with RancherClient(base_url=local_server, debug=False) as client:
+        client.add_hook("before_request", lambda info: events.append(("before", info)))
+        client.add_hook("after_response", lambda info, r: events.append(("after", info)))
+        client.add_hook("error", lambda info, exc: events.append(("error", info)))
+        client.ping()
+        client.ping()
+    assert [e for e, __ in events] == ["before", "after", "before", "after"]
+    first, second = events[1][1], events[3][1]
+    assert first["status"] == 200
+    assert first["bytes_received"] == 33
+    assert first["timing"]["connect"] > 0
+    assert second["timing"]["connect"] == 0  # reused connection
+    assert set(first["timing"]) == {"connect", "tls", "wait", "transfer", "total"}
+
+
+def test_trace(mocked_responses):
+    client = RancherClient(base_url="https://rancher/v3", debug=False)
+    mocked_responses.add(
+        mocked_responses.GET,
+        "https://rancher/v3/project/c-1:p-1/workloads/deployment:ns:w1",
+        json={"id": "deployment:ns:w1"},
+    )
+    mocked_responses.add(
+        mocked_responses.GET, "https://rancher/v3/settings", body=RequestConnectionError()
+    )
+    stream = io.StringIO()
+    tracer = Tracer(stream).install(client)
+    client.get("/project/c-1:p-1/workloads/deployment:ns:w1")
+    with pytest.raises(Exception):
+        client.get("/settings")
+
+    ok, failed = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert ok["endpoint"] == "/v3/project/{id}/workloads/{id}"
+    assert ok["status"] == 200
+    assert failed["status"] is None
+    assert "error" in failed
+    assert sorted(row[:3] for row in tracer.summary()) == [
+        ("GET", "/v3/project/{id}/workloads/{id}", 1),
+        ("GET", "/v3/settings", 1),
+    ]
+
+
+def test_retry(mocked_responses):
+    client = RancherClient(base_url="https://rancher/v3", debug=False)
+    url = "https://rancher/v3/clusters"
+    mocked_responses.add(mocked_responses.GET, url, status=502)
+    mocked_responses.add(
+        mocked_responses.GET, url, status=429, headers={"Retry-After": "1"}
+    )
+    mocked_responses.add(mocked_responses.GET, url, json={"data": []})
+    traces = []
+    client.add_hook("after_response", lambda info, r: traces.append(info))
+    assert client.get("/clusters") == {"data": []}
+    assert [r.status for r in client.history] == [502, 429, 200]
+    assert traces[0]["retries"] == 2
+
+
+def test_retry_not_idempotent(mocked_responses):
+    client = RancherClient(base_url="https://rancher/v3", debug=False)
+    mocked_responses.add(mocked_responses.POST, "https://rancher/v3/action", status=503)
+    with pytest.raises(HttpError):
+        client.post("/action")
+    assert len(client.history) == 1
+
+
+def test_circuit_breaker(mocked_responses):
+    client = RancherClient(
+        base_url="https://rancher/v3",
+        debug=False,
+        retries=1,
+        circuit_breaker=CircuitBreaker(threshold=4),
+    )
+    mocked_responses.add(
+        mocked_responses.GET, "https://rancher/v3/clusters", body=RequestConnectionError()
+    )
+    for __ in range(2):
+        with pytest.raises(ServerConnectionError):
+            client.get("/clusters")
+    with pytest.raises(CircuitOpen):
+        client.get("/clusters")
+    assert len(client.history) == 4
+
+
+def test_no_retry_on_invalid_request(mocked_responses):
+    breaker = CircuitBreaker(threshold=1)
+    client = RancherClient(
+        base_url="https://rancher/v3", debug=False, retries=2, circuit_breaker=breaker
+    )
+    mocked_responses.add(mocked_responses.GET, "https://rancher/v3/a", body=InvalidURL())
+    with pytest.raises(ServerConnectionError):
+        client.get("/a")
+    assert len(client.history) == 1
+    assert breaker.state == "closed"
+
+
+def test_circuit_breaker_ssl_error(mocked_responses):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+    breaker.failure()  # half-open: the next request is the trial
+    client = RancherClient(
+        base_url="https://rancher/v3", debug=False, retries=0, circuit_breaker=breaker
+    )
+    mocked_responses.add(mocked_responses.GET, "https://rancher/v3/a", body=SSLError())
+    mocked_responses.add(mocked_responses.GET, "https://rancher/v3/a", json={})
+    with pytest.raises(ServerSSLError):
+        client.get("/a")
+    assert client.get("/a") == {}  # a new trial is allowed
+    assert breaker.state == "closed"
+
+
+def test_circuit_open_trace(mocked_responses):
+    client = RancherClient(
+        base_url="https://rancher/v3",
+        debug=False,
+        retries=0,
+        circuit_breaker=CircuitBreaker(threshold=1),
+    )
+    tracer = Tracer(io.StringIO()).install(client)
+    mocked_responses.add(mocked_responses.GET, "https://rancher/v3/clusters", status=503)
+    with pytest.raises(HttpError):
+        client.get("/clusters")
+    with pytest.raises(CircuitOpen):
+        client.get("/clusters")
+    lines = [json.loads(line) for line in tracer.stream.getvalue().splitlines()]
+    assert [line["status"] for line in lines] == [503, None]
+    assert lines[1]["timing"] == {"total": 0.0}
+    assert "error" in lines[1]
+
+
+def test_insecure_with_ca_bundle(mocked_responses, monkeypatch, tmp_path):
+    monkeypatch.setenv("REQUESTS_CA_BUNDLE", str(tmp_path / "ca.pem"))
+    client = RancherClient(base_url="https://rancher/v3", verify=False, debug=False)
+    mocked_responses.add(mocked_responses.GET, "https://rancher/v3/clusters", json={})
+    client.get("/clusters")
+    assert mocked_responses.calls[0].request.req_kwargs["verify"] is False
+
+
+def test_conditional_get(mocked_responses):
+    client = RancherClient(base_url="https://rancher/v3", debug=False)
+    url = "https://rancher/v3/project/c-1:p-1/workloads/deployment:ns:w1"
+    mocked_responses.add(
+        mocked_responses.GET, url, json={"id": "w1"}, headers={"ETag": '"v1"'}
+    )
+    mocked_responses.add(mocked_responses.GET, url, status=304)
+    mocked_responses.add(
+        mocked_responses.PUT, url.replace("/project/", "/projects/"), json={}
+    )
+    mocked_responses.add(mocked_responses.GET, url, json={"id": "w1"})
+
+    assert client.get("/project/c-1:p-1/workloads/deployment:ns:w1") == {"id": "w1"}
+    assert client.get("/project/c-1:p-1/workloads/deployment:ns:w1") == {"id": "w1"}
+    client.put("/projects/c-1:p-1/workloads/deployment:ns:w1", data={})
+    client.get("/project/c-1:p-1/workloads/deployment:ns:w1")
+
+    headers = [c.request.headers for c in mocked_responses.calls]
+    assert "If-None-Match" not in headers[0]
+    assert headers[1]["If-None-Match"] == '"v1"'
+    assert "If-None-Match" not in headers[3]
+
+
+def test_conditional_get_params(mocked_responses):
+    client = RancherClient(base_url="https://rancher/v3", debug=False)
+    url = "https://rancher/v3/projects/c-1:p-1/pods"
+    for name in ["a", "b"]:
+        mocked_responses.add(
+            mocked_responses.GET,
+            f"{url}?workloadId={name}",
+            json={"data": [{"id": f"x:{name}"}]},
+            headers={"Last-Modified": "Mon, 02 Jan 2023 10:00:00 GMT"},
+        )
+
+    for name in ["a", "b"]:
+        ret = client.get("/projects/c-1:p-1/pods", params={"workloadId": name})
+        assert ret == {"data": [{"id": f"x:{name}"}]}
+    headers = [c.request.headers for c in mocked_responses.calls]
+    assert "If-Modified-Since" not in headers[1]
+    assert len(client.http_cache) == 2
+
+
+def test_get_workload_id_by_name(client: RancherClient, mocked_responses):
+    mocked_responses.add(
+        mocked_responses.GET,
+        "https://rancher/v3/projects/c-1:p-2/workloads?name=web&namespaceId=ns",
+        json={"data": [{"name": "web", "id": "deployment:ns:web"}]},
+    )
+    client.cluster = "c-1"
+    client.project = "p-1"
+    assert client._get_workload_id_by_name("p-2", ["ns", "web"]) == [
+        "deployment",
+        "ns",
+        "web",
+    ]
+
+
+PODS_URL = (
+    "https://rancher/v3/projects/c-1:p-1/pods"
+    "?workloadId=deployment%3Ans%3Aweb&state=running&limit=10&sort=name"
+)
+
+
+def _pod(index, restarts, state="running"):
+    return {
+        "id": f"ns:web-{index}",
+        "workloadId": "deployment:ns:web",
+        "state": "running",
+        "containers": [{"name": "web", "restartCount": restarts, "state": state}],
+    }
+
+
+@pytest.mark.parametrize(
+    "select, ordinal, expected",
+    [("ready", None, "web-1"), ("least-restarted", None, "web-2"), ("ready", 0, "web-0")],
+)
+def test_get_pod(client: RancherClient, mocked_responses, select, ordinal, expected):
+    pods = [_pod(0, 1, state="waiting"), _pod(1, 5), _pod(2, 0)]
+    mocked_responses.add(mocked_responses.GET, PODS_URL, json={"data": pods})
+    client.cluster, client.project = "c-1", "p-1"
+    pod = client.get_pod(RancherWorkload("ns:web"), select, ordinal)
+    assert pod.name == expected
+    assert pod.workload.id == "deployment:ns:web"
+
+
+def test_get_pod_not_found(client: RancherClient, mocked_responses):
+    mocked_responses.add(mocked_responses.GET, PODS_URL, json={"data": []})
+    client.cluster, client.project = "c-1", "p-1"
+    with pytest.raises(ObjectNotFound):
+        client.get_pod(RancherWorkload("ns:web"))
+
+
+class FakeWebSocket:
+    connected = True
+
+    def __init__(self, frames):
+        self.frames = list(frames)
+
+    def recv_data(self):
+        if self.frames:
+            return websocket.ABNF.OPCODE_BINARY, self.frames.pop(0)
+        return websocket.ABNF.OPCODE_CLOSE, b""
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize(
+    "status, exit_code",
+    [
+        (b'{"metadata":{},"status":"Success"}', 0),
+        (
+            b'{"status":"Failure","reason":"NonZeroExitCode",'
+            b'"details":{"causes":[{"reason":"ExitCode","message":"3"}]}}',
+            3,
+        ),
+        (b"", 0),
+    ],
+)
+def test_ws_streaming(client: RancherClient, monkeypatch, status, exit_code):
+    frames = [b"\x01", b"\x01hello \xc3", b"\x02oops", b"\x01\xa8!", b"\x03" + status]
+    monkeypatch.setattr(
+        websocket, "create_connection", lambda *a, **kw: FakeWebSocket(frames)
+    )
+    client.auth = HTTPBasicAuth("key", "secret")
+    stdout, stderr = io.BytesIO(), io.BytesIO()
+    assert client.ws("/exec", stdout=stdout, stderr=stderr) == exit_code
+    assert stdout.getvalue() == "hello è!".encode()
+    assert stderr.getvalue() == b"oops"
+
+
+def test_line_prefixer():
+    target = io.BytesIO()
+    lock = threading.Lock()
+    a = LinePrefixer("[a] ", target, lock)
+    b = LinePrefixer("[b] ", target, lock)
+    a.write(b"one\ntw")
+    b.write(b"three\n")
+    a.write(memoryview(b"o\nfour"))
+    a.close()
+    assert target.getvalue() == b"[a] one\n[b] three\n[a] two\n[a] four\n"
+
+
+def test_exec(client: RancherClient, monkeypatch):
+    urls = []
+
+    def create_connection(url, **kwargs):
+        urls.append(url)
+        return FakeWebSocket([b"\x01done\n", b'\x03{"status":"Success"}'])
+
+    monkeypatch.setattr(websocket, "create_connection", create_connection)
+    client.auth = HTTPBasicAuth("key", "secret")
+    client.cluster = "c-1"
+    pod = RancherPod({"id": "ns:web-1", "workloadId": "deployment:ns:web"})
+    stdout = io.BytesIO()
+    assert client.exec(pod, ["ls", "-l"], stdout=stdout) == 0
+    assert stdout.getvalue() == b"done\n"
+    assert urls == [
+        "wss://rancher:443/k8s/clusters/c-1/api/v1/namespaces/ns/pods/web-1/exec"
+        "?container=web&stdout=1&stderr=1&command=ls&command=-l"
+    ]
+
+
+def test_iter_workloads_pagination(client: RancherClient, mocked_responses):
+    url = "https://rancher/v3/projects/cluster:project/workloads"
+    mocked_responses.add(
+        mocked_responses.GET,
+        f"{url}?limit=2&sort=name&namespaceId=ns",
+        match_querystring=True,
+        json={
+            "data": [{"name": "w1", "id": "deployment:ns:w1"}, {"name": "w2", "id": "deployment:ns:w2"}],
+            "pagination": {"next": f"{url}?limit=2&marker=m2&sort=name&namespaceId=ns"},
+        },
+    )
+    mocked_responses.add(
+        mocked_responses.GET,
+        f"{url}?limit=2&marker=m2&sort=name&namespaceId=ns",
+        match_querystring=True,
+        json={
+            "data": [{"name": "w3", "id": "deployment:ns:w3"}],
+            "pagination": {"next": None},
+        },
+    )
+    workloads = client.iter_workloads(page_size=2, sort="name", namespaceId="ns")
+    first = next(workloads)
+    assert (first.name, first.id) == ("w1", "deployment:ns:w1")
+    assert len(mocked_responses.calls) == 1
+    assert [w.name for w in workloads] == ["w2", "w3"]
+
+
+def test_iter_workloads_limit(client: RancherClient, mocked_responses):
+    mocked_responses.add(
+        mocked_responses.GET,
+        "https://rancher/v3/projects/cluster:project/workloads?limit=1",
+        match_querystring=True,
+        json={
+            "data": [{"name": "w1", "id": "deployment:ns:w1"}],
+            "pagination": {"next": "https://rancher/v3/projects/cluster:project/workloads?marker=x"},
+        },
+    )
+    assert list(client.iter_workloads(limit=1)) == [("w1", "deployment:ns:w1")]
+
+
+def test_upgrade_sets_image_without_env(client: RancherClient, mocked_responses):
+    url = "https://rancher/v3/project/cluster:project/workloads/deployment:namespace:workload"
+    mocked_responses.add(mocked_responses.GET, url, json={"containers": [{"image": "aaa"}]})
+    mocked_responses.add(mocked_responses.PUT, url, json={"containers": [{"image": "t/image:1"}]})
+    ret = client.upgrade(RancherWorkload("namespace:workload"), DockerImage("t/image:1"))
+    assert json.loads(mocked_responses.calls[1].request.body)["containers"][0]["image"] == "t/image:1"
+    assert ret == {"containers": [{"image": "t/image:1"}]}
+
+
+def test_upgrade_current_skips_get(client: RancherClient, mocked_responses):
+    url = "https://rancher/v3/project/cluster:project/workloads/deployment:namespace:workload"
+    mocked_responses.add(mocked_responses.PUT, url, json={"containers": [{"image": "t/image:1"}]})
+    client.upgrade(
+        RancherWorkload("namespace:workload"),
+        DockerImage("t/image:1"),
+        current={"containers": [{"image": "aaa"}]},
+    )
+    assert [c.request.method for c in mocked_responses.calls] == ["PUT"]
+
+
+def test_upgrade_current_conflict(client: RancherClient, mocked_responses):
+    url = "https://rancher/v3/project/cluster:project/workloads/deployment:namespace:workload"
+    mocked_responses.add(mocked_responses.PUT, url, status=409, json={"code": "Conflict"})
+    mocked_responses.add(mocked_responses.GET, url, json={"containers": [{"image": "bbb"}]})
+    mocked_responses.add(mocked_responses.PUT, url, json={"containers": [{"image": "t/image:1"}]})
+    ret = client.upgrade(
+        RancherWorkload("namespace:workload"),
+        DockerImage("t/image:1"),
+        current={"containers": [{"image": "aaa"}]},
+    )
+    assert [c.request.method for c in mocked_responses.calls] == ["PUT", "GET", "PUT"]
+    assert ret["containers"][0]["image"] == "t/image:1"
+
+
+def _deployment(generation, observed, updated, available):
+    return {
+        "kind": "Deployment",
+        "metadata": {"name": "workload", "generation": generation},
+        "spec": {"replicas": 2},
+        "status": {
+            "observedGeneration": observed,
+            "replicas": 2,
+            "updatedReplicas": updated,
+            "availableReplicas": available,
+        },
+    }
+
+
+def test_wait_rollout_watch(client: RancherClient, mocked_responses):
+    events = [
+        {"type": "ADDED", "object": _deployment(2, 1, 2, 2)},
+        {"type": "MODIFIED", "object": _deployment(2, 2, 1, 2)},
+        {"type": "MODIFIED", "object": _deployment(2, 2, 2, 2)},
+    ]
+    mocked_responses.add(
+        mocked_responses.GET,
+        "https://rancher:443/k8s/clusters/cluster/apis/apps/v1/namespaces/namespace/deployments",
+        body="\n".join(json.dumps(e) for e in events),
+    )
+    assert client.wait_rollout(RancherWorkload("namespace:workload"), timeout=5) >= 0
+    assert mocked_responses.calls[0].request.params["fieldSelector"] == "metadata.name=workload"
+
+
+def test_wait_rollout_watch_error(client: RancherClient, mocked_responses):
+    status = {"kind": "Status", "status": "Failure", "reason": "Expired", "code": 410}
+    mocked_responses.add(
+        mocked_responses.GET,
+        "https://rancher:443/k8s/clusters/cluster/apis/apps/v1/namespaces/namespace/deployments",
+        body=json.dumps({"type": "ERROR", "object": status}),
+    )
+    url = "https://rancher/v3/projects/cluster:project/workloads/deployment:namespace:workload"
+    mocked_responses.add(mocked_responses.GET, url, json={"state": "active"})
+    assert client.wait_rollout(RancherWorkload("namespace:workload"), timeout=5) >= 0
+    assert len(mocked_responses.calls) == 2
+
+
+def test_wait_rollout_polling(client: RancherClient, mocked_responses, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("lazo.clients.time.sleep", sleeps.append)
+    mocked_responses.add(
+        mocked_responses.GET,
+        "https://rancher:443/k8s/clusters/cluster/apis/apps/v1/namespaces/namespace/deployments",
+        status=403,
+    )
+    url = "https://rancher/v3/projects/cluster:project/workloads/deployment:namespace:workload"
+    for state in ["updating", "updating", "updating", "active"]:
+        mocked_responses.add(mocked_responses.GET, url, json={"state": state})
+    client.wait_rollout(RancherWorkload("namespace:workload"), timeout=60)
+    assert sleeps == [0.5, 1, 2]
+
+
+def test_wait_rollout_timeout(client: RancherClient, mocked_responses, monkeypatch):
+    monkeypatch.setattr("lazo.clients.time.sleep", lambda s: None)
+    url = "https://rancher/v3/projects/cluster:project/workloads/cronjob:namespace:workload"
+    mocked_responses.add(mocked_responses.GET, url, json={"state": "updating"})
+    with pytest.raises(RolloutTimeout):
+        client.wait_rollout(RancherWorkload("cronjob:namespace:workload"), timeout=0)
+
+
+def test_upgrade_no_changes_skips_put(client: RancherClient, mocked_responses):
+    url = "https://rancher/v3/project/cluster:project/workloads/deployment:namespace:workload"
+    doc = {"containers": [{"name": "c", "image": "t/image:1", "env": [{"name": "K", "value": "1"}]}]}
+    mocked_responses.add(mocked_responses.GET, url, json=doc)
+    ret = client.upgrade(RancherWorkload("namespace:workload"), DockerImage("t/image:1"), {"K": 1})
+    assert ret == doc
+    assert [c.request.method for c in mocked_responses.calls] == ["GET"]
+
+
+def test_diff(client: RancherClient):
+    doc = {
+        "containers": [
+            {"name": "c1", "image": "t/image:1", "env": [{"name": "A", "value": "1"}, {"name": "B", "value": "2"}]},
+            {"name": "c2", "image": "t/image:2"},
+        ]
+    }
+    updated, changes = client._diff(doc, DockerImage("t/image:2"), {"B": "3", "C": "4", "A": "1"})
+    assert [str(c) for c in changes] == [
+        "c1: image t/image:1 -> t/image:2",
+        "c1: env B: 2 -> 3",
+        "c1: env C: (unset) -> 4",
+        "c2: env B: (unset) -> 3",
+        "c2: env C: (unset) -> 4",
+        "c2: env A: (unset) -> 1",
+    ]
+    assert updated["containers"][0]["env"] == [
+        {"name": "A", "value": "1"},
+        {"name": "B", "value": "3"},
+        {"name": "C", "type": client.env_type, "value": "4"},
+    ]
+    # the current document is left untouched
+    assert doc["containers"][0]["image"] == "t/image:1"
+    assert doc["containers"][0]["env"][1] == {"name": "B", "value": "2"}
+    assert "env" not in doc["containers"][1]
+
+
+def test_iter_workloads_view(client: RancherClient, mocked_responses):
+    mocked_responses.add(
+        mocked_responses.GET,
+        "https://rancher/v3/projects/cluster:project/workloads",
+        json={"data": [{"name": "w1", "id": "deployment:ns:w1", "namespaceId": "ns",
+                        "containers": [{"image": "a/b:1"}]}]},
+    )
+    (view,) = client.iter_workloads(view=True)
+    assert (view.id, view.namespace, view.project_id) == ("deployment:ns:w1", "ns", "cluster:project")
+    assert view.images == ["a/b:1"]
+
+
+def test_iter_inventory_early_stop(client: RancherClient, monkeypatch):
+    crawled = []
+    projects = [{"id": f"c-1:p-{i}", "name": f"p{i}"} for i in range(20)]
+    monkeypatch.setattr(client, "iter_projects", lambda cluster_id, raw: iter(projects))
+
+    def iter_workloads(cluster_id, project_id, raw, view):
+        crawled.append(project_id)
+        if project_id == "p-0":
+            raise RuntimeError("boom")
+        time.sleep(0.05)
+        return iter([{"id": f"deployment:ns:{project_id}"}])
+
+    monkeypatch.setattr(client, "iter_workloads", iter_workloads)
+    inventory = client.iter_inventory([{"id": "c-1", "name": "local"}], workers=1)
+    __, project, workload, exc = next(inventory)
+    assert (project["id"], workload, str(exc)) == ("c-1:p-0", None, "boom")
+    inventory.close()
+    assert len(crawled) < 3
+
+
+def test_docker_client_exists(mocked_responses):
+    registry = "https://registry.example.com"
+    manifest = f"{registry}/v2/account/image/manifests/1.0"
+    mocked_responses.add(
+        mocked_responses.HEAD,
+        manifest,
+        status=401,
+        headers={"WWW-Authenticate": f'Bearer realm="{registry}/token",service="reg"'},
+    )
+    mocked_responses.add(
+        mocked_responses.GET, f"{registry}/token", json={"token": "t1", "expires_in": 300}
+    )
+    mocked_responses.add(mocked_responses.HEAD, manifest, status=200)
+    mocked_responses.add(mocked_responses.HEAD, f"{registry}/v2/account/image/manifests/2.0", status=404)
+    client = DockerClient(registry, auth=HTTPBasicAuth("user", "pass"))
+
+    assert client.exists(DockerImage("account/image:1.0"))
+    assert client.exists(DockerImage("account/image:1.0"))  # cached
+    assert not client.exists(DockerImage("account/image:2.0"))  # token reused
+    calls = [(c.request.method, c.request.headers.get("Authorization")) for c in mocked_responses.calls]
+    assert calls[0] == ("HEAD", None)
+    assert calls[1][0] == "GET" and calls[1][1].startswith("Basic ")
+    assert "scope=repository%3Aaccount%2Fimage%3Apull" in mocked_responses.calls[1].request.url
+    assert calls[2:] == [("HEAD", "Bearer t1"), ("HEAD", "Bearer t1")]
+
+
+def test_docker_client_get_tags(mocked_responses):
+    registry = "https://registry.example.com"
+    mocked_responses.add(
+        mocked_responses.GET,
+        f"{registry}/v2/account/image/tags/list?n=100",
+        json={"tags": ["1.0", "1.1", "latest"]},
+        headers={"Link": f'<{registry}/v2/account/image/tags/list?n=100&last=latest>; rel="next"'},
+    )
+    mocked_responses.add(
+        mocked_responses.GET,
+        f"{registry}/v2/account/image/tags/list?n=100&last=latest",
+        json={"tags": ["2.0"]},
+    )
+    client = DockerClient(registry)
+    assert list(client.get_tags(DockerImage("account/image"), r"^\d")) == ["1.0", "1.1", "2.0"]
+    assert list(client.get_tags(DockerImage("account/image"), max_pages=1)) == ["1.0", "1.1", "latest"]
+
+
+def test_image_checker(mocked_responses):
+    mocked_responses.add(
+        mocked_responses.HEAD, "https://registry-1.docker.io/v2/library/nginx/manifests/1.25", status=200
+    )
+    mocked_responses.add(mocked_responses.HEAD, "https://ghcr.io/v2/acme/web/manifests/2", status=404)
+    checker = ImageChecker()
+    images = [DockerImage("library/nginx:1.25"), DockerImage("ghcr.io/acme/web:2"), DockerImage("library/nginx:1.25")]
+    results = {image.id: (found, exc) for image, found, exc in checker.check(images)}
+    checker.close()
+    assert results == {"library/nginx:1.25": (True, None), "ghcr.io/acme/web:2": (False, None)}
+    assert len(mocked_responses.calls) == 2
@@ -0,0 +1,32 @@
+import pytest
+
+from lazo import codec
+
+
+@pytest.fixture(params=codec.available())
+def backend(request):
+    yield codec.use(request.param)
+    codec._codec = None
+
+
+def test_roundtrip(backend):
+    doc = {"id": "deployment:ns:web", "containers": [{"env": [{"name": "K", "value": "è"}]}]}
+    data = backend.dumps(doc)
+    assert isinstance(data, bytes)
+    assert b" " not in data
+    assert backend.loads(data) == doc
+    assert codec.loads(data) == doc
+    assert codec.loads(data.decode("utf8")) == doc
+
+
+def test_invalid(backend):
+    with pytest.raises(ValueError):
+        codec.loads(b'{"a": ')
+
+
+def test_default(monkeypatch):
+    monkeypatch.setattr(codec, "_codec", None)
+    assert codec.get_codec().name == codec.available()[0]
+    monkeypatch.setenv("LAZO_JSON", "json")
+    assert codec.use().name == "json"
+    assert codec.available()[-1] == "json"
@@ -0,0 +1,94 @@
+import pytest
+
+from lazo.exceptions import HttpError
+from lazo.index import Index
+
+CLUSTER = {"id": "c-1", "name": "local"}
+WEB = {"id": "p-1", "name": "web"}
+DB = {"id": "p-2", "name": "db"}
+
+
+def workload(name, image, env=(), namespace="ns"):
+    return {
+        "id": f"deployment:{namespace}:{name}",
+        "name": name,
+        "namespaceId": namespace,
+        "state": "active",
+        "containers": [{"image": image, "env": [{"name": n} for n in env]}],
+    }
+
+
+class FakeClient:
+    def __init__(self, inventory):
+        self.inventory = inventory
+
+    def iter_clusters(self, raw=False):
+        return [CLUSTER]
+
+    def iter_inventory(self, clusters, workers=4):
+        return iter(self.inventory)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = Index("https://rancher/v3", path=str(tmp_path / "index.sqlite3"))
+    index.refresh(
+        FakeClient(
+            [
+                (CLUSTER, WEB, workload("frontend", "nginx:1.25", ["PORT"]), None),
+                (CLUSTER, WEB, workload("api", "app:2.0", ["DATABASE_URL"]), None),
+                (CLUSTER, DB, workload("postgres", "postgres:15", namespace="db"), None),
+            ]
+        )
+    )
+    return index
+
+
+def test_search(index):
+    assert [r.name for r in index.search(name="*e*")] == ["postgres", "frontend"]
+    assert [r.name for r in index.search(image="nginx:*")] == ["frontend"]
+    assert [r.name for r in index.search(env="DATABASE_*")] == ["api"]
+    assert [r.name for r in index.search(namespace="ns", name="a*")] == ["api"]
+    record = index.search(name="api")[0]
+    assert record.as_dict() == {
+        "cluster": "local",
+        "project": "web",
+        "project_id": "p-1",
+        "id": "deployment:ns:api",
+        "name": "api",
+        "namespace": "ns",
+        "images": ["app:2.0"],
+    }
+    assert index.find_workload("p-1", "api", "ns") == "deployment:ns:api"
+    assert index.find_workload("p-2", "api") is None
+    assert Index("https://other/v3", path=index.path).search() == []
+
+
+def test_refresh_keeps_failed_projects(index):
+    assert not index.is_stale(60)
+    index.refresh(
+        FakeClient(
+            [
+                (CLUSTER, WEB, None, HttpError("url", None)),
+                # db project does not exist anymore
+            ]
+        )
+    )
+    assert [r.name for r in index.search()] == ["api", "frontend"]
+
+
+def test_find_names(index):
+    assert index.find_cluster("local") == "c-1"
+    assert index.find_cluster("prod") is None
+    assert index.find_project("c-1", "db") == "p-2"
+    assert index.find_project("c-2", "db") is None
+
+
+def test_fresh_index(index, tmp_path, monkeypatch):
+    from lazo.cli import _fresh_index
+
+    monkeypatch.setenv("LAZO_CACHE_DIR", str(tmp_path))
+    assert _fresh_index("https://rancher/v3", 60).path == index.path
+    assert _fresh_index("https://rancher/v3", 0) is None
+    monkeypatch.setenv("LAZO_CACHE_DIR", str(tmp_path / "empty"))
+    assert _fresh_index("https://rancher/v3", 60) is None
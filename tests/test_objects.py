@@ -1,6 +1,9 @@
+import json
+import tracemalloc
+
 import pytest
 
-from lazo.objects import RancherWorkload, RancherPod, DockerImage
+from lazo.objects import DockerImage, RancherPod, RancherWorkload, WorkloadView
 
 
 def test_rancherworkload():
@@ -61,3 +64,68 @@ def test_dockerimage_account():
 def test_dockerimage_error():
     with pytest.raises(Exception):
         DockerImage("bitcaster:1.0")
+
+
+def test_slots():
+    for obj in [RancherWorkload("ns:name"), DockerImage("a/b:1"),
+                RancherPod({"id": "ns:pod-1"})]:
+        assert not hasattr(obj, "__dict__")
+
+
+def test_rancherworkload_interned():
+    a, b = RancherWorkload("".join(["n", "s:a"])), RancherWorkload("ns:b")
+    assert a.namespace is b.namespace
+    assert a == RancherWorkload("deployment:ns:a")
+    assert len({a, b, RancherWorkload("ns:a")}) == 2
+
+
+def _workload_doc(i):
+    return {
+        "id": f"deployment:ns-{i % 10}:web-{i}",
+        "name": f"web-{i}",
+        "type": "deployment",
+        "namespaceId": f"ns-{i % 10}",
+        "state": "active",
+        "scale": 2,
+        "links": {k: f"https://rancher/v3/project/c-1:p-1/workloads/deployment:ns:web-{i}/{k}"
+                  for k in ["self", "remove", "update", "yaml", "revisions", "pods"]},
+        "publicEndpoints": [{"hostname": f"web-{i}.example.com", "port": 443}],
+        "containers": [{"name": "web", "image": "acme/web:1.0",
+                        "env": [{"name": f"VAR_{j}", "value": f"value-{j}"} for j in range(10)]}],
+    }
+
+
+def test_workload_view():
+    view = WorkloadView(_workload_doc(1), "c-1:p-1")
+    assert (view.id, view.name, view.namespace, view.state) == ("deployment:ns-1:web-1", "web-1", "ns-1", "active")
+    assert view.workload == RancherWorkload("ns-1:web-1")
+    assert view.images == ["acme/web:1.0"]
+    assert view.env["web"]["VAR_3"] == "value-3"
+    assert view.endpoints[0]["hostname"] == "web-1.example.com"
+    assert view.doc == _workload_doc(1)
+
+
+def test_workload_view_decodes(monkeypatch):
+    view = WorkloadView(_workload_doc(1))
+    decoded = []
+    monkeypatch.setattr("lazo.objects.loads", lambda raw: decoded.append(raw) or json.loads(raw))
+    assert view.images == ["acme/web:1.0"]
+    assert decoded == []
+    assert view.env["web"]["VAR_0"] == "value-0"
+    assert len(decoded) == 1
+
+
+def _allocated(factory, count=1000):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [factory(i) for i in range(count)]  # noqa: F841
+        return tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def test_workload_view_memory():
+    docs = _allocated(_workload_doc)
+    views = _allocated(lambda i: WorkloadView(_workload_doc(i)))
+    assert views < docs / 2
@@ -0,0 +1,57 @@
+import io
+
+import pytest
+
+from lazo.output import Output
+
+
+class TTY(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def render(fmt, items, many=True, stream=None, **kwargs):
+    stream = stream or io.StringIO()
+    with Output(fmt, stream=stream, many=many, **kwargs) as out:
+        for item in items:
+            out.write(item)
+    return stream.getvalue()
+
+
+ITEMS = [{"name": "web", "id": "deployment:ns:web"}, {"name": "db", "id": "p:1"}]
+
+
+def test_json():
+    assert render("json", ITEMS) == (
+        '[\n{"name":"web","id":"deployment:ns:web"},\n{"name":"db","id":"p:1"}\n]\n'
+    )
+    assert render("json", []) == "[]\n"
+    assert render("json", ITEMS[:1], many=False) == (
+        '{"name":"web","id":"deployment:ns:web"}\n'
+    )
+    pretty = render("json", ITEMS[:1], many=False, stream=TTY(), colors=False)
+    assert pretty == '{\n    "id": "deployment:ns:web",\n    "name": "web"\n}\n'
+
+
+def test_ndjson():
+    assert render("ndjson", ITEMS).splitlines() == [
+        '{"name":"web","id":"deployment:ns:web"}',
+        '{"name":"db","id":"p:1"}',
+    ]
+
+
+def test_yaml():
+    pytest.importorskip("yaml")
+    assert render("yaml", ITEMS) == (
+        "name: web\nid: deployment:ns:web\n---\nname: db\nid: p:1\n"
+    )
+
+
+def test_table():
+    assert render("table", ITEMS) == "NAME\tID\nweb\tdeployment:ns:web\ndb\tp:1\n"
+    assert render("table", ITEMS, stream=TTY()) == (
+        "NAME  ID\nweb   deployment:ns:web\ndb    p:1\n"
+    )
+    assert render("table", [{"a": 1, "b": [1]}], many=False) == (
+        "KEY\tVALUE\na\t1\nb\t[1]\n"
+    )
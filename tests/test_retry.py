@@ -0,0 +1,65 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+from lazo.retry import CircuitBreaker, RetryPolicy, decorrelated_jitter, retry_after
+
+
+class _Response:
+    def __init__(self, status_code=503, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+@pytest.fixture
+def no_retry_delay():
+    # these tests check the real delays
+    pass
+
+
+def test_decorrelated_jitter():
+    delays = decorrelated_jitter(base=0.5, cap=4)
+    values = [next(delays) for __ in range(100)]
+    assert all(0.5 <= v <= 4 for v in values)
+
+
+def test_retry_after():
+    assert retry_after(_Response()) is None
+    assert retry_after(_Response(headers={"Retry-After": "2"})) == 2
+    date = formatdate(time.time() + 30, usegmt=True)
+    assert 25 < retry_after(_Response(headers={"Retry-After": date})) <= 30
+    assert retry_after(_Response(headers={"Retry-After": "soon"})) is None
+
+
+def test_retry_policy():
+    policy = RetryPolicy(2, max_retry_after=5)
+    assert policy.should_retry("get", 1)
+    assert policy.should_retry("put", 2, _Response(502))
+    assert not policy.should_retry("get", 3)
+    assert not policy.should_retry("post", 1)
+    assert not policy.should_retry("get", 1, _Response(404))
+    assert policy.delay(policy.delays(), _Response(headers={"Retry-After": "60"})) == 5
+
+
+def test_circuit_breaker(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(threshold=2, reset_timeout=10)
+    breaker.failure()
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    now[0] = 11
+    assert breaker.allow()  # trial request
+    assert not breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+
+    now[0] = 22
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from lazo.clients import RancherClient
+from lazo.throttle import RateLimiter, TokenBucket
+
+
+class Gauge:
+    """Max number of concurrent `with` blocks."""
+
+    def __init__(self):
+        self.current = self.max = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.max = max(self.max, self.current)
+
+    def __exit__(self, *args):
+        with self._lock:
+            self.current -= 1
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert [bucket.reserve() for __ in range(2)] == [0, 0]
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+    assert TokenBucket(0).acquire() == 0
+
+
+def test_max_in_flight_threads():
+    limiter = RateLimiter(max_in_flight=2)
+    gauge = Gauge()
+
+    def request():
+        with limiter.limit("get"), gauge:
+            time.sleep(0.02)
+
+    threads = [threading.Thread(target=request) for __ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert gauge.max == 2
+    assert limiter.read.requests == 6
+    assert limiter.read.in_flight == 0
+    assert limiter.waited > 0
+
+
+def test_max_in_flight_asyncio():
+    limiter = RateLimiter(max_in_flight=2)
+    gauge = Gauge()
+
+    async def request():
+        async with limiter.limit_async("get"):
+            with gauge:
+                await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*[request() for __ in range(6)])
+
+    asyncio.run(main())
+    assert gauge.max == 2
+    assert limiter.read.in_flight == 0
+
+
+def test_cancelled_waiter():
+    limiter = RateLimiter(max_in_flight=1)
+
+    async def main():
+        async with limiter.limit_async("get"):
+            waiting = asyncio.ensure_future(limiter.read.acquire_async())
+            other = asyncio.ensure_future(limiter.read.acquire_async())
+            await asyncio.sleep(0)
+            waiting.cancel()
+        await asyncio.wait_for(other, 1)
+        limiter.read.release()
+
+    asyncio.run(main())
+    assert limiter.read.in_flight == 0
+    assert not limiter.read._waiters
+
+
+def test_separate_write_limits():
+    limiter = RateLimiter(rate=0, max_in_flight=1, write_max_in_flight=1)
+    with limiter.limit("get"):
+        # a write does not wait for the read in flight
+        with limiter.limit("put") as waited:
+            assert waited < 0.01
+    assert limiter.format_stats() == (
+        "rate limiter: 1 reads waited 0.00s, 1 writes waited 0.00s"
+    )
+    shared = RateLimiter(5)
+    assert shared.write is shared.read
+
+
+def test_client_rate_limit(mocked_responses):
+    mocked_responses.add(mocked_responses.GET, "https://rancher/v3/clusters", json={"data": []})
+    client = RancherClient("https://rancher/v3", debug=False, limiter=RateLimiter(rate=20))
+    throttled = []
+    client.add_hook("after_response", lambda info, response: throttled.append(info["throttled"]))
+    for __ in range(3):
+        client.get("/clusters")
+    assert throttled[0] == pytest.approx(0, abs=0.01)
+    assert sum(throttled) == pytest.approx(0.1, abs=0.03)
+    assert client.limiter.waited == pytest.approx(sum(throttled))